@@ -2,15 +2,29 @@ import os
 import json
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 import logging
-from generate_embeddings import EmbeddingGenerator
+from generate_embeddings import (
+    EmbeddingGenerator, SEARCH_MODES, PLACES_TIMEZONE, PLACE_NEIGHBORS_K
+)
+from search_cursor import InvalidCursor
+from metrics import stage, start_timings, server_timing_header, observe_request, render_metrics
+from logging_setup import configure_logging, configure_query_log, sample_diagnostics, diagnostics_logger
+from warmup import start_warmup
+from google_ids import import_google_ids as import_google_ids_from_file
+from suggest_index import SuggestService, MAX_SUGGESTIONS
+from http_cache import (
+    make_etag, etag_matches, compress_body,
+    SEARCH_CACHE_CONTROL, PLACE_CACHE_CONTROL, RECENT_QUERIES_CACHE_CONTROL, SUGGEST_CACHE_CONTROL
+)
 from datetime import datetime
 import traceback
+import time
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Configure logging; records are written by a background listener, not the request thread
+configure_logging()
 logger = logging.getLogger(__name__)
+query_logger = configure_query_log('corner_recent_queries.csv')
 
 app = Flask(__name__)
 
@@ -25,98 +39,262 @@ db_config = {
 # Initialize the embedding generator
 embedding_generator = EmbeddingGenerator(db_config)
 
+# Serve unfiltered searches from the shared memory-mapped snapshot if one has been exported
+if os.environ.get("USE_EMBEDDING_SNAPSHOT", "true").lower() == "true":
+    embedding_generator.enable_snapshot()
+
+# Data version used to derive ETags, so unchanged data can be answered with 304s
+# (shared with the generator, which keys its result cache on it)
+data_version = embedding_generator.data_version
+
+# Evict cached searches and swap snapshots as place changes are NOTIFYed, instead of waiting for TTLs
+if os.environ.get("LISTEN_FOR_CHANGES", "true").lower() == "true":
+    embedding_generator.start_change_listener()
+
+# Embed and rank the most popular logged queries in the background (WARMUP_QUERIES)
+start_warmup(embedding_generator)
+
+# In-memory typeahead index over place names, neighborhoods, vocabularies and logged queries
+suggest_service = SuggestService(db_config, data_version)
+
+# Most places returned by one /api/places request
+MAX_BATCH_PLACES = 50
+# Reviews included per place in place details
+PLACE_REVIEW_LIMIT = 5
+# Streaming formats accepted by /api/search?stream=
+STREAM_FORMATS = ('ndjson', 'sse')
+# Largest page /api/search will return; bigger limits are clamped
+MAX_SEARCH_LIMIT = 50
+# Longest prefix /api/suggest looks up
+MAX_SUGGEST_PREFIX = 100
+
+def not_modified(etag, cache_control):
+    """Return a 304 response if the client already holds this ETag, otherwise None"""
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = app.response_class(status=304)
+        return with_cache_headers(response, etag, cache_control)
+    return None
+
+def with_cache_headers(response, etag, cache_control):
+    """Attach validator and caching policy to a response"""
+    # Weak, because compression changes the bytes but not the content
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+@app.before_request
+def start_request_timing():
+    """Start collecting per-stage timings for this request and decide whether it logs diagnostics"""
+    g.request_start = time.perf_counter()
+    g.stage_timings = start_timings()
+    sample_diagnostics()
+
+@app.after_request
+def record_request_timing(response):
+    """Expose stage timings as Server-Timing and record request metrics"""
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    # Streamed responses only report the stages finished before the first byte
+    response.headers['Server-Timing'] = server_timing_header(g.get('stage_timings'), total=elapsed)
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_request(endpoint, request.method, response.status_code, elapsed)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Gzip/brotli-compress JSON and HTML responses above the size threshold"""
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.mimetype not in ('application/json', 'text/html')):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    encoding, body = compress_body(response.get_data(), request.headers.get('Accept-Encoding'))
+    if encoding:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
 @app.route('/')
 def index():
     """Render the main search page"""
     google_api_key = os.environ.get("GOOGLE_API_KEY", "")
     return render_template('index.html', google_api_key=google_api_key)
 
+def parse_search_args(args):
+    """
+    Validate /api/search query parameters.
+    
+    Returns:
+        Tuple of (search kwargs, error message); exactly one is None
+    """
+    query = args.get('q', '')
+    if not query:
+        return None, "Query parameter 'q' is required"
+    
+    try:
+        limit = int(args.get('limit', 10))
+    except ValueError:
+        return None, "Parameter 'limit' must be an integer"
+    if limit < 1:
+        return None, "Parameter 'limit' must be at least 1"
+    limit = min(limit, MAX_SEARCH_LIMIT)
+    
+    mode = args.get('mode', os.environ.get("SEARCH_MODE", "vector"))
+    if mode not in SEARCH_MODES:
+        return None, f"Parameter 'mode' must be one of: {', '.join(SEARCH_MODES)}"
+    
+    # Optional opening-hours filter: open_at=<ISO datetime, NYC local if naive> or open_now=true
+    open_at = None
+    if args.get('open_at'):
+        try:
+            open_at = datetime.fromisoformat(args.get('open_at'))
+        except ValueError:
+            return None, "Parameter 'open_at' must be an ISO 8601 datetime"
+    elif args.get('open_now', '').lower() in ('1', 'true', 'yes'):
+        open_at = datetime.now(PLACES_TIMEZONE)
+    
+    stream = args.get('stream') or None
+    if stream and stream not in STREAM_FORMATS:
+        return None, f"Parameter 'stream' must be one of: {', '.join(STREAM_FORMATS)}"
+    
+    # Opaque token from a previous page's next_cursor
+    cursor = args.get('cursor') or None
+    if cursor and stream:
+        return None, "Parameter 'cursor' can't be combined with 'stream'; only first pages are streamed"
+    
+    return {
+        "query": query, "limit": limit, "mode": mode, "open_at": open_at,
+        "stream": stream, "cursor": cursor
+    }, None
+
+def format_search_result(result):
+    """Convert a search result tuple (read from search_places, so tags and snippet are ready) to JSON"""
+    place_id, name, neighborhood, tags, price_range, snippet, similarity = result[:7]
+    
+    return {
+        "id": place_id,
+        "name": name,
+        "neighborhood": neighborhood,
+        "tags": tags,
+        "price_range": price_range,
+        "description": snippet,
+        # Convert to percentage; full-text matches ranked without an embedding have none
+        "similarity": round(similarity * 100, 2) if isinstance(similarity, (int, float)) else None
+    }
+
+def log_search_query(query):
+    """Append a search query to the recent queries log for future analysis"""
+    try:
+        # Queued; the listener thread appends it to corner_recent_queries.csv
+        timestamp = datetime.now().isoformat()
+        query_logger.info(f'"{query}",{timestamp}')
+    except Exception as e:
+        logger.warning(f"Failed to log search query: {e}")
+
+def stream_search(params):
+    """
+    Stream search events as NDJSON lines or server-sent events.
+    
+    The first event carries the ranked results; enrichment (google IDs,
+    adjacent-neighborhood backfill, match explanations) follows as it is ready.
+    """
+    def encode(event, data):
+        if params["stream"] == 'sse':
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps({"event": event, "data": data}) + "\n"
+    
+    def generate():
+        try:
+            events = embedding_generator.stream_search_places(
+                params["query"], limit=params["limit"], mode=params["mode"], open_at=params["open_at"]
+            )
+            for event, payload in events:
+                if event in ('results', 'backfill'):
+                    payload = [format_search_result(result) for result in payload if len(result) >= 7]
+                yield encode(event, payload)
+        except Exception as e:
+            logger.error(f"Error during streaming search: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            yield encode('error', {"error": "An error occurred during search"})
+        
+        log_search_query(params["query"])
+    
+    mimetype = 'text/event-stream' if params["stream"] == 'sse' else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop proxies such as nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/search', methods=['GET'])
 def search():
     """API endpoint for enhanced search functionality with optional similarity breakdown"""
-    query = request.args.get('q', '')
-    limit = int(request.args.get('limit', 10))
-    debug = True  # For debugging
+    params, error = parse_search_args(request.args)
+    if error:
+        return jsonify({"error": error}), 400
     
-    if not query:
-        return jsonify({"error": "Query parameter 'q' is required"}), 400
+    query = params["query"]
+    
+    if params["stream"]:
+        return stream_search(params)
+    
+    # Results only change with the data, the request and (for open-now filters) the quarter hour
+    open_slot = embedding_generator.search_hours_slot(params["query"], params["open_at"])
+    etag = make_etag(data_version.get(), 'search', request.query_string.decode(), open_slot)
+    cached = not_modified(etag, SEARCH_CACHE_CONTROL)
+    if cached:
+        if not params["cursor"]:
+            log_search_query(query)
+        return cached
     
     try:
-        # Get search results
-        results = embedding_generator.search_places_with_meaningful_breakdown(query, limit=limit)
+        # Get search results; later pages continue from the cursor without re-ranking from the top
+        results, next_cursor = embedding_generator.search_places_page(
+            query, limit=params["limit"], mode=params["mode"], open_at=params["open_at"],
+            cursor=params["cursor"]
+        )
         
         # Check what structure the results actually have (for debugging)
         if results and len(results) > 0:
-            logger.info(f"Result structure: {results[0]}")
+            # Lazy %s arguments: unsampled requests never format the row
+            diagnostics_logger.info("Result structure: %s", results[0])
         
         # Convert results to a more frontend-friendly format with defensive unpacking
-        formatted_results = []
-        for result in results:
-            # Defensive unpacking - make sure we have all the fields we need
-            if len(result) >= 7:  # We need at least 7 elements
-                place_id = result[0]
-                name = result[1]
-                neighborhood = result[2] if len(result) > 2 else None
-                tags = result[3] if len(result) > 3 else None
-                price_range = result[4] if len(result) > 4 else None
-                description = result[5] if len(result) > 5 else None
-                similarity = result[6] if len(result) > 6 else 0.0
-                
-                # Parse tags if they're in string format
-                if tags and isinstance(tags, str):
-                    if tags.startswith('{') and tags.endswith('}'):
-                        tags = tags.strip('{}').split(',')
-                        tags = [tag.strip('"\'') for tag in tags]
-                
-                # Get Google ID if available
-                google_id = get_place_google_id(place_id) if 'get_place_google_id' in globals() else None
-                
-                formatted_results.append({
-                    "id": place_id,
-                    "name": name,
-                    "neighborhood": neighborhood,
-                    "tags": tags,
-                    "price_range": price_range,
-                    "description": description[:200] + "..." if description and len(description) > 200 else description,
-                    "similarity": round(similarity * 100, 2) if isinstance(similarity, (int, float)) else 0  # Convert to percentage
-                })
-            else:
-                # Log issue with this result
-                logger.warning(f"Result has insufficient data: {result}")
+        with stage('format'):
+            formatted_results = []
+            for result in results:
+                # Defensive unpacking - make sure we have all the fields we need
+                if len(result) >= 7:  # We need at least 7 elements
+                    formatted_results.append(format_search_result(result))
+                else:
+                    # Log issue with this result
+                    logger.warning(f"Result has insufficient data: {result}")
+            
+            response = jsonify({"results": formatted_results, "next_cursor": next_cursor})
         
-        # Log the search query for future analysis
-        try:
-            with open('corner_recent_queries.csv', 'a') as f:
-                timestamp = datetime.now().isoformat()
-                f.write(f'"{query}",{timestamp}\n')
-        except Exception as e:
-            logger.warning(f"Failed to log search query: {e}")
+        # Log the search query for future analysis; later pages aren't new searches
+        if not params["cursor"]:
+            log_search_query(query)
         
-        return jsonify({"results": formatted_results})
+        return with_cache_headers(response, etag, SEARCH_CACHE_CONTROL)
     
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error during search: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")  # Add this for more detailed error info
         return jsonify({"error": "An error occurred during search", "details": str(e)}), 500
 
-def get_place_google_id(place_id):
-    """Get Google ID for a place from the database"""
-    try:
-        conn = psycopg2.connect(**db_config)
-        with conn.cursor() as cur:
-            cur.execute("SELECT google_id FROM places WHERE id = %s", (place_id,))
-            result = cur.fetchone()
-            return result[0] if result else None
-    except Exception as e:
-        logger.error(f"Error fetching Google ID: {str(e)}")
-        return None
-    finally:
-        if conn:
-            conn.close()
-
 @app.route('/api/place/<int:place_id>', methods=['GET'])
 def get_place(place_id):
     """Get detailed information about a place"""
+    # Answer repeat views from the client's cache without touching Postgres
+    etag = make_etag(data_version.get(), 'place', place_id)
+    cached = not_modified(etag, PLACE_CACHE_CONTROL)
+    if cached:
+        return cached
+    
+    conn = None
     try:
         conn = psycopg2.connect(**db_config)
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -139,13 +317,13 @@ def get_place(place_id):
                 SELECT source, review_text
                 FROM reviews
                 WHERE place_id = %s
-                LIMIT 5
-            """, (place_id,))
+                LIMIT %s
+            """, (place_id, PLACE_REVIEW_LIMIT))
             reviews = cur.fetchall()
             
             place['reviews'] = [dict(review) for review in reviews]
             
-            return jsonify(place)
+            return with_cache_headers(jsonify(place), etag, PLACE_CACHE_CONTROL)
     
     except Exception as e:
         logger.error(f"Error getting place details: {str(e)}")
@@ -154,6 +332,157 @@ def get_place(place_id):
         if conn:
             conn.close()
 
+@app.route('/api/place/<int:place_id>/similar', methods=['GET'])
+def get_similar_places(place_id):
+    """Places most similar to this one, read from the precomputed neighbour graph"""
+    try:
+        limit = min(int(request.args.get('limit', 10)), PLACE_NEIGHBORS_K)
+    except ValueError:
+        return jsonify({"error": "Parameter 'limit' must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "Parameter 'limit' must be at least 1"}), 400
+    
+    etag = make_etag(data_version.get(), 'similar', place_id, limit)
+    cached = not_modified(etag, PLACE_CACHE_CONTROL)
+    if cached:
+        return cached
+    
+    conn = None
+    try:
+        conn = psycopg2.connect(**db_config)
+        with conn.cursor() as cur:
+            # Primary-key range read; the neighbours were ranked at ingestion
+            cur.execute("""
+                SELECT p.id, p.name, p.neighborhood, p.tags, p.price_range,
+                       p.snippet, n.similarity
+                FROM place_neighbors n
+                JOIN search_places p ON p.id = n.neighbor_id
+                WHERE n.place_id = %s
+                ORDER BY n.rank
+                LIMIT %s
+            """, (place_id, limit))
+            rows = cur.fetchall()
+            
+            if not rows:
+                cur.execute("SELECT 1 FROM places WHERE id = %s", (place_id,))
+                if not cur.fetchone():
+                    return jsonify({"error": "Place not found"}), 404
+        
+        response = jsonify({"results": [format_search_result(row) for row in rows]})
+        return with_cache_headers(response, etag, PLACE_CACHE_CONTROL)
+    
+    except Exception as e:
+        logger.error(f"Error getting similar places: {str(e)}")
+        return jsonify({"error": "An error occurred", "details": str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+def parse_place_ids(raw_ids):
+    """
+    Validate the ids for a batch place-details request.
+    
+    Accepts a comma-separated string (GET) or a JSON list (POST).
+    
+    Returns:
+        Tuple of (unique ids in request order, error message); exactly one is None
+    """
+    if isinstance(raw_ids, str):
+        raw_ids = [part for part in raw_ids.split(',') if part.strip()]
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return None, "Parameter 'ids' must be a non-empty list of place ids"
+    
+    try:
+        place_ids = list(dict.fromkeys(int(place_id) for place_id in raw_ids))
+    except (TypeError, ValueError):
+        return None, "Parameter 'ids' must contain only integer place ids"
+    
+    if len(place_ids) > MAX_BATCH_PLACES:
+        return None, f"At most {MAX_BATCH_PLACES} places can be requested at once"
+    return place_ids, None
+
+@app.route('/api/places', methods=['GET', 'POST'])
+def get_places():
+    """Get details and top reviews for several places in one request"""
+    if request.method == 'POST':
+        raw_ids = (request.get_json(silent=True) or {}).get('ids')
+    else:
+        raw_ids = request.args.get('ids', '')
+    place_ids, error = parse_place_ids(raw_ids)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    # Same data-version validator as single place details; POSTs are not conditional
+    etag = make_etag(data_version.get(), 'places', *sorted(place_ids))
+    if request.method == 'GET':
+        cached = not_modified(etag, PLACE_CACHE_CONTROL)
+        if cached:
+            return cached
+    
+    conn = None
+    try:
+        conn = psycopg2.connect(**db_config)
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # One round trip: place rows with their reviews aggregated per place
+            cur.execute("""
+                SELECT 
+                    p.id, p.name, p.neighborhood, p.website, p.instagram_handle,
+                    p.price_range, p.combined_description, p.tags, p.address, p.hours,
+                    p.google_id,
+                    COALESCE(r.reviews, '[]'::json) AS reviews
+                FROM places p
+                LEFT JOIN LATERAL (
+                    SELECT json_agg(json_build_object(
+                        'source', top_reviews.source,
+                        'review_text', top_reviews.review_text
+                    )) AS reviews
+                    FROM (
+                        SELECT source, review_text
+                        FROM reviews
+                        WHERE place_id = p.id
+                        LIMIT %s
+                    ) top_reviews
+                ) r ON TRUE
+                WHERE p.id = ANY(%s)
+            """, (PLACE_REVIEW_LIMIT, place_ids))
+            places_by_id = {place['id']: place for place in cur.fetchall()}
+        
+        # Keep the caller's order; ids that don't exist are simply left out
+        places = [places_by_id[place_id] for place_id in place_ids if place_id in places_by_id]
+        return with_cache_headers(jsonify({"places": places}), etag, PLACE_CACHE_CONTROL)
+    
+    except Exception as e:
+        logger.error(f"Error getting batch place details: {str(e)}")
+        return jsonify({"error": "An error occurred", "details": str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: stage and request latency histograms, request and token counters"""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+@app.route('/api/suggest', methods=['GET'])
+def suggest():
+    """Typeahead completions for a search prefix, most popular first"""
+    prefix = request.args.get('prefix', '')[:MAX_SUGGEST_PREFIX]
+    try:
+        limit = int(request.args.get('limit', MAX_SUGGESTIONS))
+    except ValueError:
+        return jsonify({"error": "Parameter 'limit' must be an integer"}), 400
+    
+    try:
+        with stage('suggest'):
+            suggestions = suggest_service.lookup(prefix, limit)
+        response = jsonify({"prefix": prefix, "suggestions": suggestions})
+        response.headers['Cache-Control'] = SUGGEST_CACHE_CONTROL
+        return response
+    except Exception as e:
+        logger.error(f"Error getting suggestions: {str(e)}")
+        return jsonify({"prefix": prefix, "suggestions": []})
+
 @app.route('/api/recent_queries', methods=['GET'])
 def get_recent_queries():
     """Get recent popular search queries"""
@@ -166,7 +495,9 @@ def get_recent_queries():
         # Extract just the query part
         queries = [line.split(',')[0].strip('"') for line in lines]
         
-        return jsonify({"queries": queries})
+        response = jsonify({"queries": queries})
+        response.headers['Cache-Control'] = RECENT_QUERIES_CACHE_CONTROL
+        return response
     except Exception as e:
         logger.error(f"Error getting recent queries: {str(e)}")
         return jsonify({"queries": []})  # Return empty list on error
@@ -180,40 +511,12 @@ def import_google_ids():
         if password != os.environ.get("ADMIN_PASSWORD", "corner_admin"):
             return jsonify({"error": "Unauthorized"}), 401
         
-        # Read the places.csv file
-        import csv
-        google_ids = {}
-        with open('places.csv', 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                corner_place_id = row.get('corner_place_id')
-                google_id = row.get('google_id')
-                if corner_place_id and google_id:
-                    google_ids[corner_place_id] = google_id
-        
         # Connect to database and update Google IDs
         conn = psycopg2.connect(**db_config)
-        updated_count = 0
         try:
             with conn.cursor() as cur:
-                # Add google_id column if it doesn't exist
-                cur.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'places' AND column_name = 'google_id'
-                """)
-                if not cur.fetchone():
-                    cur.execute("ALTER TABLE places ADD COLUMN google_id TEXT")
-                
-                # Update places with their Google IDs
-                for corner_id, google_id in google_ids.items():
-                    cur.execute("""
-                        UPDATE places 
-                        SET google_id = %s
-                        WHERE corner_place_id = %s
-                    """, (google_id, corner_id))
-                    updated_count += cur.rowcount
-                
+                # COPY places.csv into a temp table and apply it with one UPDATE
+                result = import_google_ids_from_file(cur, 'places.csv')
                 conn.commit()
         except Exception as e:
             conn.rollback()
@@ -224,8 +527,11 @@ def import_google_ids():
         
         return jsonify({
             "success": True,
-            "message": f"Updated {updated_count} places with Google IDs",
-            "total_google_ids": len(google_ids)
+            "message": f"Updated {len(result['updated_ids'])} places with Google IDs",
+            "total_google_ids": result["rows"],
+            "inserted": result["inserted"],
+            "changed": result["changed"],
+            "unmatched": result["unmatched"]
         })
     
     except Exception as e:
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import traceback
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (
+    app as flask_app, db_config, embedding_generator, data_version,
+    parse_search_args, format_search_result, log_search_query
+)
+from async_search import AsyncSearchService
+from http_cache import make_etag, etag_matches, compress_body, SEARCH_CACHE_CONTROL
+from metrics import start_timings, server_timing_header, observe_request
+from logging_setup import sample_diagnostics
+
+logger = logging.getLogger(__name__)
+
+# Async search service; the pool is opened on ASGI lifespan startup
+search_service = AsyncSearchService(
+    embedding_generator,
+    db_config,
+    min_size=int(os.environ.get("DB_POOL_MIN", 2)),
+    max_size=int(os.environ.get("DB_POOL_MAX", 20))
+)
+
+# Every other route is still served by the Flask app
+wsgi_app = WsgiToAsgi(flask_app)
+
+def request_header(scope, name):
+    """Return a request header from an ASGI scope, or None"""
+    name = name.lower().encode()
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+async def send_json(send, payload, status=200, headers=None, accept_encoding=None):
+    """Send a JSON response over ASGI, compressed if the client accepts it"""
+    body = json.dumps(payload).encode()
+    response_headers = [(b"content-type", b"application/json")]
+    if status == 200:
+        encoding, body = compress_body(body, accept_encoding)
+        response_headers.append((b"vary", b"Accept-Encoding"))
+        if encoding:
+            response_headers.append((b"content-encoding", encoding.encode()))
+    response_headers.append((b"content-length", str(len(body)).encode()))
+    response_headers.extend(headers or [])
+    
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    await send({"type": "http.response.body", "body": body})
+
+def timed_send(send, endpoint, method):
+    """
+    Start stage timings for a request and wrap its ASGI send.
+    
+    The wrapper adds a Server-Timing header to the response and records the
+    request in the metrics when the response starts.
+    """
+    start = time.perf_counter()
+    timings = start_timings()
+    
+    async def send_with_timing(message):
+        if message["type"] == "http.response.start":
+            elapsed = time.perf_counter() - start
+            header = server_timing_header(timings, total=elapsed)
+            message = dict(message, headers=list(message.get("headers", [])) + [(b"server-timing", header.encode())])
+            observe_request(endpoint, method, message["status"], elapsed)
+        await send(message)
+    
+    return send_with_timing
+
+async def search(scope, receive, send):
+    """Async /api/search, same parameters and response as the Flask route"""
+    args = dict(parse_qsl(scope.get("query_string", b"").decode()))
+    params, error = parse_search_args(args)
+    
+    # Streaming responses and later result pages are produced (and timed) by the Flask route
+    if params and (params["stream"] or params["cursor"]):
+        await wsgi_app(scope, receive, send)
+        return
+    
+    send = timed_send(send, "/api/search", scope["method"])
+    sample_diagnostics()
+    if error:
+        await send_json(send, {"error": error}, status=400)
+        return
+    
+    # Same validators as the Flask route, so either entry point can answer with a 304
+    open_slot = embedding_generator.search_hours_slot(params["query"], params["open_at"])
+    version = await asyncio.to_thread(data_version.get)
+    etag = make_etag(version, 'search', scope.get("query_string", b"").decode(), open_slot)
+    cache_headers = [
+        (b"etag", f'W/"{etag}"'.encode()),
+        (b"cache-control", SEARCH_CACHE_CONTROL.encode())
+    ]
+    if etag_matches(request_header(scope, "if-none-match"), etag):
+        log_search_query(params["query"])
+        await send({"type": "http.response.start", "status": 304, "headers": cache_headers})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    
+    try:
+        results, next_cursor = await search_service.search_page(
+            params["query"], limit=params["limit"], mode=params["mode"], open_at=params["open_at"]
+        )
+        formatted_results = [format_search_result(result) for result in results if len(result) >= 7]
+        
+        # Log the search query for future analysis (only enqueued, so it doesn't block the event loop)
+        log_search_query(params["query"])
+        
+        await send_json(
+            send, {"results": formatted_results, "next_cursor": next_cursor},
+            headers=cache_headers,
+            accept_encoding=request_header(scope, "accept-encoding")
+        )
+    
+    except Exception as e:
+        logger.error(f"Error during async search: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        await send_json(send, {"error": "An error occurred during search", "details": str(e)}, status=500)
+
+async def lifespan(receive, send):
+    """Open and close the async connection pool with the server"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await search_service.open()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await search_service.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    """ASGI entry point: async search, everything else delegated to Flask"""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/api/search" and scope["method"] == "GET":
+        await search(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
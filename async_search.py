@@ -0,0 +1,178 @@
+import os
+import asyncio
+import logging
+import traceback
+
+from openai import AsyncOpenAI
+from psycopg_pool import AsyncConnectionPool
+
+from generate_embeddings import SEARCH_MODES, LEXICAL_FAST_PATH_MIN_RESULTS
+from metrics import stage, record_embedding_call
+from standin_embeddings import AsyncStandInEmbeddingClient
+
+logger = logging.getLogger(__name__)
+
+class AsyncSearchService:
+    """
+    Asynchronous search path for the ASGI entry point.
+    
+    Query parsing, filters and SQL come from EmbeddingGenerator so results
+    match the sync path; only the I/O differs. OpenAI calls go through the
+    async client and database work through a pooled async psycopg connection,
+    so one process can keep many searches in flight.
+    """
+    
+    def __init__(self, generator, db_config, min_size=2, max_size=20):
+        """Set up the async OpenAI client and the (not yet opened) connection pool"""
+        self.generator = generator
+        
+        if os.getenv("EMBEDDING_PROVIDER", "openai") == "standin":
+            self.client = AsyncStandInEmbeddingClient()
+        else:
+            openai_api_key = os.getenv("OPENAI_KEY")
+            if not openai_api_key:
+                raise ValueError("OPENAI_KEY environment variable not set")
+            
+            self.client = AsyncOpenAI(api_key=openai_api_key)
+        self.pool = AsyncConnectionPool(
+            conninfo="",
+            kwargs=dict(db_config),
+            min_size=min_size,
+            max_size=max_size,
+            open=False
+        )
+    
+    async def open(self):
+        """Open the connection pool; call once the event loop is running"""
+        await self.pool.open()
+        logger.info(f"Opened async connection pool (max {self.pool.max_size} connections)")
+    
+    async def close(self):
+        """Close the connection pool and the OpenAI client"""
+        await self.pool.close()
+        await self.client.close()
+    
+    async def generate_embedding(self, text):
+        """
+        Generate an embedding with the async OpenAI client.
+        
+        Shares the generator's query embedding cache, so the sync routes can
+        page through results this path started.
+        
+        Returns:
+            Tuple of (embedding, cache key)
+        """
+        key = self.generator.query_embedding_key(text)
+        embedding = self.generator.cached_query_embedding(key)
+        if embedding is None:
+            with stage('embed_expanded'):
+                try:
+                    response = await self.client.embeddings.create(
+                        input=text,
+                        model=self.generator.model
+                    )
+                except Exception:
+                    record_embedding_call(success=False)
+                    raise
+            self.generator.total_tokens += response.usage.total_tokens
+            record_embedding_call(response.usage.total_tokens)
+            embedding = response.data[0].embedding
+            self.generator.cache_query_embedding(key, embedding)
+        return embedding, key
+    
+    async def _fetch(self, query, params, stage_name='sql'):
+        """Run a query on a pooled connection and return all rows, timed as stage_name"""
+        with stage(stage_name):
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(query, params)
+                    return await cur.fetchall()
+    
+    async def search(self, query, limit=10, amenity_filter=True, mode='vector', open_at=None):
+        """
+        Async counterpart of EmbeddingGenerator.search_places_with_meaningful_breakdown.
+        
+        Returns:
+            List of (id, name, neighborhood, tags, price_range, description, similarity) tuples
+        """
+        results, _ = await self.search_page(query, limit, amenity_filter, mode, open_at)
+        return results
+    
+    async def search_page(self, query, limit=10, amenity_filter=True, mode='vector', open_at=None):
+        """
+        First page of an async search plus the cursor for the next one.
+        
+        In hybrid mode the full-text leg runs while the query embedding is being
+        generated, so places only it found have no similarity (None). The
+        per-result breakdown logging of the sync path is skipped.
+        Later pages are served by EmbeddingGenerator.search_places_page.
+        
+        Returns:
+            Tuple of (formatted results, next cursor or None)
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        
+        generator = self.generator
+        try:
+            # Location extraction may run spaCy, so keep it off the event loop
+            parsed_query = await asyncio.to_thread(generator.parse_query, query)
+            lexical_text = parsed_query['cleaned_query'] or query
+            where_clauses, filter_params, fingerprint, hours_slot = generator._search_filters(
+                query, parsed_query, mode, amenity_filter, open_at
+            )
+            
+            # Full-text only paths never pay for an embedding call
+            if mode == 'lexical' or (mode == 'hybrid' and generator.is_lexical_query(parsed_query)):
+                lexical_results = await self._fetch(*generator._lexical_places_query(
+                    lexical_text, limit,
+                    where_clauses=where_clauses,
+                    filter_params=filter_params,
+                    match_all=(mode == 'hybrid')
+                ), stage_name='lexical_sql')
+                if mode == 'lexical' or len(lexical_results) >= min(limit, LEXICAL_FAST_PATH_MIN_RESULTS):
+                    next_cursor = generator._page_cursor(
+                        fingerprint, lexical_results, limit, 'lexical', all=(mode == 'hybrid'), h=hours_slot
+                    )
+                    return generator._format_search_results(lexical_results), next_cursor
+            
+            if not generator.has_pgvector:
+                logger.warning("pgvector extension not available, cannot perform search")
+                return [], None
+            
+            expanded_query = generator.expand_query(parsed_query)
+            
+            lexical_results = []
+            if mode == 'hybrid':
+                # The full-text leg is independent of the embedding, so overlap it with the OpenAI call
+                (expanded_embedding, embedding_key), lexical_results = await asyncio.gather(
+                    self.generate_embedding(expanded_query),
+                    self._fetch(*generator._lexical_places_query(
+                        lexical_text, limit,
+                        where_clauses=where_clauses,
+                        filter_params=filter_params
+                    ), stage_name='lexical_sql')
+                )
+            else:
+                expanded_embedding, embedding_key = await self.generate_embedding(expanded_query)
+            
+            vector_results = await self._fetch(*generator._ranked_places_query(
+                expanded_embedding, limit,
+                neighborhood=parsed_query['location'],
+                where_clauses=where_clauses,
+                filter_params=filter_params
+            ), stage_name='vector_sql')
+            
+            top_results = vector_results
+            if mode == 'hybrid':
+                top_results = generator._fuse_ranked_results(vector_results, lexical_results, limit=limit)
+            
+            next_cursor = generator._page_cursor(
+                fingerprint, top_results, limit, 'vector', ranked=vector_results, key=embedding_key, h=hours_slot
+            )
+            return generator._format_search_results(top_results), next_cursor
+        
+        except Exception as e:
+            logger.error(f"Error in async search: {str(e)}")
+            logger.error(traceback.format_exc())
+            return [], None
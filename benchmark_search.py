@@ -0,0 +1,391 @@
+"""
+Search benchmark: replays corner_recent_queries.csv against a local database.
+
+Runs every query through EmbeddingGenerator.search_places_with_meaningful_breakdown
+and through the /api/search route (Flask test client), using the deterministic
+stand-in embedding provider so results are reproducible and free. Reports
+p50/p95/p99 latency, throughput and per-stage timings, and can store a
+baseline and compare later runs against it.
+
+Usage:
+    python benchmark_search.py --setup              # create and load the benchmark database
+    python benchmark_search.py                      # replay the query log, print a report
+    python benchmark_search.py --save-baseline      # also store the report as the baseline
+    python benchmark_search.py --compare            # exit 1 if slower than the baseline
+"""
+import os
+import csv
+import sys
+import math
+import json
+import time
+import argparse
+import logging
+import traceback
+from datetime import datetime
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import Json, execute_values
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+QUERY_LOG = os.path.join(ROOT, 'corner_recent_queries.csv')
+COMBINED_DATA = os.path.join(ROOT, 'combined_data.json')
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmark_baseline.json')
+
+# Latency metrics compared against the baseline, and how much slower counts as a regression
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+# Tables the app expects; the production schema predates this repo, so the benchmark creates its own
+SCHEMA_SQL = """
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS places (
+    id SERIAL PRIMARY KEY,
+    corner_place_id TEXT UNIQUE,
+    name TEXT NOT NULL,
+    neighborhood TEXT,
+    website TEXT,
+    instagram_handle TEXT,
+    tags TEXT[],
+    description TEXT,
+    combined_description TEXT,
+    price_range TEXT,
+    hours JSONB,
+    address TEXT,
+    google_id TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS reviews (
+    id SERIAL PRIMARY KEY,
+    place_id INTEGER REFERENCES places(id) ON DELETE CASCADE,
+    source TEXT,
+    review_text TEXT
+);
+
+CREATE TABLE IF NOT EXISTS embeddings (
+    id SERIAL PRIMARY KEY,
+    place_id INTEGER REFERENCES places(id) ON DELETE CASCADE,
+    embedding vector(1536),
+    content_type TEXT DEFAULT 'combined',
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+def configure_environment(args):
+    """Point the app modules at the benchmark database and stand-in embeddings (before importing them)"""
+    os.environ['DB_NAME'] = args.dbname
+    os.environ['EMBEDDING_PROVIDER'] = 'standin'
+    os.environ['STANDIN_EMBEDDING_LATENCY_MS'] = str(args.embedding_latency_ms)
+    os.environ['EMBEDDING_SNAPSHOT_DIR'] = args.snapshot_dir
+    os.environ['USE_EMBEDDING_SNAPSHOT'] = 'true' if args.snapshot else 'false'
+    os.environ['SEARCH_MODE'] = args.mode
+    os.environ['LOG_SAMPLE_RATE'] = str(args.log_sample_rate)
+    os.environ['EMBEDDING_COMPACT'] = args.compact or ''
+    os.environ['SNAPSHOT_COMPACT_SEARCH'] = 'true' if args.compact else 'false'
+    if args.semantic_threshold is not None:
+        os.environ['SEMANTIC_CACHE_THRESHOLD'] = str(args.semantic_threshold)
+
+def db_config(dbname):
+    return {
+        "dbname": dbname,
+        "user": os.environ.get("DB_USER", "namayjindal"),
+        "password": os.environ.get("DB_PASSWORD", ""),
+        "host": os.environ.get("DB_HOST", "localhost")
+    }
+
+def setup_database(args):
+    """Create the benchmark database and load combined_data.json with stand-in embeddings"""
+    conn = psycopg2.connect(**db_config("postgres"))
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (args.dbname,))
+        if not cur.fetchone():
+            cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(args.dbname)))
+            logger.info(f"Created database {args.dbname}")
+    conn.close()
+    
+    with open(COMBINED_DATA) as f:
+        places = json.load(f)
+    
+    conn = psycopg2.connect(**db_config(args.dbname))
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SCHEMA_SQL)
+            cur.execute("TRUNCATE places, reviews, embeddings RESTART IDENTITY CASCADE")
+            
+            place_ids = execute_values(cur, """
+                INSERT INTO places (
+                    corner_place_id, name, neighborhood, website, instagram_handle, tags,
+                    description, combined_description, price_range, hours, address, google_id
+                ) VALUES %s
+                RETURNING id
+            """, [
+                (
+                    str(place.get('corner_place_id')), place.get('name'), place.get('neighborhood'),
+                    place.get('website'), place.get('instagram_handle'), place.get('tags') or [],
+                    place.get('description'), place.get('combined_description'), place.get('price_range'),
+                    Json(place.get('hours')) if place.get('hours') else None,
+                    place.get('address'), place.get('google_id')
+                )
+                for place in places
+            ], fetch=True)
+            
+            execute_values(cur, "INSERT INTO reviews (place_id, source, review_text) VALUES %s", [
+                (place_id, 'google', review)
+                for (place_id,), place in zip(place_ids, places)
+                for review in place.get('reviews') or []
+                if review
+            ])
+        conn.commit()
+        logger.info(f"Loaded {len(places)} places into {args.dbname}")
+    finally:
+        conn.close()
+    
+    from generate_embeddings import EmbeddingGenerator
+    generator = EmbeddingGenerator(db_config(args.dbname))
+    
+    # Same derived columns and indexes as a production ingestion run
+    generator.add_missing_metadata_column()
+    generator.ensure_amenities_column()
+    generator.ensure_neighborhood_column()
+    generator.ensure_search_vector_column()
+    generator.ensure_attribute_columns()
+    generator.ensure_search_table()
+    generator.ensure_embedding_queue()
+    generator.extract_amenities_from_descriptions()
+    generator.extract_structured_attributes()
+    generator.ensure_neighbors_table()
+    
+    # process_all_places sleeps between OpenAI calls; the stand-in needs no rate limiting
+    new_places, _, place_reviews, claims = generator.fetch_places_needing_embeddings(limit=None)
+    for place in new_places:
+        content = generator.prepare_text_for_embedding(place, place_reviews)[0]
+        if content:
+            embedding, _ = generator.generate_embedding(content)
+            if embedding:
+                generator.store_embedding(place[0], embedding)
+    generator.complete_embedding_work(claims)
+    generator.export_embedding_snapshot()
+    generator.update_place_neighbors()
+    logger.info(f"Embedded {len(new_places)} places")
+
+def load_queries(limit=None):
+    """Queries from the recent query log, in log order"""
+    with open(QUERY_LOG, newline='') as f:
+        queries = [row['query'].strip() for row in csv.DictReader(f) if row.get('query', '').strip()]
+    return queries[:limit] if limit else queries
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(latencies, stage_timings, errors, elapsed):
+    """Latency percentiles, throughput and per-stage means for one target"""
+    stages = {}
+    for name in sorted({name for timings in stage_timings for name in timings}):
+        values = [timings.get(name, 0.0) * 1000 for timings in stage_timings]
+        stages[name] = {
+            "mean_ms": round(sum(values) / len(values), 2),
+            "p95_ms": round(percentile(values, 95), 2)
+        }
+    
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else None,
+        "p50_ms": round(percentile(latencies_ms, 50), 2) if latencies_ms else None,
+        "p95_ms": round(percentile(latencies_ms, 95), 2) if latencies_ms else None,
+        "p99_ms": round(percentile(latencies_ms, 99), 2) if latencies_ms else None,
+        "throughput_qps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "stages": stages
+    }
+
+def replay(queries, run_query, args, clear_cache):
+    """Run every query once (after warmup) and summarize latency and stage timings"""
+    from metrics import start_timings
+    
+    for query in queries[:args.warmup]:
+        run_query(query)
+    
+    latencies, stage_timings, errors = [], [], 0
+    started = time.perf_counter()
+    for query in queries:
+        if not args.warm_cache:
+            clear_cache()
+        timings = start_timings()
+        start = time.perf_counter()
+        try:
+            run_query(query)
+        except Exception as e:
+            errors += 1
+            logger.warning(f"Query '{query}' failed: {str(e)}")
+            logger.debug(traceback.format_exc())
+            continue
+        latencies.append(time.perf_counter() - start)
+        stage_timings.append(dict(timings))
+    
+    return summarize(latencies, stage_timings, errors, time.perf_counter() - started)
+
+def run_benchmark(args):
+    """Replay the query log through the generator and the Flask route"""
+    import app as app_module
+    from logging_setup import QUERY_LOGGER, sample_diagnostics
+    
+    generator = app_module.embedding_generator
+    queries = load_queries(args.queries)
+    logger.info(f"Replaying {len(queries)} queries (mode={args.mode})")
+    
+    # Sampled breakdown logging is part of the measured work, but its output is noise here
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "queries": len(queries),
+        "mode": args.mode,
+        "embedding_latency_ms": args.embedding_latency_ms,
+        "snapshot": args.snapshot,
+        "compact": args.compact,
+        "warm_cache": args.warm_cache,
+        "targets": {}
+    }
+    
+    if 'generator' in args.targets:
+        def search(query):
+            # The route samples diagnostics per request; do the same outside it
+            sample_diagnostics()
+            return generator.search_places_with_meaningful_breakdown(query, limit=args.limit, mode=args.mode)
+        report["targets"]["generator"] = replay(queries, search, args, generator.clear_search_caches)
+    
+    if 'route' in args.targets:
+        client = app_module.app.test_client()
+        
+        def request(query):
+            response = client.get('/api/search', query_string={"q": query, "limit": args.limit, "mode": args.mode})
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            return response.get_data()
+        
+        # The route appends to the query log; keep the replayed log untouched
+        query_logger = logging.getLogger(QUERY_LOGGER)
+        query_logger.disabled = True
+        try:
+            report["targets"]["route"] = replay(queries, request, args, generator.clear_search_caches)
+        finally:
+            query_logger.disabled = False
+    
+    # Near-duplicate hits across both targets; only meaningful with --warm-cache
+    report["semantic_cache"] = generator.semantic_cache.stats()
+    
+    logging.getLogger().setLevel(logging.INFO)
+    return report
+
+def print_report(report):
+    for target, summary in report["targets"].items():
+        print(f"\n{target}: {summary['count']} queries, {summary['errors']} errors, "
+              f"{summary['throughput_qps']} queries/s")
+        print(f"  latency ms  mean {summary['mean_ms']}  p50 {summary['p50_ms']}  "
+              f"p95 {summary['p95_ms']}  p99 {summary['p99_ms']}")
+        for name, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["mean_ms"]):
+            print(f"  {name:<18} mean {stage['mean_ms']:>9.2f} ms   p95 {stage['p95_ms']:>9.2f} ms")
+    
+    semantic = report.get("semantic_cache")
+    if semantic and semantic["lookups"]:
+        print(f"\nsemantic cache: {semantic['hits']}/{semantic['lookups']} hits ({semantic['hit_rate']:.1%}) "
+              f"at threshold {semantic['threshold']}")
+
+def compare_reports(report, baseline, threshold):
+    """
+    Print current vs. baseline latency and return the regressions.
+    
+    Returns:
+        List of (target, metric, baseline value, current value) exceeding the threshold
+    """
+    regressions = []
+    print(f"\nCompared with baseline from {baseline.get('created_at')} (threshold +{threshold:.0%}):")
+    for target, summary in report["targets"].items():
+        previous = baseline.get("targets", {}).get(target)
+        if not previous:
+            print(f"  {target}: not in baseline")
+            continue
+        for metric in COMPARED_METRICS:
+            before, after = previous.get(metric), summary.get(metric)
+            if not before or after is None:
+                continue
+            change = after / before - 1
+            flag = "REGRESSION" if change > threshold else ""
+            print(f"  {target:<10} {metric:<7} {before:>9.2f} -> {after:>9.2f} ms  {change:+.1%} {flag}")
+            if change > threshold:
+                regressions.append((target, metric, before, after))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the recent query log and report search latency")
+    parser.add_argument('--setup', action='store_true', help="Create and load the benchmark database, then exit")
+    parser.add_argument('--dbname', default=os.environ.get("BENCHMARK_DB_NAME", "corner_bench"))
+    parser.add_argument('--targets', nargs='+', choices=('generator', 'route'), default=['generator', 'route'])
+    parser.add_argument('--mode', choices=('vector', 'hybrid', 'lexical'), default='hybrid')
+    parser.add_argument('--queries', type=int, help="Only replay the first N queries of the log")
+    parser.add_argument('--limit', type=int, default=10, help="Results per search")
+    parser.add_argument('--warmup', type=int, default=10, help="Untimed queries before measuring")
+    parser.add_argument('--embedding-latency-ms', type=float, default=0,
+                        help="Simulated OpenAI round trip per embedding call")
+    parser.add_argument('--warm-cache', action='store_true',
+                        help="Keep the query embedding and result caches between queries (default: every query is cold)")
+    parser.add_argument('--semantic-threshold', type=float,
+                        help="Similarity threshold for the near-duplicate query cache (default SEMANTIC_CACHE_THRESHOLD)")
+    parser.add_argument('--snapshot', action='store_true', help="Rank unfiltered searches from the embedding snapshot")
+    parser.add_argument('--compact', choices=('int8', 'float16', 'pca'),
+                        help="Export (with --setup) and search compact snapshot vectors, re-ranking exactly")
+    parser.add_argument('--snapshot-dir', default=os.path.join(ROOT, 'snapshots-bench'))
+    parser.add_argument('--output', help="Write the JSON report here")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the baseline")
+    parser.add_argument('--compare', action='store_true', help="Compare with the baseline; exit 1 on regression")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="Allowed slowdown before a metric counts as a regression (0.10 = 10%%)")
+    parser.add_argument('--log-sample-rate', type=float, default=0.01,
+                        help="Share of searches that log the result breakdown (as LOG_SAMPLE_RATE in production)")
+    parser.add_argument('--verbose', action='store_true', help="Keep search logging on while measuring")
+    args = parser.parse_args()
+    
+    configure_environment(args)
+    
+    if args.setup:
+        setup_database(args)
+        return
+    
+    report = run_benchmark(args)
+    print_report(report)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            logger.error(f"No baseline at {args.baseline}; run with --save-baseline first")
+            sys.exit(2)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare_reports(report, baseline, args.threshold):
+            sys.exit(1)
+    
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved baseline to {args.baseline}")
+
+if __name__ == "__main__":
+    main()
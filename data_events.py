@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import select
+import logging
+import threading
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# Channel write paths notify with the ids of the places they changed
+PLACES_CHANNEL = "corner_places_changed"
+# NOTIFY payloads are limited to 8000 bytes; ids are split across messages
+NOTIFY_IDS_PER_MESSAGE = 500
+# Seconds the listener waits on the socket before checking whether it should stop
+LISTENER_POLL_SECONDS = 5
+# Seconds between reconnect attempts after losing the listening connection
+LISTENER_RECONNECT_SECONDS = 5
+# Notifications arriving this soon after the first one are handled as one batch
+LISTENER_COALESCE_SECONDS = 0.2
+
+def notify_places_changed(cur, kind, place_ids=()):
+    """
+    Announce changed places on the cursor's transaction.
+    
+    kind is 'embedding', 'amenities', 'google_id', 'place' (content loaded
+    from combined_data.json) or 'snapshot' (a new snapshot export, sent
+    without ids).
+    
+    Postgres delivers the notifications only when the transaction commits,
+    so listeners never hear about writes that were rolled back.
+    """
+    ids = sorted({int(place_id) for place_id in place_ids})
+    for start in range(0, max(len(ids), 1), NOTIFY_IDS_PER_MESSAGE):
+        payload = json.dumps({"kind": kind, "ids": ids[start:start + NOTIFY_IDS_PER_MESSAGE]})
+        cur.execute("SELECT pg_notify(%s, %s)", (PLACES_CHANNEL, payload))
+
+def parse_notifications(notifies):
+    """Group notification payloads into a dict of change kind -> set of place ids"""
+    changes = {}
+    for notify in notifies:
+        try:
+            payload = json.loads(notify.payload)
+            changes.setdefault(payload["kind"], set()).update(payload.get("ids", []))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed place change notification {notify.payload!r}: {str(e)}")
+    return changes
+
+class PlaceChangeListener:
+    """
+    Background thread that LISTENs for place changes and hands them to a callback.
+    
+    `generation` increases every time the listening connection is (re)established.
+    Changes made while it was down were never heard, so anything cached under
+    an older generation must not be trusted; on_resync is called at that point.
+    """
+    
+    def __init__(self, db_config, on_change, on_resync=None):
+        """
+        Args:
+            on_change: Called with a dict of change kind -> set of place ids
+            on_resync: Called after each (re)connect, before any change is delivered
+        """
+        self.db_config = db_config
+        self.on_change = on_change
+        self.on_resync = on_resync
+        self.generation = 0
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread = None
+        # The thread doesn't survive fork (gunicorn --preload); each worker listens on its own
+        os.register_at_fork(after_in_child=self._restart_in_child)
+    
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="place-change-listener", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _restart_in_child(self):
+        # The inherited connection belongs to the parent; a new one is opened by start()
+        if self._thread is not None and not self._stop.is_set():
+            self.connected = False
+            self.start()
+    
+    def _listen(self, conn):
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {PLACES_CHANNEL}")
+        self.generation += 1
+        self.connected = True
+        logger.info(f"Listening for place changes on {PLACES_CHANNEL} (generation {self.generation})")
+        if self.on_resync:
+            self.on_resync()
+        
+        while not self._stop.is_set():
+            if select.select([conn], [], [], LISTENER_POLL_SECONDS) == ([], [], []):
+                continue
+            # A batch job commits many small transactions; let the burst arrive first
+            time.sleep(LISTENER_COALESCE_SECONDS)
+            conn.poll()
+            changes = parse_notifications(conn.notifies)
+            conn.notifies.clear()
+            if not changes:
+                continue
+            try:
+                self.on_change(changes)
+            except Exception as e:
+                # A half-applied change leaves caches in an unknown state; start over
+                logger.error(f"Error applying place changes: {str(e)}")
+                self.generation += 1
+                if self.on_resync:
+                    self.on_resync()
+    
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.db_config)
+                conn.autocommit = True
+                self._listen(conn)
+            except Exception as e:
+                logger.warning(f"Place change listener disconnected: {str(e)}")
+            finally:
+                self.connected = False
+                if conn:
+                    conn.close()
+            self._stop.wait(LISTENER_RECONNECT_SECONDS)
@@ -0,0 +1,415 @@
+import os
+import json
+import time
+import shutil
+import logging
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Pointer file naming the active snapshot version inside the snapshot directory
+CURRENT_FILE = "CURRENT"
+# Older versions are kept so workers still mapping them can finish swapping
+KEEP_SNAPSHOT_VERSIONS = 2
+# Minimum seconds between checks of the CURRENT pointer
+SNAPSHOT_REFRESH_INTERVAL = 30
+
+# Compact copy of the vectors written next to the full matrix for first-pass search:
+# int8 (4x smaller), float16 (2x) or pca (1536 -> EMBEDDING_PCA_DIMENSIONS floats)
+COMPACT_FORMATS = ('int8', 'float16', 'pca')
+EMBEDDING_COMPACT = os.getenv("EMBEDDING_COMPACT", "")
+EMBEDDING_PCA_DIMENSIONS = int(os.getenv("EMBEDDING_PCA_DIMENSIONS", 256))
+# Serving workers use the compact copy when a snapshot has one, unless this is false
+SNAPSHOT_COMPACT_SEARCH = os.getenv("SNAPSHOT_COMPACT_SEARCH", "true").lower() == "true"
+# Rows used to fit the PCA projection
+PCA_FIT_SAMPLE = 10000
+# Candidates from the compact pass re-ranked exactly: limit * factor, at least the minimum
+RERANK_FACTOR = 10
+MIN_RERANK_CANDIDATES = 100
+# Compact rows are widened to float32 this many at a time, bounding per-query memory
+COMPACT_BLOCK_ROWS = 1024
+# Catalog rows used as queries when measuring compact-search recall at export
+RECALL_SAMPLE = 200
+RECALL_AT = 10
+# Similarity entries per block when computing nearest neighbours in bulk
+NEIGHBOR_BLOCK_ELEMENTS = 16 * 1024 * 1024
+
+def export_snapshot(conn, directory, model, batch_size=1000, compact=EMBEDDING_COMPACT):
+    """
+    Export all embeddings to a new versioned snapshot and make it current.
+    
+    A snapshot is a directory holding embeddings.npy (L2-normalized float32
+    matrix, one row per place), ids.npy (place ids in row order) and
+    meta.json. Rows are streamed from a server-side cursor straight into the
+    memory-mapped output, so the catalog is never held in memory twice.
+    
+    With compact set, a compact copy of the vectors (compact.npy and
+    compact_params.npy) is written too, and its recall against exact search
+    is measured and recorded in meta.json.
+    
+    Args:
+        conn: psycopg2 connection
+        directory: Snapshot root directory
+        model: Embedding model name recorded in the metadata
+        compact: One of COMPACT_FORMATS, or empty for full vectors only
+    
+    Returns:
+        The new version name
+    """
+    os.makedirs(directory, exist_ok=True)
+    version = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    tmp_dir = os.path.join(directory, f".tmp-{version}")
+    os.makedirs(tmp_dir)
+    
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT COUNT(*), MAX(last_updated), MAX(vector_dims(embedding))
+                FROM embeddings
+                WHERE content_type = 'combined'
+            """)
+            count, last_updated, dim = cur.fetchone()
+        
+        count, dim = count or 0, dim or 0
+        matrix = np.lib.format.open_memmap(
+            os.path.join(tmp_dir, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(count, dim)
+        )
+        ids = np.lib.format.open_memmap(
+            os.path.join(tmp_dir, "ids.npy"), mode="w+", dtype=np.int64, shape=(count,)
+        )
+        
+        # Named cursor streams rows in batches instead of fetching the whole table
+        with conn.cursor(name="embedding_snapshot") as cur:
+            cur.itersize = batch_size
+            cur.execute("""
+                SELECT place_id, embedding::real[]
+                FROM embeddings
+                WHERE content_type = 'combined'
+                ORDER BY place_id
+            """)
+            row = 0
+            for place_id, embedding in cur:
+                if row >= count:
+                    break
+                ids[row] = place_id
+                matrix[row] = embedding
+                row += 1
+        
+        # Normalize so cosine similarity is a plain dot product at query time
+        norms = np.linalg.norm(matrix[:row], axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix[:row] /= norms
+        matrix.flush()
+        ids.flush()
+        
+        compact_meta = None
+        if compact and row:
+            compact_meta = write_compact(tmp_dir, matrix[:row], compact)
+        del matrix, ids
+        
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({
+                "version": version,
+                "created_at": datetime.now().isoformat(),
+                "model": model,
+                "count": row,
+                "dim": dim,
+                "last_updated": last_updated.isoformat() if last_updated else None,
+                "compact": compact_meta
+            }, f)
+        
+        # Publish the finished directory, then flip the pointer atomically
+        os.rename(tmp_dir, os.path.join(directory, version))
+        pointer_tmp = os.path.join(directory, f".{CURRENT_FILE}.tmp")
+        with open(pointer_tmp, "w") as f:
+            f.write(version)
+        os.replace(pointer_tmp, os.path.join(directory, CURRENT_FILE))
+    
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    
+    prune_snapshots(directory)
+    logger.info(f"Exported embedding snapshot {version} ({row} places, {dim} dims)")
+    return version
+
+def write_compact(path, matrix, compact):
+    """
+    Write the compact copy of a normalized matrix and measure its recall.
+    
+    int8 stores round(x / scale * 127) with a per-dimension scale; float16 is
+    a plain downcast; pca projects onto the top principal components fit on
+    (a sample of) the catalog.
+    
+    Returns:
+        dict for meta.json: format, dimensions, bytes per vector and recall
+    """
+    if compact not in COMPACT_FORMATS:
+        raise ValueError(f"Unknown compact format '{compact}', expected one of {', '.join(COMPACT_FORMATS)}")
+    
+    count, dim = matrix.shape
+    if compact == 'int8':
+        scale = np.abs(matrix).max(axis=0)
+        scale[scale == 0] = 1.0
+        params = (scale / 127).astype(np.float32)
+        dtype, compact_dim = np.int8, dim
+    elif compact == 'float16':
+        params = np.ones(dim, dtype=np.float32)
+        dtype, compact_dim = np.float16, dim
+    else:
+        sample = matrix[np.linspace(0, count - 1, min(count, PCA_FIT_SAMPLE)).astype(int)]
+        mean = sample.mean(axis=0)
+        _, _, components = np.linalg.svd(sample - mean, full_matrices=False)
+        # Rows of params are the principal axes; scores are compared within one query, so
+        # the mean's constant contribution to every dot product can be dropped
+        params = components[:min(EMBEDDING_PCA_DIMENSIONS, len(components))].astype(np.float32)
+        dtype, compact_dim = np.float32, len(params)
+    
+    np.save(os.path.join(path, "compact_params.npy"), params)
+    vectors = np.lib.format.open_memmap(
+        os.path.join(path, "compact.npy"), mode="w+", dtype=dtype, shape=(count, compact_dim)
+    )
+    for start in range(0, count, COMPACT_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + COMPACT_BLOCK_ROWS])
+        if compact == 'int8':
+            block = np.round(block / params)
+        elif compact == 'pca':
+            block = (block - mean) @ params.T
+        vectors[start:start + len(block)] = block.astype(dtype)
+    vectors.flush()
+    
+    recall = compact_recall(matrix, vectors, compact, params)
+    logger.info(f"Compact {compact} vectors: {compact_dim} dims, recall@{RECALL_AT} {recall:.3f}")
+    return {
+        "format": compact,
+        "dim": compact_dim,
+        "bytes_per_vector": compact_dim * np.dtype(dtype).itemsize,
+        f"recall_at_{RECALL_AT}": round(recall, 4)
+    }
+
+def compact_scores(vectors, compact, params, query):
+    """Approximate similarity of a normalized query to every compact row"""
+    if compact == 'pca':
+        return np.asarray(vectors @ (params @ query))
+    
+    # int8 and float16 rows are widened a block at a time; the scale folds into the query
+    query = (query * params).astype(np.float32)
+    scores = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), COMPACT_BLOCK_ROWS):
+        block = vectors[start:start + COMPACT_BLOCK_ROWS]
+        scores[start:start + len(block)] = block.astype(np.float32) @ query
+    return scores
+
+def top_indices(scores, limit):
+    """Row indices of the highest scores, best first"""
+    limit = min(limit, len(scores))
+    if limit <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, limit - 1)[:limit]
+    return top[np.argsort(-scores[top])]
+
+def rerank_search(matrix, vectors, compact, params, query, limit):
+    """
+    Two-pass search: rank all rows by their compact vectors, then re-score the
+    best candidates with the full float32 rows.
+    
+    Returns:
+        Tuple of (row indices best first, exact similarities)
+    """
+    candidates = top_indices(compact_scores(vectors, compact, params, query),
+                             max(limit * RERANK_FACTOR, MIN_RERANK_CANDIDATES))
+    # Sorted so the memory-mapped full rows are read in file order
+    candidates = np.sort(candidates)
+    exact = np.asarray(matrix[candidates] @ query)
+    best = top_indices(exact, limit)
+    return candidates[best], exact[best]
+
+def compact_recall(matrix, vectors, compact, params, sample=RECALL_SAMPLE, k=RECALL_AT):
+    """
+    Share of the exact top-k neighbours that compact search plus re-ranking
+    also returns, using catalog rows as queries.
+    """
+    count = len(matrix)
+    if not count:
+        return 1.0
+    
+    hits = total = 0
+    for row in np.linspace(0, count - 1, min(count, sample)).astype(int):
+        query = np.asarray(matrix[row], dtype=np.float32)
+        exact = set(top_indices(np.asarray(matrix @ query), k).tolist())
+        found, _ = rerank_search(matrix, vectors, compact, params, query, k)
+        hits += len(exact & set(found.tolist()))
+        total += len(exact)
+    return hits / total
+
+def _block_rows(count):
+    """Rows per block so a block of similarities stays around NEIGHBOR_BLOCK_ELEMENTS floats"""
+    return max(1, NEIGHBOR_BLOCK_ELEMENTS // max(count, 1))
+
+def nearest_neighbors(matrix, rows, k):
+    """
+    Exact k nearest neighbours of the given rows of a normalized matrix.
+    
+    Similarities are computed as a blocked matrix product, so memory stays
+    bounded however large the catalog is. A row is never its own neighbour.
+    
+    Returns:
+        Tuple of (neighbour row indices, similarities), each len(rows) x k' with
+        k' = min(k, rows in matrix - 1), best first
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    count = len(matrix)
+    k = min(k, count - 1)
+    if k <= 0 or not len(rows):
+        return np.empty((len(rows), 0), dtype=np.int64), np.empty((len(rows), 0), dtype=np.float32)
+    
+    neighbors = np.empty((len(rows), k), dtype=np.int64)
+    similarities = np.empty((len(rows), k), dtype=np.float32)
+    step = _block_rows(count)
+    for start in range(0, len(rows), step):
+        block = rows[start:start + step]
+        scores = np.asarray(matrix[block]) @ np.asarray(matrix).T
+        scores[np.arange(len(block)), block] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        neighbors[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+        similarities[start:start + len(block)] = np.take_along_axis(top_scores, order, axis=1)
+    return neighbors, similarities
+
+def rows_gaining_neighbors(matrix, changed_rows, thresholds):
+    """
+    Rows for which one of changed_rows now beats their current k-th neighbour.
+    
+    Args:
+        thresholds: Per-row similarity of the current k-th neighbour (-inf if the
+            row has fewer than k neighbours, so any changed row qualifies)
+    
+    Returns:
+        Array of row indices
+    """
+    changed_rows = np.asarray(changed_rows, dtype=np.int64)
+    if not len(changed_rows):
+        return np.empty(0, dtype=np.int64)
+    
+    changed = np.asarray(matrix[changed_rows])
+    affected = []
+    step = _block_rows(len(changed_rows))
+    for start in range(0, len(matrix), step):
+        scores = np.asarray(matrix[start:start + step]) @ changed.T
+        # A changed row doesn't count as its own neighbour
+        own = np.nonzero((changed_rows >= start) & (changed_rows < start + len(scores)))[0]
+        scores[changed_rows[own] - start, own] = -np.inf
+        gained = scores.max(axis=1) > thresholds[start:start + len(scores)]
+        affected.append(np.nonzero(gained)[0] + start)
+    return np.concatenate(affected)
+
+def prune_snapshots(directory, keep=KEEP_SNAPSHOT_VERSIONS):
+    """Delete all but the newest snapshot versions"""
+    versions = sorted(
+        name for name in os.listdir(directory)
+        if not name.startswith(".") and os.path.isdir(os.path.join(directory, name))
+    )
+    for name in versions[:-keep]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+def current_snapshot_version(directory):
+    """Return the version named by the CURRENT pointer, or None"""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+class EmbeddingSnapshot:
+    """
+    Read-only, memory-mapped view of the current embedding snapshot.
+    
+    Every worker maps the same files, so the operating system keeps a single
+    page-cache copy however many gunicorn workers are running. Snapshots
+    exported with a compact copy are searched in two passes (compact scan,
+    exact re-rank of the top candidates) unless use_compact is False.
+    """
+    
+    def __init__(self, directory, use_compact=SNAPSHOT_COMPACT_SEARCH):
+        self.directory = directory
+        self.use_compact = use_compact
+        # (version, matrix, ids, meta, compact vectors, compact params), replaced as a whole on refresh
+        self._state = (None, None, None, {}, None, None)
+        self._last_check = 0.0
+        self.refresh(force=True)
+    
+    @property
+    def version(self):
+        return self._state[0]
+    
+    @property
+    def loaded(self):
+        return self._state[1] is not None
+    
+    def arrays(self):
+        """The current (normalized matrix, place ids), for bulk jobs over the whole catalog"""
+        _, matrix, ids, _, _, _ = self._state
+        return matrix, ids
+    
+    def refresh(self, force=False):
+        """Swap to a newer snapshot if the CURRENT pointer has moved"""
+        now = time.monotonic()
+        if not force and now - self._last_check < SNAPSHOT_REFRESH_INTERVAL:
+            return False
+        self._last_check = now
+        
+        version = current_snapshot_version(self.directory)
+        if not version or version == self.version:
+            return False
+        
+        try:
+            path = os.path.join(self.directory, version)
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            # Rows past meta["count"] were reserved but never written during export
+            count = meta["count"]
+            matrix = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")[:count]
+            ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")[:count]
+            vectors = params = None
+            if meta.get("compact"):
+                vectors = np.load(os.path.join(path, "compact.npy"), mmap_mode="r")[:count]
+                params = np.load(os.path.join(path, "compact_params.npy"))
+        except Exception as e:
+            logger.warning(f"Failed to load embedding snapshot {version}: {str(e)}")
+            return False
+        
+        # A single assignment, so concurrent readers always see one consistent version
+        self._state = (version, matrix, ids, meta, vectors, params)
+        logger.info(f"Loaded embedding snapshot {version} ({meta.get('count')} places)")
+        return True
+    
+    def search(self, embedding, limit=10):
+        """
+        Cosine search over the snapshot.
+        
+        Similarities are always exact; with a compact copy only the candidates
+        it ranks highest are scored at full precision.
+        
+        Returns:
+            List of (place_id, similarity) tuples, most similar first
+        """
+        self.refresh()
+        _, matrix, ids, meta, vectors, params = self._state
+        if matrix is None or not len(ids):
+            return []
+        
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        
+        if vectors is not None and self.use_compact:
+            top, scores = rerank_search(matrix, vectors, meta["compact"]["format"], params, query, limit)
+            return [(int(ids[i]), float(score)) for i, score in zip(top, scores)]
+        
+        scores = matrix @ query
+        top = top_indices(scores, limit)
+        return [(int(ids[i]), float(scores[i])) for i in top]
@@ -6,31 +6,41 @@ import pandas as pd
 import time
 import re
 import hashlib
-from psycopg2.extras import execute_batch
+import threading
+from psycopg2.extras import execute_batch, execute_values
 from openai import OpenAI
 from datetime import datetime
+from collections import OrderedDict
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 import traceback
 
 import math
+import numpy as np
 import requests
 from typing import Dict, List, Optional, Tuple, Any
 
 # Import the location extraction functionality
-from location_extraction import extract_location_from_query, get_adjacent_neighborhoods
+from location_extraction import extract_location_from_query, get_adjacent_neighborhoods, normalize_neighborhood
+from embedding_snapshot import (
+    EmbeddingSnapshot, export_snapshot, current_snapshot_version, nearest_neighbors, rows_gaining_neighbors
+)
+from search_cursor import (
+    MAX_CURSOR_OFFSET, InvalidCursor,
+    cursor_fingerprint, encode_cursor, decode_cursor, check_cursor_fingerprint, keyset_condition, keyset_page
+)
+from metrics import stage, start_timings, format_timings, record_embedding_call
+from standin_embeddings import StandInEmbeddingClient
+from logging_setup import configure_logging, diagnostics_enabled, diagnostics_logger
+from http_cache import DataVersion
+from semantic_cache import SemanticCache, partition_key
+from data_events import PlaceChangeListener, notify_places_changed
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("embeddings.log"),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging (queued console and rotating embeddings.log)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Define dictionaries for query expansion
@@ -95,7 +105,8 @@ TIME_TERMS = {
     'breakfast': ['morning', 'early', 'brunch', 'breakfast food', 'eggs', 'pastry'],
     'lunch': ['midday', 'noon', 'lunch menu', 'lunch special'],
     'dinner': ['evening', 'night', 'dinner menu', 'supper'],
-    'late night': ['open late', 'after hours', 'late', 'midnight', 'night owl']
+    'late night': ['open late', 'after hours', 'late', 'midnight', 'night owl'],
+    'weekend': ['weekends', 'saturday', 'sunday']
 }
 
 AMENITY_TERMS = {
@@ -108,22 +119,189 @@ AMENITY_TERMS = {
     'takeout': ['to go', 'takeaway', 'carryout', 'pickup', 'delivery']
 }
 
+# Structured attributes persisted at ingestion for SQL pre-filtering
+PRICE_TERM_LEVELS = {
+    'cheap': (1, 2),
+    'moderate': (2, 3),
+    'expensive': (3, 4)
+}
+
+HOUR_FLAGS = (
+    'open_late', 'open_early', 'open_weekends', 'open_breakfast',
+    'open_lunch', 'open_dinner', 'open_24h', 'closed_mondays'
+)
+
+# Time terms that map onto an hour flag column
+TIME_TERM_FLAGS = {
+    'breakfast': 'open_breakfast',
+    'lunch': 'open_lunch',
+    'dinner': 'open_dinner',
+    'late night': 'open_late',
+    'weekend': 'open_weekends'
+}
+
+# Weekly opening hours are compiled into a bitmap of quarter-hour slots, Monday first
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+HOURS_BITMAP_BITS = len(WEEKDAYS) * SLOTS_PER_DAY
+PLACES_TIMEZONE = ZoneInfo("America/New_York")
+
+# Matches "11 AM to 2:30 PM", "5 to 11 PM", "10:00-22:00"
+TIME_RANGE_PATTERN = re.compile(
+    r'(\d{1,2})(?::(\d{2}))?\s*([aApP]\.?[mM]\.?)?\s*(?:to|[-–—])\s*'
+    r'(\d{1,2})(?::(\d{2}))?\s*([aApP]\.?[mM]\.?)?'
+)
+# "open now" / "open right now" in a query filters on the current hours slot
+OPEN_NOW_PATTERN = re.compile(r'\bopen (?:right )?now\b')
+
+# Amenity patterns used at ingestion; keys are the canonical amenity keys stored in places.amenities
+AMENITY_PATTERNS = {
+    "wifi": [r'\b(?:wi-?fi|wireless|internet)\b', r'\bwifi\b'],
+    "outdoor_seating": [r'\b(?:outdoor|outside|patio|terrace|sidewalk)\s+(?:seating|dining|area)\b', r'\b(?:garden|courtyard)\b'],
+    "pet_friendly": [r'\b(?:pet|dog)(?:-|\s+)friendly\b', r'\b(?:pets|dogs)\s+(?:allowed|welcome)\b'],
+    "reservations": [r'\breservations?\b', r'\b(?:take|accept)s?\s+reservations?\b'],
+    "takeout": [r'\b(?:take-?out|to-?go|pickup|delivery)\b', r'\bcarry-?out\b'],
+    "live_music": [r'\blive\s+(?:music|band|dj|performance)\b', r'\b(?:music|band|dj)\s+performance\b'],
+    "free_wifi": [r'\bfree\s+(?:wi-?fi|wireless|internet)\b', r'\bfree\s+wifi\b'],
+    "full_bar": [r'\bfull\s+bar\b', r'\bcraft\s+(?:cocktails?|beers?)\b'],
+    "coffee": [r'\b(?:coffee|espresso|latte)\b'],
+    "wheelchair_accessible": [r'\b(?:wheelchair|handicap|ada|accessible)\b'],
+    "vegan_options": [r'\bvegan\b', r'\bvegan[\-\s]+friendly\b'],
+    "gluten_free": [r'\bgluten[\-\s]+free\b'],
+    "vegetarian": [r'\bvegetarian\b', r'\bvegetarian[\-\s]+friendly\b'],
+    "quiet": [r'\b(?:quiet|peaceful|tranquil)\b'],
+    "workspace": [r'\b(?:workspace|work\s+space|working\s+space)\b', r'\b(?:laptops?|work\s+from)\b'],
+    "plug_outlets": [r'\b(?:outlets?|plugs?|sockets?)\b'],
+    "private_room": [r'\bprivate\s+(?:room|dining|event)\b', r'\b(?:event|party)\s+space\b'],
+    "romantic": [r'\bromantic\b', r'\bdate\s+night\b', r'\bintimate\s+setting\b']
+}
+
+# Search modes: pure vector, full-text only, or both fused with reciprocal rank fusion
+SEARCH_MODES = ('vector', 'hybrid', 'lexical')
+RRF_K = 60
+# Short queries whose terms all match this many places skip the embedding call
+LEXICAL_FAST_PATH_MAX_TERMS = 2
+LEXICAL_FAST_PATH_MIN_RESULTS = 3
+
+# Neighborhood boosts applied inside the ranking SQL
+NEIGHBORHOOD_BOOST = 1.1
+ADJACENT_NEIGHBORHOOD_BOOST = 1.05
+MIN_NEIGHBORHOOD_RESULTS = 3
+
+# Recent query embeddings kept per process, so later result pages skip the OpenAI call
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+# First result pages kept per process, keyed by data version and search fingerprint
+SEARCH_RESULT_CACHE_SIZE = 512
+# Texts per embeddings request when embedding queries in bulk (the API accepts up to 2048)
+EMBEDDING_BATCH_SIZE = 100
+# Neighbours stored per place in place_neighbors ("more like this")
+PLACE_NEIGHBORS_K = 20
+# Places claimed from the embedding queue per batch
+EMBEDDING_QUEUE_BATCH = 50
+# Seconds before an unfinished claim (crashed or failed run) can be claimed again
+EMBEDDING_QUEUE_LEASE_SECONDS = 15 * 60
+# places columns that feed prepare_text_for_embedding; changing any of them re-queues the place
+EMBEDDED_PLACE_COLUMNS = (
+    'name', 'combined_description', 'tags', 'corner_place_id', 'neighborhood',
+    'price_range', 'address', 'hours', 'amenities'
+)
+# Characters of combined_description kept as the search result snippet
+SNIPPET_LENGTH = 200
+
+# search_places column -> expression over places p and embeddings e. Search reads only this
+# table: tags are pre-cleaned, descriptions pre-truncated and the embedding is inline
+SEARCH_PLACES_COLUMNS = {
+    'id': "p.id",
+    'name': "p.name",
+    'neighborhood': "p.neighborhood",
+    'neighborhood_key': "p.neighborhood_key",
+    'tags': """COALESCE(ARRAY(
+        SELECT btrim(t.tag, ' "''') FROM unnest(p.tags) WITH ORDINALITY AS t(tag, position)
+        WHERE btrim(t.tag, ' "''') <> '' ORDER BY t.position
+    ), '{}')""",
+    'price_range': "p.price_range",
+    'snippet': f"""CASE WHEN length(p.combined_description) > {SNIPPET_LENGTH}
+        THEN left(p.combined_description, {SNIPPET_LENGTH}) || '...'
+        ELSE p.combined_description END""",
+    'hours': "p.hours",
+    'amenities': "p.amenities",
+    'price_level': "p.price_level",
+    'google_id': "p.google_id",
+    'hours_bitmap': "p.hours_bitmap",
+    **{flag: f"p.{flag}" for flag in HOUR_FLAGS},
+    'search_vector': "p.search_vector",
+    'embedding': "e.embedding"
+}
+
+def refresh_search_rows(cur, place_ids=None):
+    """
+    Rewrite the search_places rows of the given places (every place if None).
+    
+    Runs on the caller's transaction, so searches see the new rows exactly
+    when the write that changed them commits.
+    
+    Returns:
+        int: Number of rows written
+    """
+    if place_ids is not None:
+        place_ids = list(place_ids)
+        if not place_ids:
+            return 0
+    id_filter = "" if place_ids is None else "WHERE p.id = ANY(%s)"
+    params = [] if place_ids is None else [place_ids]
+    
+    cur.execute(f"DELETE FROM search_places p {id_filter}", params)
+    cur.execute(f"""
+        INSERT INTO search_places ({", ".join(SEARCH_PLACES_COLUMNS)})
+        SELECT {", ".join(SEARCH_PLACES_COLUMNS.values())}
+        FROM places p
+        LEFT JOIN embeddings e ON e.place_id = p.id AND e.content_type = 'combined'
+        {id_filter}
+    """, params)
+    return cur.rowcount
+
 class EmbeddingGenerator:
     def __init__(self, db_config):
         """Initialize database configuration and OpenAI client"""
         self.db_config = db_config
         
-        # Set up OpenAI client
-        openai_api_key = os.getenv("OPENAI_KEY")
-        if not openai_api_key:
-            raise ValueError("OPENAI_KEY environment variable not set")
-        
-        self.client = OpenAI(api_key=openai_api_key)
+        # Set up OpenAI client, or the local stand-in used by benchmarks and load tests
+        if os.getenv("EMBEDDING_PROVIDER", "openai") == "standin":
+            self.client = StandInEmbeddingClient()
+        else:
+            openai_api_key = os.getenv("OPENAI_KEY")
+            if not openai_api_key:
+                raise ValueError("OPENAI_KEY environment variable not set")
+            
+            self.client = OpenAI(api_key=openai_api_key)
         self.model = "text-embedding-ada-002"  # Default embedding model
         
         # Keep track of tokens used for cost estimation
         self.total_tokens = 0
         self.has_pgvector = self._check_pgvector()
+        
+        # Memory-mapped embedding snapshot shared across workers (see enable_snapshot)
+        self.snapshot_dir = os.getenv("EMBEDDING_SNAPSHOT_DIR", "snapshots")
+        self.snapshot = None
+        
+        # LRU cache of search query embeddings, keyed by query_embedding_key
+        self.query_embeddings = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
+        
+        # LRU cache of first result pages; entries from older data versions are never hit again
+        self.data_version = DataVersion(db_config)
+        self.search_results = OrderedDict()
+        self._search_results_lock = threading.Lock()
+        # Ranked candidates keyed by expanded query embedding, shared by near-duplicate queries
+        self.semantic_cache = SemanticCache()
+        
+        # Live invalidation from NOTIFY events (see start_change_listener). _change_seq counts
+        # applied changes, so a search that overlapped one doesn't cache what it read before it
+        self.change_listener = None
+        self._change_seq = 0
+        # Embedding changes the memory-mapped snapshot doesn't include yet
+        self._snapshot_pending_ids = set()
     
     def _connect_db(self):
         """Create and return a new database connection and cursor"""
@@ -131,6 +309,272 @@ class EmbeddingGenerator:
         cur = conn.cursor()
         return conn, cur
     
+    def enable_snapshot(self, directory=None):
+        """Serve unfiltered vector searches from the memory-mapped embedding snapshot"""
+        directory = directory or self.snapshot_dir
+        snapshot = EmbeddingSnapshot(directory)
+        if not snapshot.loaded:
+            logger.warning(f"No embedding snapshot found in {directory}, searching in Postgres")
+            return False
+        self.snapshot = snapshot
+        return True
+    
+    def export_embedding_snapshot(self):
+        """Export the stored embeddings as a new snapshot version for serving workers"""
+        conn, cur = self._connect_db()
+        try:
+            version = export_snapshot(conn, self.snapshot_dir, self.model)
+            # Workers swap to the new version now instead of at their next periodic check
+            notify_places_changed(cur, 'snapshot')
+            conn.commit()
+            return version
+        except Exception as e:
+            logger.error(f"Error exporting embedding snapshot: {str(e)}")
+            conn.rollback()
+            return None
+        finally:
+            cur.close()
+            conn.close()
+    
+    def query_embedding_key(self, text):
+        """Cache key for the embedding of a search query"""
+        return hashlib.md5(f"{self.model}|{text}".encode()).hexdigest()
+    
+    def cached_query_embedding(self, key):
+        """Return a cached query embedding, or None"""
+        with self._query_embeddings_lock:
+            embedding = self.query_embeddings.get(key)
+            if embedding is not None:
+                self.query_embeddings.move_to_end(key)
+            return embedding
+    
+    def cache_query_embedding(self, key, embedding):
+        """Store a query embedding, evicting the least recently used ones"""
+        with self._query_embeddings_lock:
+            self.query_embeddings[key] = embedding
+            self.query_embeddings.move_to_end(key)
+            while len(self.query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+                self.query_embeddings.popitem(last=False)
+    
+    def cached_search_page(self, key):
+        """Return a cached (results, next cursor) first page, or None"""
+        with self._search_results_lock:
+            entry = self.search_results.get(key)
+            if entry is None:
+                return None
+            self.search_results.move_to_end(key)
+            return entry[0]
+    
+    def cache_search_page(self, key, page, embedding=None, filtered=frozenset()):
+        """
+        Store a first result page, evicting the least recently used ones.
+        
+        The query embedding (None for full-text pages) and the kinds of
+        filters the search used (see _filter_kinds) are kept so
+        apply_place_changes can tell which pages a change affects.
+        """
+        with self._search_results_lock:
+            self.search_results[key] = (page, embedding, filtered)
+            self.search_results.move_to_end(key)
+            while len(self.search_results) > SEARCH_RESULT_CACHE_SIZE:
+                self.search_results.popitem(last=False)
+    
+    @staticmethod
+    def _filter_kinds(where_clauses):
+        """Which kinds of SQL filters a search used: 'amenities' and/or 'attributes' (price, hours, open at)"""
+        attribute_columns = ('p.price_level', 'p.hours_bitmap') + tuple(f"p.{flag}" for flag in HOUR_FLAGS)
+        kinds = set()
+        for clause in where_clauses:
+            if 'p.amenities' in clause:
+                kinds.add('amenities')
+            elif any(column in clause for column in attribute_columns):
+                kinds.add('attributes')
+        return frozenset(kinds)
+    
+    def clear_search_caches(self):
+        """Drop all cached query embeddings and result pages"""
+        with self._query_embeddings_lock:
+            self.query_embeddings.clear()
+        with self._search_results_lock:
+            self.search_results.clear()
+        self.semantic_cache.clear()
+    
+    def cache_version(self):
+        """
+        Version cached search results are keyed on.
+        
+        While the change listener is connected, changed places are evicted as
+        their NOTIFY events arrive, so entries stay valid across writes and the
+        key only moves when the listener reconnects. Otherwise it follows the
+        data version, which any write changes.
+        """
+        listener = self.change_listener
+        if listener is not None and listener.connected:
+            return f"live-{listener.generation}"
+        return self.data_version.get()
+    
+    def start_change_listener(self):
+        """Keep this process's caches and snapshot current by listening for place changes"""
+        if self.change_listener is None:
+            self.change_listener = PlaceChangeListener(
+                self.db_config, self.apply_place_changes, on_resync=self._resync_after_listen
+            ).start()
+        return self.change_listener
+    
+    def _resync_after_listen(self):
+        """Changes may have been missed while not listening; entries under the old version are already unreachable"""
+        self._change_seq += 1
+        self.data_version.invalidate()
+        self._snapshot_pending_ids.clear()
+        if self.snapshot:
+            self.snapshot.refresh(force=True)
+    
+    def _place_vectors(self, place_ids):
+        """Normalized stored embeddings of the given places, as a (place ids, matrix) pair"""
+        if not place_ids:
+            return [], None
+        conn, cur = self._connect_db()
+        try:
+            cur.execute("""
+                SELECT place_id, embedding::real[]
+                FROM embeddings
+                WHERE place_id = ANY(%s) AND content_type = 'combined'
+            """, (sorted(place_ids),))
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+        if not rows:
+            return [], None
+        matrix = np.array([embedding for _, embedding in rows], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return [place_id for place_id, _ in rows], matrix / norms
+    
+    def apply_place_changes(self, changes):
+        """
+        Evict cached searches affected by changed places (called by the change listener).
+        
+        A cached ranking is dropped if it lists a changed place, if it filtered on
+        amenities and amenities changed, or if a changed embedding would now rank
+        above its last result. A 'place' change (new or edited content, price or
+        hours) also drops every full-text page and every page filtered on price,
+        hours or open-at, since a place may newly match them without having an
+        embedding that changed. Everything else stays cached. Embedding changes are
+        also remembered until the next snapshot export, since unfiltered searches
+        rank from the snapshot and only see new vectors once it is swapped in.
+        
+        Args:
+            changes: Dict of change kind ('embedding', 'amenities', 'google_id', 'place', 'snapshot') -> set of place ids
+        """
+        self._change_seq += 1
+        self.data_version.invalidate()
+        changed = set().union(*changes.values())
+        embedded = set(changes.get('embedding', ()))
+        
+        if 'snapshot' in changes:
+            if self.snapshot:
+                self.snapshot.refresh(force=True)
+            # Pages ranked from the previous snapshot used the old vectors of these places
+            changed |= self._snapshot_pending_ids
+            embedded |= self._snapshot_pending_ids
+            self._snapshot_pending_ids.clear()
+        elif self.snapshot:
+            self._snapshot_pending_ids |= embedded
+        
+        _, vectors = self._place_vectors(embedded)
+        amenities_changed = 'amenities' in changes
+        places_changed = 'place' in changes
+        # Boosted similarities are compared, so assume a changed place gets the largest boost
+        max_boost = max(NEIGHBORHOOD_BOOST, ADJACENT_NEIGHBORHOOD_BOOST)
+        
+        def affected(place_ids, scores, limit, embedding, filtered):
+            if changed.intersection(place_ids):
+                return True
+            if amenities_changed and 'amenities' in filtered:
+                return True
+            if places_changed and (embedding is None or 'attributes' in filtered):
+                return True
+            if vectors is None or embedding is None:
+                return False
+            if len(scores) < limit:
+                return True
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            return float(np.max(vectors @ query)) * max_boost >= min(scores)
+        
+        with self._search_results_lock:
+            stale = [
+                key for key, (page, embedding, filtered) in self.search_results.items()
+                if affected([row[0] for row in page[0]], [row[6] for row in page[0]],
+                            key[2], embedding, filtered)
+            ]
+            for key in stale:
+                del self.search_results[key]
+        
+        evicted = self.semantic_cache.evict(
+            lambda embedding, entry: affected(
+                [row[0] for row in entry[0]], [row[8] for row in entry[0]],
+                entry[3], embedding, entry[4]
+            )
+        )
+        
+        logger.info(f"Applied changes to {len(changed)} places ({', '.join(sorted(changes))}): "
+                    f"evicted {len(stale)} result pages and {evicted} semantic cache entries")
+    
+    def embed_queries(self, texts, batch_size=EMBEDDING_BATCH_SIZE):
+        """
+        Embed many search texts with one API request per batch and cache them.
+        
+        Texts already in the query embedding cache are skipped.
+        
+        Returns:
+            int: Number of texts embedded
+        """
+        pending = []
+        for text in dict.fromkeys(texts):
+            if text and self.cached_query_embedding(self.query_embedding_key(text)) is None:
+                pending.append(text)
+        
+        embedded = 0
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            try:
+                with stage('embed_batch'):
+                    response = self.client.embeddings.create(input=batch, model=self.model)
+            except Exception as e:
+                record_embedding_call(success=False)
+                logger.warning(f"Error embedding batch of {len(batch)} queries: {str(e)}")
+                continue
+            
+            tokens_used = response.usage.total_tokens
+            self.total_tokens += tokens_used
+            record_embedding_call(tokens_used)
+            for item in response.data:
+                self.cache_query_embedding(self.query_embedding_key(batch[item.index]), item.embedding)
+            embedded += len(batch)
+        
+        return embedded
+    
+    def embed_query(self, text, stage_name='embed_query'):
+        """
+        Embed search text, reusing the cached embedding when the same text was seen recently.
+        
+        Args:
+            stage_name: Timing stage the OpenAI call is recorded under
+        
+        Returns:
+            Tuple of (embedding or None, cache key)
+        """
+        key = self.query_embedding_key(text)
+        embedding = self.cached_query_embedding(key)
+        if embedding is None:
+            with stage(stage_name):
+                embedding, _ = self.generate_embedding(text)
+            if embedding:
+                self.cache_query_embedding(key, embedding)
+        return embedding, key
+    
     def _check_pgvector(self):
         """Check if pgvector extension is installed"""
         conn, cur = self._connect_db()
@@ -183,10 +627,9 @@ class EmbeddingGenerator:
         if not price:
             return None
         
-        # Extract dollar signs if present
-        dollar_count = price.count('$')
-        if dollar_count > 0:
-            price_level = dollar_count
+        # Dollar-sign notation ($, $$, ...); "$10-20" is a numeric range instead
+        if re.fullmatch(r'\$+', price):
+            price_level = min(len(price), 4)
         else:
             # Try to extract numerical ranges (e.g. $10-20, $30-50)
             match = re.search(r'\$?(\d+)(?:[^\d]+)(\d+)', price)
@@ -272,57 +715,20 @@ class EmbeddingGenerator:
                 
                 hour_patterns["days_open"].append(day_name)
                 
-                # Check for specific patterns in hours
-                if "24" in hours_str:
-                    hour_patterns["open_24h"] = True
-                    continue
-                    
-                # Parse actual opening and closing times
-                time_patterns = [
-                    # 12-hour format: 10 AM to 10 PM
-                    r'(\d+(?::\d+)?)\s*([aApP][mM])\s*(?:to|[-–—])\s*(\d+(?::\d+)?)\s*([aApP][mM])',
-                    # 24-hour format: 10:00-22:00
-                    r'(\d+):(\d+)\s*(?:to|[-–—])\s*(\d+):(\d+)',
-                    # Simple format: 10-22
-                    r'(\d+)\s*(?:to|[-–—])\s*(\d+)'
-                ]
-                
-                for pattern in time_patterns:
-                    match = re.search(pattern, hours_str)
-                    if match:
-                        # 12-hour format
-                        if len(match.groups()) == 4 and match.group(2) and match.group(4):
-                            open_hour = int(match.group(1).split(':')[0])
-                            close_hour = int(match.group(3).split(':')[0])
-                            
-                            # Adjust for PM
-                            if match.group(2).lower() == 'pm' and open_hour < 12:
-                                open_hour += 12
-                            if match.group(4).lower() == 'pm' and close_hour < 12:
-                                close_hour += 12
-                            
-                        # 24-hour format
-                        elif len(match.groups()) == 4:
-                            open_hour = int(match.group(1))
-                            close_hour = int(match.group(3))
-                            
-                        # Simple format
-                        else:
-                            open_hour = int(match.group(1))
-                            close_hour = int(match.group(2))
-                        
-                        # Check time patterns
-                        if open_hour <= 8:
-                            hour_patterns["open_early"] = True
-                        if open_hour <= 10:
-                            hour_patterns["open_breakfast"] = True
-                        if open_hour <= 12 and close_hour >= 14:
-                            hour_patterns["open_lunch"] = True
-                        if close_hour >= 17:
-                            hour_patterns["open_dinner"] = True
-                        if close_hour >= 22 or close_hour <= 4:  # Late night or early morning closing
-                            hour_patterns["open_late"] = True
-                        break
+                # Check time patterns across every open range of the day
+                for open_minute, close_minute in self.parse_time_ranges(hours_str):
+                    if open_minute == 0 and close_minute >= 24 * 60:
+                        hour_patterns["open_24h"] = True
+                    if open_minute <= 8 * 60:
+                        hour_patterns["open_early"] = True
+                    if open_minute <= 10 * 60:
+                        hour_patterns["open_breakfast"] = True
+                    if open_minute <= 12 * 60 and close_minute >= 14 * 60:
+                        hour_patterns["open_lunch"] = True
+                    if close_minute >= 17 * 60:
+                        hour_patterns["open_dinner"] = True
+                    if close_minute >= 22 * 60:  # Includes closing after midnight
+                        hour_patterns["open_late"] = True
         
         # Check weekend operation
         if "Saturday" in hour_patterns["days_open"] or "Sunday" in hour_patterns["days_open"]:
@@ -356,13 +762,152 @@ class EmbeddingGenerator:
             "description": ", ".join(descriptions)
         }
         
-    def fetch_places_needing_embeddings(self):
-        """Fetch places that need embeddings generated or updated"""
+    def parse_time_ranges(self, hours_str):
+        """
+        Parse a day's hours string into (open, close) minutes after midnight.
+        
+        A missing AM/PM on the opening time is inferred from the closing time
+        ("5 to 11 PM" is 5 PM to 11 PM). Ranges past midnight have a close
+        greater than 24 * 60.
+        """
+        if not hours_str or not isinstance(hours_str, str):
+            return []
+        
+        text = hours_str.strip().lower()
+        if text == "closed":
+            return []
+        if "24 hours" in text or text == "24/7":
+            return [(0, 24 * 60)]
+        
+        def to_minutes(hour, minute, meridiem):
+            hour = int(hour)
+            if meridiem:
+                hour = hour % 12 + (12 if meridiem[0].lower() == 'p' else 0)
+            return hour * 60 + int(minute or 0)
+        
+        ranges = []
+        for match in TIME_RANGE_PATTERN.finditer(hours_str):
+            open_hour, open_min, open_meridiem, close_hour, close_min, close_meridiem = match.groups()
+            
+            close_minute = to_minutes(close_hour, close_min, close_meridiem or open_meridiem)
+            if open_meridiem or not close_meridiem:
+                open_minute = to_minutes(open_hour, open_min, open_meridiem)
+            else:
+                open_minute = to_minutes(open_hour, open_min, close_meridiem)
+                if open_minute > close_minute:
+                    # "11 to 2 PM" opens in the morning, "10 to 2 AM" in the evening
+                    flipped = 'am' if close_meridiem[0].lower() == 'p' else 'pm'
+                    open_minute = to_minutes(open_hour, open_min, flipped)
+            
+            if close_minute <= open_minute:
+                close_minute += 24 * 60
+            ranges.append((open_minute, close_minute))
+        
+        return ranges
+    
+    def compile_hours_bitmap(self, hours_data):
+        """
+        Compile weekly hours into a bit string of 7 x 96 quarter-hour slots.
+        
+        Bit (day * 96 + minute // 15) is set when the place is open, with
+        Monday as day 0. Ranges past midnight spill into the next day. Days
+        missing from the hours data are treated as closed.
+        
+        Returns:
+            String of '0'/'1' characters for a BIT(672) column, or None if
+            the hours are unknown
+        """
+        parsed_hours = self.parse_hours(hours_data)
+        if not parsed_hours or not isinstance(parsed_hours, dict):
+            return None
+        
+        bits = ['0'] * HOURS_BITMAP_BITS
+        for day, hours_str in parsed_hours.items():
+            day_index = next(
+                (i for i, name in enumerate(WEEKDAYS) if name[:3].lower() in str(day).lower()),
+                None
+            )
+            if day_index is None:
+                continue
+            
+            for open_minute, close_minute in self.parse_time_ranges(hours_str):
+                first_slot = open_minute // SLOT_MINUTES
+                last_slot = -(-close_minute // SLOT_MINUTES)  # Round partial slots up
+                for slot in range(first_slot, last_slot):
+                    bits[(day_index * SLOTS_PER_DAY + slot) % HOURS_BITMAP_BITS] = '1'
+        
+        return ''.join(bits)
+    
+    def hours_slot(self, when=None):
+        """Return the hours bitmap slot for a datetime (naive times are NYC local), default now"""
+        if when is None:
+            when = datetime.now(PLACES_TIMEZONE)
+        elif when.tzinfo is not None:
+            when = when.astimezone(PLACES_TIMEZONE)
+        
+        minute_of_day = when.hour * 60 + when.minute
+        return when.weekday() * SLOTS_PER_DAY + minute_of_day // SLOT_MINUTES
+    
+    def search_hours_slot(self, query, open_at=None):
+        """
+        Hours slot a search's results depend on, or None if it has no open-at filter.
+        
+        Covers "open now" in the query text as well as open_at, without the
+        location extraction parse_query would run.
+        """
+        if open_at is not None:
+            return self.hours_slot(open_at)
+        if OPEN_NOW_PATTERN.search((query or '').lower()):
+            return self.hours_slot(None)
+        return None
+    
+    def fetch_places_needing_embeddings(self, limit=EMBEDDING_QUEUE_BATCH, claimed_before=None):
+        """
+        Claim a batch of places from the embedding queue and fetch what embedding them needs.
+        
+        Triggers on places and reviews queue a place whenever its embedded
+        content changes, so finding work reads only the queue. Claimed rows are
+        marked rather than held locked, and SKIP LOCKED lets concurrent runs
+        claim disjoint batches. A claim expires after EMBEDDING_QUEUE_LEASE_SECONDS
+        so places from a crashed run are picked up again.
+        
+        Args:
+            limit: Most places to claim, or None for the whole queue
+            claimed_before: Don't reclaim places whose claim is newer than this (places failed this run)
+        
+        Returns:
+            Tuple of (new places, places with outdated embeddings, reviews by place id,
+            claims as (place_id, queued_at) tuples for complete_embedding_work)
+        """
         logger.info("Fetching places that need embeddings...")
         
         conn, cur = self._connect_db()
         try:
-            # First, check for places that have no embeddings at all
+            cur.execute(f"""
+                UPDATE embedding_queue q
+                SET claimed_at = clock_timestamp()
+                FROM (
+                    SELECT place_id
+                    FROM embedding_queue
+                    WHERE claimed_at IS NULL
+                       OR claimed_at < LEAST(clock_timestamp() - %s * INTERVAL '1 second', %s)
+                    ORDER BY queued_at
+                    {"LIMIT %s" if limit else ""}
+                    FOR UPDATE SKIP LOCKED
+                ) batch
+                WHERE q.place_id = batch.place_id
+                RETURNING q.place_id, q.queued_at
+            """, [EMBEDDING_QUEUE_LEASE_SECONDS, claimed_before or datetime.now(ZoneInfo("UTC"))]
+                + ([limit] if limit else []))
+            claims = cur.fetchall()
+            # Commit the claims right away; embedding the batch takes far longer than a lock should be held
+            conn.commit()
+            
+            if not claims:
+                return [], [], {}, []
+            claimed_ids = [place_id for place_id, _ in claims]
+            
+            # Claimed places that have no embedding yet
             query = """
             SELECT 
                 p.id, 
@@ -378,12 +923,12 @@ class EmbeddingGenerator:
                 p.google_id
             FROM places p
             LEFT JOIN embeddings e ON p.id = e.place_id
-            WHERE e.id IS NULL
+            WHERE p.id = ANY(%s) AND e.id IS NULL
             """
-            cur.execute(query)
+            cur.execute(query, (claimed_ids,))
             places = cur.fetchall()
             
-            # For places with existing embeddings, check if content has changed
+            # Claimed places whose content changed since they were embedded
             query = """
             SELECT 
                 p.id, 
@@ -400,39 +945,70 @@ class EmbeddingGenerator:
                 e.last_updated
             FROM places p
             JOIN embeddings e ON p.id = e.place_id
-            WHERE p.updated_at > e.last_updated
+            WHERE p.id = ANY(%s)
             """
-            cur.execute(query)
+            cur.execute(query, (claimed_ids,))
             updated_places = cur.fetchall()
             
-            # Fetch reviews for all places that need embeddings
-            all_place_ids = [place[0] for place in places] + [place[0] for place in updated_places]
-            
+            # Fetch reviews for the claimed places
             place_reviews = {}
-            if all_place_ids:
-                placeholders = ','.join(['%s'] * len(all_place_ids))
-                review_query = f"""
+            cur.execute("""
                 SELECT place_id, review_text
                 FROM reviews
-                WHERE place_id IN ({placeholders})
-                """
-                cur.execute(review_query, all_place_ids)
-                review_results = cur.fetchall()
-                
-                # Group reviews by place_id
-                for place_id, review_text in review_results:
-                    if place_id not in place_reviews:
-                        place_reviews[place_id] = []
-                    place_reviews[place_id].append(review_text)
+                WHERE place_id = ANY(%s)
+            """, (claimed_ids,))
+            review_results = cur.fetchall()
+            
+            # Group reviews by place_id
+            for place_id, review_text in review_results:
+                if place_id not in place_reviews:
+                    place_reviews[place_id] = []
+                place_reviews[place_id].append(review_text)
             
-            logger.info(f"Found {len(places)} places without embeddings and {len(updated_places)} places with outdated embeddings")
+            logger.info(f"Claimed {len(places)} places without embeddings and {len(updated_places)} places with outdated embeddings")
             
-            return places, updated_places, place_reviews
+            return places, updated_places, place_reviews, claims
         
         except Exception as e:
             logger.error(f"Error fetching places: {str(e)}")
             conn.rollback()
-            return [], [], {}
+            return [], [], {}, []
+        finally:
+            cur.close()
+            conn.close()
+    
+    def complete_embedding_work(self, claims):
+        """
+        Remove finished places from the embedding queue.
+        
+        A place re-queued while it was being embedded has a newer queued_at
+        than its claim, so it stays queued for the next batch.
+        """
+        if not claims:
+            return 0
+        conn, cur = self._connect_db()
+        try:
+            cur.execute("""
+                DELETE FROM embedding_queue q
+                USING unnest(%s::integer[], %s::timestamptz[]) AS done(place_id, queued_at)
+                WHERE q.place_id = done.place_id AND q.queued_at = done.queued_at
+            """, ([place_id for place_id, _ in claims], [queued_at for _, queued_at in claims]))
+            conn.commit()
+            return cur.rowcount
+        except Exception as e:
+            logger.error(f"Error completing embedding queue entries: {str(e)}")
+            conn.rollback()
+            return 0
+        finally:
+            cur.close()
+            conn.close()
+    
+    def embedding_queue_depth(self):
+        """Number of places waiting in the embedding queue"""
+        conn, cur = self._connect_db()
+        try:
+            cur.execute("SELECT COUNT(*) FROM embedding_queue")
+            return cur.fetchone()[0]
         finally:
             cur.close()
             conn.close()
@@ -643,7 +1219,7 @@ class EmbeddingGenerator:
         # Check if we have enough valid content
         if not content or len(content) < 50:
             logger.warning(f"Not enough valid content for place {name} (ID: {place_id})")
-            return None, None
+            return None, None, None
         
         # Calculate content hash for detecting changes
         content_hash = hashlib.md5(content.encode()).hexdigest()
@@ -679,6 +1255,7 @@ class EmbeddingGenerator:
                 # Track token usage
                 tokens_used = response.usage.total_tokens
                 self.total_tokens += tokens_used
+                record_embedding_call(tokens_used)
                 
                 logger.info(f"Generated embedding successfully. Used {tokens_used} tokens.")
                 return embedding, tokens_used
@@ -686,6 +1263,7 @@ class EmbeddingGenerator:
             except Exception as e:
                 # Implement exponential backoff
                 wait_time = retry_delay * (2 ** attempt)
+                record_embedding_call(success=False)
                 logger.warning(f"Error generating embedding (attempt {attempt+1}/{max_retries}): {str(e)}")
                 logger.warning(f"Waiting {wait_time} seconds before retrying...")
                 time.sleep(wait_time)
@@ -732,6 +1310,8 @@ class EmbeddingGenerator:
                 )
                 logger.info(f"Created new embedding for place {place_id}")
             
+            refresh_search_rows(cur, [place_id])
+            notify_places_changed(cur, 'embedding', [place_id])
             conn.commit()
             return True
             
@@ -775,88 +1355,129 @@ class EmbeddingGenerator:
             conn.close()
     
     def process_all_places(self):
-        """Process all places that need embeddings"""
+        """Embed the places in the embedding queue, one claimed batch at a time"""
+        timings = start_timings()
         try:
-            # Fetch places that need embeddings
-            new_places, updated_places, place_reviews = self.fetch_places_needing_embeddings()
-            
-            if not new_places and not updated_places:
+            total_places = self.embedding_queue_depth()
+            if not total_places:
                 logger.info("No places need embeddings. All up to date!")
+                if not current_snapshot_version(self.snapshot_dir):
+                    self.export_embedding_snapshot()
+                # Builds the neighbour graph if it is missing; otherwise there is nothing to do
+                self.update_place_neighbors([])
                 return
             
-            # Process new places
-            total_places = len(new_places) + len(updated_places)
             processed = 0
-            
-            for place in new_places:
-                place_id, name = place[0], place[1]
-                logger.info(f"Processing new place: {name} (ID: {place_id}) - {processed+1}/{total_places}")
-                
-                # Prepare text and validate
-                content, content_hash, neighborhood = self.prepare_text_for_embedding(place, place_reviews)
-                
-                if not content:
-                    self.update_embedding_status(place_id, "failed", "No valid content for embedding")
-                    processed += 1
-                    continue
-                
-                # Generate embedding
-                embedding, tokens = self.generate_embedding(content)
+            embedded_ids = []
+            # Places claimed (and failed) during this run aren't retried until the next one
+            run_started = datetime.now(ZoneInfo("UTC"))
+            
+            while True:
+                # Fetch the next batch of queued places
+                with stage('fetch_places'):
+                    new_places, updated_places, place_reviews, claims = self.fetch_places_needing_embeddings(
+                        claimed_before=run_started
+                    )
+                if not claims:
+                    break
+                # Places that no longer need work: embedded, or with nothing to embed until they change again
+                done_ids = set()
                 
-                if embedding:
-                    # Store embedding
-                    success = self.store_embedding(place_id, embedding)
+                # Process new places
+                for place in new_places:
+                    place_id, name = place[0], place[1]
+                    logger.info(f"Processing new place: {name} (ID: {place_id}) - {processed+1}/{total_places}")
                     
-                    if success:
-                        self.update_embedding_status(place_id, "success", f"Used {tokens} tokens")
+                    # Prepare text and validate
+                    with stage('prepare_text'):
+                        content, content_hash, neighborhood = self.prepare_text_for_embedding(place, place_reviews)
+                    
+                    if not content:
+                        self.update_embedding_status(place_id, "failed", "No valid content for embedding")
+                        done_ids.add(place_id)
+                        processed += 1
+                        continue
+                    
+                    # Generate embedding
+                    with stage('embedding'):
+                        embedding, tokens = self.generate_embedding(content)
+                    
+                    if embedding:
+                        # Store embedding
+                        with stage('store_embedding'):
+                            success = self.store_embedding(place_id, embedding)
+                        
+                        if success:
+                            embedded_ids.append(place_id)
+                            done_ids.add(place_id)
+                            self.update_embedding_status(place_id, "success", f"Used {tokens} tokens")
+                        else:
+                            self.update_embedding_status(place_id, "failed", "Failed to store embedding")
                     else:
-                        self.update_embedding_status(place_id, "failed", "Failed to store embedding")
-                else:
-                    self.update_embedding_status(place_id, "failed", "Failed to generate embedding")
-                
-                processed += 1
-                
-                # Add a small delay between calls to avoid rate limiting
-                time.sleep(0.5)
-            
-            # Process updated places
-            for place in updated_places:
-                place_id, name = place[0], place[1]
-                embedding_id = place[10] if len(place) > 10 else None
-                
-                logger.info(f"Processing updated place: {name} (ID: {place_id}) - {processed+1}/{total_places}")
-                
-                # Prepare text and validate
-                content, content_hash, neighborhood = self.prepare_text_for_embedding(place, place_reviews)
-                
-                if not content:
-                    self.update_embedding_status(place_id, "failed", "No valid content for embedding")
+                        self.update_embedding_status(place_id, "failed", "Failed to generate embedding")
+                    
                     processed += 1
-                    continue
-                
-                # Generate embedding
-                embedding, tokens = self.generate_embedding(content)
+                    
+                    # Add a small delay between calls to avoid rate limiting
+                    time.sleep(0.5)
                 
-                if embedding:
-                    # Store embedding
-                    success = self.store_embedding(place_id, embedding)
+                # Process updated places
+                for place in updated_places:
+                    place_id, name = place[0], place[1]
+                    embedding_id = place[10] if len(place) > 10 else None
+                    
+                    logger.info(f"Processing updated place: {name} (ID: {place_id}) - {processed+1}/{total_places}")
+                    
+                    # Prepare text and validate
+                    with stage('prepare_text'):
+                        content, content_hash, neighborhood = self.prepare_text_for_embedding(place, place_reviews)
+                    
+                    if not content:
+                        self.update_embedding_status(place_id, "failed", "No valid content for embedding")
+                        done_ids.add(place_id)
+                        processed += 1
+                        continue
                     
-                    if success:
-                        self.update_embedding_status(place_id, "updated", f"Used {tokens} tokens")
+                    # Generate embedding
+                    with stage('embedding'):
+                        embedding, tokens = self.generate_embedding(content)
+                    
+                    if embedding:
+                        # Store embedding
+                        with stage('store_embedding'):
+                            success = self.store_embedding(place_id, embedding)
+                        
+                        if success:
+                            embedded_ids.append(place_id)
+                            done_ids.add(place_id)
+                            self.update_embedding_status(place_id, "updated", f"Used {tokens} tokens")
+                        else:
+                            self.update_embedding_status(place_id, "failed", "Failed to update embedding")
                     else:
-                        self.update_embedding_status(place_id, "failed", "Failed to update embedding")
-                else:
-                    self.update_embedding_status(place_id, "failed", "Failed to generate embedding")
-                
-                processed += 1
+                        self.update_embedding_status(place_id, "failed", "Failed to generate embedding")
+                    
+                    processed += 1
+                    
+                    # Add a small delay between calls to avoid rate limiting
+                    time.sleep(0.5)
                 
-                # Add a small delay between calls to avoid rate limiting
-                time.sleep(0.5)
+                # Failed places keep their claim and are retried once the lease runs out
+                with stage('complete_queue'):
+                    self.complete_embedding_work([claim for claim in claims if claim[0] in done_ids])
+            
+            # Publish the new embeddings to serving workers
+            with stage('snapshot_export'):
+                self.export_embedding_snapshot()
+            
+            # Refresh "more like this" lists around the places that changed
+            with stage('neighbors'):
+                self.update_place_neighbors(embedded_ids)
             
             # Log summary
             logger.info(f"Embedding generation complete.")
-            logger.info(f"Processed {total_places} places.")
+            logger.info(f"Processed {processed} places.")
             logger.info(f"Total tokens used: {self.total_tokens}")
+            logger.info(f"Time by stage: {format_timings(timings)}")
             logger.info(f"Estimated cost: ${(self.total_tokens / 1000) * 0.0001:.4f} (at $0.0001 per 1K tokens)")
             
             return self.total_tokens
@@ -883,12 +1504,16 @@ class EmbeddingGenerator:
             'time': [],
             'amenities': [],
             'group_size': [],
+            'price_level': None,
+            'hour_flags': [],
+            'open_now': False,
             'cleaned_query': query,
             'original_query': query
         }
         
         # First extract location to remove it from embedding consideration
-        cleaned_query, location = extract_location_from_query(query)
+        with stage('location'):
+            cleaned_query, location = extract_location_from_query(query)
         result['location'] = location
         result['cleaned_query'] = cleaned_query
         
@@ -925,10 +1550,30 @@ class EmbeddingGenerator:
             if time in query_lower or any(syn in query_lower for syn in synonyms):
                 result['time'].append(time)
         
-        # Identify amenity terms
+        # Identify amenity terms, stored under the canonical keys used in places.amenities
         for amenity, synonyms in AMENITY_TERMS.items():
             if amenity in query_lower or any(syn in query_lower for syn in synonyms):
-                result['amenities'].append(amenity)
+                result['amenities'].append(self.canonical_amenity_key(amenity))
+        
+        # Map price and time terms onto the structured attribute columns. These
+        # become hard filters, so require whole-word matches ("chocolate" is not "late")
+        def mentions(term, synonyms):
+            return any(re.search(r'\b' + re.escape(t) + r'\b', query_lower) for t in [term] + synonyms)
+        
+        price_ranges = [
+            PRICE_TERM_LEVELS[price] for price in result['price']
+            if price in PRICE_TERM_LEVELS and mentions(price, PRICE_TERMS[price])
+        ]
+        if price_ranges:
+            result['price_level'] = (
+                min(low for low, _ in price_ranges),
+                max(high for _, high in price_ranges)
+            )
+        result['hour_flags'] = [
+            TIME_TERM_FLAGS[term] for term in result['time']
+            if term in TIME_TERM_FLAGS and mentions(term, TIME_TERMS[term])
+        ]
+        result['open_now'] = bool(OPEN_NOW_PATTERN.search(query_lower))
         
         # Check for group size indicators
         if any(term in query_lower for term in ['group', 'party', 'gathering', 'crowd']):
@@ -1002,218 +1647,961 @@ class EmbeddingGenerator:
         
         return expanded_query
     
-    def search_places_with_meaningful_breakdown(self, query, limit=10, amenity_filter=True):
+    def _fetch_ranked_places(self, cur, embedding, limit, neighborhood=None,
+                             where_clauses=None, filter_params=None,
+                             after_score=None, after_similarity=None, after_id=None,
+                             exclude_ids=None, offset=0):
         """
-        Enhanced version of search that provides a more meaningful breakdown
-        of why certain places match a query better than others
-        """
-        if not self.has_pgvector:
-            logger.warning("pgvector extension not available, cannot perform search")
-            return []
+        Run the vector search with neighborhood boosting computed in SQL.
         
-        # Parse the query into categories
-        parsed_query = self.parse_query(query)
-        original_query = query
+        Args:
+            after_score, after_similarity, after_id, exclude_ids, offset: Keyset
+                continuation from a pagination cursor
         
-        # Get the original query embedding before expansion
-        original_embedding, _ = self.generate_embedding(original_query)
+        Returns:
+            List of (id, name, neighborhood, tags, price_range, snippet,
+            hours, amenities, boosted_similarity, similarity) tuples
+        """
+        if self.snapshot and not neighborhood and not where_clauses:
+            # Unfiltered ranking comes from the shared snapshot; Postgres only serves rows by id
+            exclude = set(exclude_ids or [])
+            window = offset + len(exclude) + limit
+            with stage('snapshot_search'):
+                while True:
+                    candidates = self.snapshot.search(embedding, window)
+                    ranked = keyset_page(candidates, limit, after_score, after_id, exclude)
+                    # Ties at the edge of the window are cut in no particular order, so
+                    # widen it until everything left outside scores below this page
+                    if len(candidates) < window or (len(ranked) == limit and candidates[-1][1] < ranked[-1][1]):
+                        break
+                    window *= 2
+            if ranked:
+                with stage('vector_sql'):
+                    cur.execute("""
+                        SELECT p.id, p.name, p.neighborhood, p.tags, p.price_range,
+                            p.snippet, p.hours, p.amenities
+                        FROM search_places p
+                        WHERE p.id = ANY(%s)
+                    """, ([place_id for place_id, _ in ranked],))
+                    rows = {row[0]: row for row in cur.fetchall()}
+                return [
+                    rows[place_id] + (similarity, similarity)
+                    for place_id, similarity in ranked if place_id in rows
+                ]
         
-        # Expand the query with related terms
-        expanded_query = self.expand_query(parsed_query)
-        logger.info(f"Expanded query: '{expanded_query}'")
+        query, params = self._ranked_places_query(
+            embedding, limit, neighborhood, where_clauses, filter_params,
+            after_score, after_similarity, after_id, exclude_ids, offset
+        )
+        with stage('vector_sql'):
+            cur.execute(query, params)
+            return cur.fetchall()
+    
+    def _ranked_places_query(self, embedding, limit, neighborhood=None,
+                             where_clauses=None, filter_params=None,
+                             after_score=None, after_similarity=None, after_id=None,
+                             exclude_ids=None, offset=0):
+        """
+        Build the vector ranking SQL used by _fetch_ranked_places.
         
-        # Get the expanded query embedding
-        expanded_embedding, _ = self.generate_embedding(expanded_query)
+        When a neighborhood is given, candidates come from two stages: the
+        global nearest neighbors and the nearest neighbors inside the target
+        (and adjacent) neighborhoods, so in-area places always get ranked.
         
-        # Extract location if present
-        neighborhood = parsed_query['location']
+        Rows are ordered by score, then unboosted similarity, then id.
+        Later pages keep only places that come after the last row of the
+        previous page in that order (after_score, after_similarity, after_id)
+        and are not in exclude_ids; offset is how many places earlier pages
+        showed, so candidate pools grow to cover them.
         
-        conn, cur = self._connect_db()
-        try:
-            # Run search with the expanded embedding
-            search_params = [expanded_embedding]
-            
-            base_query = """
-            SELECT 
+        Returns:
+            Tuple of (query, params) using %s placeholders
+        """
+        # Places without an embedding only serve full-text search
+        where_clauses = ["p.embedding IS NOT NULL"] + list(where_clauses or [])
+        filter_params = list(filter_params or [])
+        columns = """
                 p.id, p.name, p.neighborhood, p.tags, p.price_range,
-                p.combined_description, p.hours, p.amenities,
-                1 - (e.embedding <=> %s::vector) as similarity
-            FROM places p
-            JOIN embeddings e ON p.id = e.place_id
+                p.snippet, p.hours, p.amenities"""
+        
+        target_key = normalize_neighborhood(neighborhood)
+        if not target_key:
+            if after_score is not None:
+                keyset_sql, keyset_params = keyset_condition(
+                    [("1 - (p.embedding <=> %s::vector)", [embedding], after_score)], "p.id", after_id
+                )
+                where_clauses.append(keyset_sql)
+                filter_params.extend(keyset_params)
+            if exclude_ids:
+                where_clauses.append("p.id <> ALL(%s)")
+                filter_params.append(list(exclude_ids))
+            where_sql = " WHERE " + " AND ".join(where_clauses)
+            # Without a location nothing is boosted, so both similarities match
+            query = f"""
+            SELECT ranked.*, ranked.similarity AS raw_similarity
+            FROM (
+                SELECT {columns},
+                    1 - (p.embedding <=> %s::vector) AS similarity
+                FROM search_places p
+                {where_sql}
+                ORDER BY similarity DESC, p.id
+                LIMIT %s
+            ) ranked
+            ORDER BY ranked.similarity DESC, ranked.id
             """
+            return query, [embedding] + filter_params + [limit]
+        
+        # Prefix patterns match sub-areas too (e.g. "midtown" covers "midtown south")
+        # and can use the text_pattern_ops index on neighborhood_key
+        target_pattern = target_key + '%'
+        adjacent_patterns = [
+            normalize_neighborhood(adj) + '%'
+            for adj in get_adjacent_neighborhoods(neighborhood)
+            if normalize_neighborhood(adj)
+        ]
+        area_patterns = [target_pattern] + adjacent_patterns
+        area_sql = "(" + " OR ".join(["p.neighborhood_key LIKE %s"] * len(area_patterns)) + ")"
+        adjacent_sql = (
+            "(" + " OR ".join(["p.neighborhood_key LIKE %s"] * len(adjacent_patterns)) + ")"
+            if adjacent_patterns else "FALSE"
+        )
+        
+        pool_where = " WHERE " + " AND ".join(where_clauses)
+        local_where = " WHERE " + " AND ".join([area_sql] + where_clauses)
+        
+        # Continuation pages filter on the boosted score, which only exists after boosting
+        page_clauses = []
+        page_params = []
+        if after_score is not None:
+            keys = [("b.boosted_similarity", [], after_score)]
+            if after_similarity is not None:
+                keys.append(("b.similarity", [], after_similarity))
+            keyset_sql, keyset_params = keyset_condition(keys, "b.place_id", after_id)
+            page_clauses.append(keyset_sql)
+            page_params.extend(keyset_params)
+        if exclude_ids:
+            page_clauses.append("b.place_id <> ALL(%s)")
+            page_params.append(list(exclude_ids))
+        page_where = " WHERE " + " AND ".join(page_clauses) if page_clauses else ""
+        pool_size = offset + limit
+        
+        query = f"""
+        WITH global_pool AS (
+            SELECT p.id AS place_id, p.embedding <=> %s::vector AS distance
+            FROM search_places p
+            {pool_where}
+            ORDER BY distance
+            LIMIT %s
+        ),
+        local_pool AS (
+            SELECT p.id AS place_id, p.embedding <=> %s::vector AS distance
+            FROM search_places p
+            {local_where}
+            ORDER BY distance
+            LIMIT %s
+        ),
+        candidates AS (
+            SELECT place_id, MIN(distance) AS distance
+            FROM (
+                SELECT place_id, distance FROM global_pool
+                UNION ALL
+                SELECT place_id, distance FROM local_pool
+            ) pooled
+            GROUP BY place_id
+        ),
+        scored AS (
+            SELECT
+                c.place_id,
+                1 - c.distance AS similarity,
+                CASE
+                    WHEN p.neighborhood_key LIKE %s THEN 1
+                    WHEN {adjacent_sql} THEN 2
+                    ELSE 0
+                END AS tier
+            FROM candidates c
+            JOIN search_places p ON p.id = c.place_id
+        ),
+        boosted AS (
+            SELECT
+                s.place_id,
+                s.similarity,
+                LEAST(s.similarity * CASE
+                    WHEN s.tier = 1 THEN %s
+                    WHEN s.tier = 2 AND COUNT(*) FILTER (WHERE s.tier = 1) OVER () < %s THEN %s
+                    ELSE 1.0
+                END, 1.0) AS boosted_similarity
+            FROM scored s
+        )
+        SELECT {columns},
+            b.boosted_similarity AS similarity,
+            b.similarity AS raw_similarity
+        FROM boosted b
+        JOIN search_places p ON p.id = b.place_id
+        {page_where}
+        ORDER BY b.boosted_similarity DESC, b.similarity DESC, b.place_id
+        LIMIT %s
+        """
+        params = (
+            [embedding] + filter_params + [pool_size * 2]
+            + [embedding] + area_patterns + filter_params + [pool_size]
+            + [target_pattern] + adjacent_patterns
+            + [NEIGHBORHOOD_BOOST, MIN_NEIGHBORHOOD_RESULTS, ADJACENT_NEIGHBORHOOD_BOOST]
+            + page_params + [limit]
+        )
+        return query, params
+    
+    def _fetch_lexical_places(self, cur, text, limit, where_clauses=None,
+                              filter_params=None, match_all=False, embedding=None,
+                              after_score=None, after_id=None, exclude_ids=None):
+        """
+        Full-text search over places.search_vector.
+        
+        Args:
+            match_all: Require every query term (exact match) instead of any term
+            embedding: If given, report vector similarity; without one it is None
+            after_score, after_id, exclude_ids: Keyset continuation on the text rank
             
-            # Add amenity filtering if needed
-            where_clauses = []
-            if amenity_filter and parsed_query['amenities']:
-                for amenity in parsed_query['amenities']:
-                    where_clauses.append("(p.amenities->%s)::boolean IS TRUE")
-                    search_params.append(amenity)
-            
-            if where_clauses:
-                base_query += " WHERE " + " AND ".join(where_clauses)
-            
-            base_query += " ORDER BY similarity DESC LIMIT %s"
-            search_params.append(limit * 2)  # Get more results initially for neighborhood filtering
-            
-            # Execute the query
-            cur.execute(base_query, search_params)
-            results = cur.fetchall()
-            
-            # Apply neighborhood filtering/boosting if present
-            boosted_places = set()
-            
-            if neighborhood:
-                # Track original similarities before boosting for analysis
-                original_similarities = {result[0]: result[8] for result in results}
-                
-                # Boost places in the target neighborhood
-                boosted_results = []
-                other_results = []
-                neighborhood_pattern = neighborhood.lower()
-                
-                for result in results:
-                    place_id, name, result_neighborhood = result[0], result[1], result[2]
-                    
-                    if result_neighborhood and neighborhood_pattern in result_neighborhood.lower():
-                        # Apply boost (10% increase in similarity)
-                        boosted_similarity = result[8] * 1.1
-                        if boosted_similarity > 1.0:
-                            boosted_similarity = 1.0
-                        
-                        # Create new result tuple with boosted similarity
-                        new_result = result[:8] + (boosted_similarity,)
-                        boosted_results.append(new_result)
-                        boosted_places.add(place_id)
-                    else:
-                        other_results.append(result)
-                
-                # Combine boosted and regular results
-                results = boosted_results + other_results
-                
-                # If very few results in target neighborhood, try adjacent neighborhoods
-                if len(boosted_results) < 3:
-                    adjacent_neighborhoods = get_adjacent_neighborhoods(neighborhood)
-                    if adjacent_neighborhoods:
-                        for result in other_results:
-                            place_id, name, result_neighborhood = result[0], result[1], result[2]
-                            if (result_neighborhood and 
-                                any(adj.lower() in result_neighborhood.lower() for adj in adjacent_neighborhoods)):
-                                # Apply smaller boost (5%)
-                                boosted_similarity = result[8] * 1.05
-                                if boosted_similarity > 1.0:
-                                    boosted_similarity = 1.0
-                                
-                                # Create new result tuple with boosted similarity
-                                new_result = result[:8] + (boosted_similarity,)
-                                boosted_results.append(new_result)
-                                boosted_places.add(place_id)
-                        
-                        # Re-combine results
-                        results = boosted_results + [r for r in other_results if r[0] not in [br[0] for br in boosted_results]]
+        Returns:
+            Rows in the same shape as _fetch_ranked_places plus the text rank,
+            ordered by text rank
+        """
+        query, params = self._lexical_places_query(
+            text, limit, where_clauses, filter_params, match_all, embedding,
+            after_score, after_id, exclude_ids
+        )
+        with stage('lexical_sql'):
+            cur.execute(query, params)
+            return cur.fetchall()
+    
+    def _lexical_places_query(self, text, limit, where_clauses=None,
+                              filter_params=None, match_all=False, embedding=None,
+                              after_score=None, after_id=None, exclude_ids=None):
+        """Build the full-text SQL used by _fetch_lexical_places, as (query, params)"""
+        where_clauses = list(where_clauses or [])
+        filter_params = list(filter_params or [])
+        if after_score is not None:
+            keyset_sql, keyset_params = keyset_condition(
+                [("ts_rank_cd(p.search_vector, q.query, 32)", [], after_score)], "p.id", after_id
+            )
+            where_clauses.append(keyset_sql)
+            filter_params.extend(keyset_params)
+        if exclude_ids:
+            where_clauses.append("p.id <> ALL(%s)")
+            filter_params.append(list(exclude_ids))
+        
+        if match_all:
+            tsquery = "plainto_tsquery('english', %s)"
+        else:
+            # OR the terms together so partial matches still rank
+            tsquery = "replace(plainto_tsquery('english', %s)::text, '&', '|')::tsquery"
+        
+        if embedding is not None:
+            score_sql = "1 - (p.embedding <=> %s::vector)"
+            score_params = [embedding]
+            # Scored rows need a vector to be compared with
+            where_clauses.append("p.embedding IS NOT NULL")
+        else:
+            # The text rank is no similarity, and shown as one it reads as a bogus "% match"
+            score_sql = "NULL::float8"
+            score_params = []
+        
+        where_sql = " AND ".join(["p.search_vector @@ q.query"] + where_clauses)
+        # Normalization 32 maps the rank into [0, 1)
+        query = f"""
+        SELECT
+            p.id, p.name, p.neighborhood, p.tags, p.price_range,
+            p.snippet, p.hours, p.amenities,
+            {score_sql} AS similarity,
+            {score_sql} AS raw_similarity,
+            ts_rank_cd(p.search_vector, q.query, 32) AS rank
+        FROM search_places p
+        CROSS JOIN (SELECT {tsquery} AS query) q
+        WHERE {where_sql}
+        ORDER BY rank DESC, p.id
+        LIMIT %s
+        """
+        return query, score_params * 2 + [text] + filter_params + [limit]
+    
+    def _fuse_ranked_results(self, *ranked_lists, limit=10):
+        """
+        Combine ranked result lists with reciprocal rank fusion.
+        
+        Rows from earlier lists win when a place appears in several, so the
+        vector leg's (boosted) similarity is kept for display.
+        """
+        scores = {}
+        rows = {}
+        for ranked in ranked_lists:
+            for rank, row in enumerate(ranked, 1):
+                place_id = row[0]
+                scores[place_id] = scores.get(place_id, 0.0) + 1.0 / (RRF_K + rank)
+                rows.setdefault(place_id, row)
+        
+        fused = sorted(rows, key=lambda place_id: scores[place_id], reverse=True)
+        return [rows[place_id] for place_id in fused[:limit]]
+    
+    def is_lexical_query(self, parsed_query):
+        """Check whether a query is short and literal enough for the full-text fast path"""
+        # cleaned_query has the location stripped; full-text search can't boost by neighborhood
+        if parsed_query['location']:
+            return False
+        
+        terms = re.findall(r'\w+', parsed_query['cleaned_query'] or '')
+        if not terms or len(terms) > LEXICAL_FAST_PATH_MAX_TERMS:
+            return False
+        
+        # Vibe, activity, price and time terms rely on query expansion
+        return not any(parsed_query[category] for category in ('vibe', 'activity', 'price', 'time'))
+    
+    def _format_search_results(self, results):
+        """Trim ranked rows down to what the frontend needs; tags and snippet come ready from search_places"""
+        return [result[:6] + (result[8],) for result in results]
+    
+    def canonical_amenity_key(self, amenity):
+        """Convert an amenity term like 'outdoor seating' into its stored key 'outdoor_seating'"""
+        return re.sub(r'[\s\-]+', '_', amenity.strip().lower())
+    
+    def _query_filters(self, parsed_query, amenity_filter=True, open_at=None, hours_slot=None):
+        """
+        Build SQL pre-filters for the structured parts of a parsed query.
+        
+        Amenities become a single JSONB containment filter. Only amenities that
+        ingestion can extract are filtered on; the rest are left to semantic
+        matching rather than excluding every place. Price terms filter on
+        price_level and time terms on the hour flag columns. "Open now" (or an
+        explicit open_at datetime) is a single bit test on hours_bitmap; pass
+        hours_slot to test a slot computed earlier (a cursor's first page).
+        
+        Returns:
+            Tuple of (where_clauses, filter_params)
+        """
+        where_clauses = []
+        filter_params = []
+        
+        if amenity_filter:
+            required = {}
+            for amenity in parsed_query['amenities']:
+                key = self.canonical_amenity_key(amenity)
+                if key in AMENITY_PATTERNS:
+                    required[key] = True
+            
+            if required:
+                # @> can be answered from the jsonb_path_ops GIN index on places.amenities
+                where_clauses.append("p.amenities @> %s::jsonb")
+                filter_params.append(json.dumps(required))
+        
+        if parsed_query.get('price_level'):
+            where_clauses.append("p.price_level BETWEEN %s AND %s")
+            filter_params.extend(parsed_query['price_level'])
+        
+        # Places with unknown hours are kept (NULL flags), only known mismatches are dropped
+        for flag in parsed_query.get('hour_flags', []):
+            if flag in HOUR_FLAGS:
+                where_clauses.append(f"p.{flag} IS NOT FALSE")
+        
+        if hours_slot is not None or open_at is not None or parsed_query.get('open_now'):
+            # NULL bitmaps (unknown hours) never pass an explicit open-at filter
+            where_clauses.append("get_bit(p.hours_bitmap, %s) = 1")
+            filter_params.append(hours_slot if hours_slot is not None else self.hours_slot(open_at))
+        
+        return where_clauses, filter_params
+    
+    def _lexical_fast_path(self, query, parsed_query, limit, where_clauses, filter_params, mode):
+        """
+        Answer a query from the full-text index alone when the mode allows it.
+        
+        Returns:
+            Ranked rows, or None if the query needs the vector search
+        """
+        if not (mode == 'lexical' or (mode == 'hybrid' and self.is_lexical_query(parsed_query))):
+            return None
+        
+        conn, cur = self._connect_db()
+        try:
+            lexical_results = self._fetch_lexical_places(
+                cur, parsed_query['cleaned_query'] or parsed_query['original_query'], limit,
+                where_clauses=where_clauses,
+                filter_params=filter_params,
+                match_all=(mode == 'hybrid')
+            )
+            if mode == 'lexical' or len(lexical_results) >= min(limit, LEXICAL_FAST_PATH_MIN_RESULTS):
+                diagnostics_logger.info("Lexical search for '%s' returned %d results", query, len(lexical_results))
+                return lexical_results
+        except Exception as e:
+            logger.error(f"Error in lexical search: {str(e)}")
+            conn.rollback()
+            if mode == 'lexical':
+                return []
+        finally:
+            cur.close()
+            conn.close()
+        return None
+    
+    def _retrieve_ranked_places(self, cur, parsed_query, embedding, embedding_key, limit, where_clauses,
+                                filter_params, mode, change_seq):
+        """
+        Rank places for an embedded query, fusing in the full-text leg in hybrid mode.
+        
+        A near-duplicate of a cached query ("cozy coffee shop" / "cosy coffee shops")
+        reuses its ranked candidates; filters, mode and cache version must match exactly.
+        Rankings are only cached if no place change was applied since change_seq.
+        
+        Returns:
+            Tuple of (top results, vector leg results, embedding cache key); later pages
+            continue from the vector leg, re-ranking with the embedding under that key
+        """
+        partition = partition_key(
+            self.cache_version(), mode, limit, parsed_query['location'], where_clauses, filter_params
+        )
+        with stage('semantic_cache'):
+            cached, _ = self.semantic_cache.lookup(partition, embedding)
+        if cached is not None:
+            # Later pages continue from the cached query's embedding, keeping the cursor consistent
+            return cached[:3]
+        
+        # Rank with the expanded embedding; neighborhood boosts are applied in SQL
+        vector_results = self._fetch_ranked_places(
+            cur, embedding, limit,
+            neighborhood=parsed_query['location'],
+            where_clauses=where_clauses,
+            filter_params=filter_params
+        )
+        
+        if mode == 'hybrid':
+            # Full-text leg, scored by vector similarity so results stay comparable
+            lexical_results = self._fetch_lexical_places(
+                cur, parsed_query['cleaned_query'] or parsed_query['original_query'], limit,
+                where_clauses=where_clauses,
+                filter_params=filter_params,
+                embedding=embedding
+            )
+            with stage('fusion'):
+                top_results = self._fuse_ranked_results(vector_results, lexical_results, limit=limit)
+        else:
+            top_results = vector_results
+        
+        if top_results and change_seq == self._change_seq:
+            self.semantic_cache.store(
+                partition, embedding,
+                (top_results, vector_results, embedding_key, limit, self._filter_kinds(where_clauses))
+            )
+        return top_results, vector_results, embedding_key
+    
+    def _search_fingerprint(self, query, mode, amenity_filter, filter_params):
+        """Fingerprint tying pagination cursors to one query, mode and filter set"""
+        return cursor_fingerprint(self.model, query, mode, amenity_filter, filter_params)
+    
+    def _search_filters(self, query, parsed_query, mode, amenity_filter, open_at, state=None):
+        """
+        SQL filters and cursor fingerprint for a search, continuing from a decoded cursor if given.
+        
+        The open-now hours slot is fixed when the first page is ranked and kept
+        in its cursor, so later pages filter on the same slot (and match the
+        same fingerprint) after a quarter-hour boundary has passed.
+        
+        Returns:
+            Tuple of (where_clauses, filter_params, fingerprint, hours slot or None)
+        
+        Raises:
+            InvalidCursor: If the cursor was issued for another search
+        """
+        hours_slot = self.search_hours_slot(query, open_at)
+        if state is not None and state.get('h') is not None:
+            if state['h'] >= HOURS_BITMAP_BITS:
+                raise InvalidCursor("Cursor hours slot is invalid")
+            hours_slot = state['h']
+        
+        where_clauses, filter_params = self._query_filters(parsed_query, amenity_filter, open_at, hours_slot)
+        fingerprint = self._search_fingerprint(query, mode, amenity_filter, filter_params)
+        if state is not None:
+            check_cursor_fingerprint(state, fingerprint)
+        return where_clauses, filter_params, fingerprint, hours_slot
+    
+    def _page_cursor(self, fingerprint, rows, limit, leg, ranked=None, sticky=(), offset=0, **state):
+        """
+        Build the cursor for the page after rows, or None if this was the last page.
+        
+        Pages continue from the last row of the ranking they came from (ranked,
+        defaulting to rows). In hybrid mode the first page mixes in full-text
+        matches, so places shown out of vector order stay excluded ("sticky")
+        on every later page.
+        
+        Args:
+            leg: 'vector' or 'lexical', the ranking later pages continue
+            state: Extra fields for the cursor (embedding cache key, match_all, hours slot)
+        """
+        # Deeper pages would be rejected by decode_cursor, so this is the last one
+        if len(rows) < limit or offset + len(rows) > MAX_CURSOR_OFFSET:
+            return None
+        
+        shown = [row[0] for row in rows]
+        shown_ids = set(shown)
+        
+        # Continue after the longest prefix of the ranking that was shown in full
+        ranked = rows if ranked is None else ranked
+        prefix = []
+        for row in ranked:
+            if row[0] not in shown_ids:
+                break
+            prefix.append(row[0])
+        position = ranked[len(prefix) - 1] if prefix else None
+        
+        prefix_ids = set(prefix)
+        sticky = list(sticky) + [
+            place_id for place_id in shown
+            if place_id not in prefix_ids and place_id not in sticky
+        ]
+        
+        return encode_cursor(dict(
+            state,
+            f=fingerprint,
+            leg=leg,
+            # Full-text rows carry their text rank after the similarities
+            score=(position[10] if leg == 'lexical' else position[8]) if position else None,
+            r=position[9] if position else None,
+            i=position[0] if position else None,
+            x=list(dict.fromkeys(sticky + shown)),
+            s=sticky,
+            n=offset + len(rows)
+        ))
+    
+    def _search_next_page(self, query, parsed_query, state, limit, where_clauses, filter_params):
+        """
+        Serve a page after the first from a decoded cursor.
+        
+        Vector pages reuse the cached query embedding (re-embedding only if this
+        process has evicted or never seen it) and run a keyset continuation
+        instead of re-ranking everything from the top.
+        
+        Returns:
+            Tuple of (formatted results, next cursor or None)
+        """
+        page = dict(after_score=state.get('score'), after_id=state.get('i'), exclude_ids=state.get('x'))
+        conn, cur = self._connect_db()
+        try:
+            if state.get('leg') == 'lexical':
+                rows = self._fetch_lexical_places(
+                    cur, parsed_query['cleaned_query'] or query, limit,
+                    where_clauses=where_clauses,
+                    filter_params=filter_params,
+                    match_all=state.get('all', False),
+                    **page
+                )
+            else:
+                embedding = self.cached_query_embedding(state.get('key'))
+                if embedding is None:
+                    embedding, _ = self.embed_query(self.expand_query(parsed_query), 'embed_expanded')
+                if not embedding:
+                    logger.error("Failed to generate embedding for search query")
+                    return [], None
+                rows = self._fetch_ranked_places(
+                    cur, embedding, limit,
+                    neighborhood=parsed_query['location'],
+                    where_clauses=where_clauses,
+                    filter_params=filter_params,
+                    after_similarity=state.get('r'),
+                    offset=state.get('n', 0),
+                    **page
+                )
             
-            # Sort by similarity and get top results
-            results.sort(key=lambda x: x[8], reverse=True)
-            top_results = results[:limit]
+            cursor = self._page_cursor(
+                state['f'], rows, limit, state.get('leg'),
+                sticky=state.get('s', []),
+                offset=state.get('n', 0),
+                key=state.get('key'),
+                all=state.get('all', False),
+                h=state.get('h')
+            )
+            return self._format_search_results(rows), cursor
+        
+        except Exception as e:
+            logger.error(f"Error fetching next search page: {str(e)}")
+            logger.error(traceback.format_exc())
+            conn.rollback()
+            return [], None
+        finally:
+            cur.close()
+            conn.close()
+    
+    def search_places_with_meaningful_breakdown(self, query, limit=10, amenity_filter=True, mode='vector',
+                                                open_at=None):
+        """
+        Enhanced version of search that provides a more meaningful breakdown
+        of why certain places match a query better than others
+        
+        Args:
+            mode: 'vector', 'hybrid' (vector + full-text fused with RRF, with a
+                lexical fast path for short queries) or 'lexical'
+            open_at: Only return places open at this datetime
+        """
+        results, _ = self.search_places_page(query, limit, amenity_filter, mode, open_at)
+        return results
+    
+    def _log_breakdown(self, cur, query, expanded_query, original_embedding, neighborhood, top_results):
+        """Log why the top results matched: location boosts, query expansion, tags and amenities"""
+        original_query = query
+        
+        # ======= MEANINGFUL BREAKDOWN ANALYSIS =======
+        diagnostics_logger.info("=" * 50)
+        diagnostics_logger.info(f"MEANINGFUL BREAKDOWN FOR QUERY: '{query}'")
+        diagnostics_logger.info("=" * 50)
+        
+        if neighborhood:
+            diagnostics_logger.info(f"Location filter: {neighborhood}")
+        
+        # Compare expanded vs. original query
+        if expanded_query != original_query:
+            diagnostics_logger.info(f"Query was expanded from: '{original_query}'")
+            diagnostics_logger.info(f"Expanded to: '{expanded_query}'")
+        
+        # For each top result, provide a meaningful breakdown
+        for i, result in enumerate(top_results[:5], 1):
+            place_id, name, result_neighborhood = result[0], result[1], result[2]
+            tags, price_range = result[3], result[4]
+            description, hours, amenities, similarity = result[5], result[6], result[7], result[8]
             
-            # ======= MEANINGFUL BREAKDOWN ANALYSIS =======
-            logger.info("=" * 50)
-            logger.info(f"MEANINGFUL BREAKDOWN FOR QUERY: '{query}'")
-            logger.info("=" * 50)
+            diagnostics_logger.info(f"\n{i}. {name} ({result_neighborhood}) - Similarity: {similarity:.4f}")
             
-            if neighborhood:
-                logger.info(f"Location filter: {neighborhood}")
+            # Check if neighborhood boosting was applied
+            original_sim = result[9]
+            if similarity != original_sim and original_sim:
+                boost_amount = ((similarity - original_sim) / original_sim) * 100
+                diagnostics_logger.info(f"   ⭐ Location boost applied: +{boost_amount:.1f}% (from {original_sim:.4f} to {similarity:.4f})")
             
-            # Compare expanded vs. original query
+            # Get similarity with original query vs expanded query
             if expanded_query != original_query:
-                logger.info(f"Query was expanded from: '{original_query}'")
-                logger.info(f"Expanded to: '{expanded_query}'")
-            
-            # For each top result, provide a meaningful breakdown
-            for i, result in enumerate(top_results[:5], 1):
-                place_id, name, result_neighborhood = result[0], result[1], result[2]
-                tags, price_range = result[3], result[4]
-                description, hours, amenities, similarity = result[5], result[6], result[7], result[8]
-                
-                logger.info(f"\n{i}. {name} ({result_neighborhood}) - Similarity: {similarity:.4f}")
-                
-                # Check if neighborhood boosting was applied
-                if place_id in boosted_places:
-                    original_sim = original_similarities.get(place_id, 0)
-                    boost_amount = ((similarity - original_sim) / original_sim) * 100
-                    logger.info(f"   ⭐ Location boost applied: +{boost_amount:.1f}% (from {original_sim:.4f} to {similarity:.4f})")
-                
-                # Get similarity with original query vs expanded query
-                if expanded_query != original_query:
-                    # Get similarity with just the original query embedding
-                    cur.execute(
-                        """
-                        SELECT 1 - (e.embedding <=> %s::vector) as original_similarity
-                        FROM embeddings e 
-                        WHERE e.place_id = %s
-                        """,
-                        (original_embedding, place_id)
-                    )
-                    original_similarity = cur.fetchone()[0]
-                    
-                    # Calculate the impact of query expansion
-                    expansion_impact = ((similarity - original_similarity) / original_similarity) * 100
-                    logger.info(f"   📈 Expansion impact: {expansion_impact:+.1f}% (from {original_similarity:.4f} to {similarity:.4f})")
-                
-                # Extract key information from the place
-                logger.info(f"   📝 Description snippet: {description[:150]}..." if description else "   No description available")
+                # Get similarity with just the original query embedding
+                cur.execute(
+                    """
+                    SELECT 1 - (e.embedding <=> %s::vector) as original_similarity
+                    FROM embeddings e 
+                    WHERE e.place_id = %s
+                    """,
+                    (original_embedding, place_id)
+                )
+                original_similarity = cur.fetchone()[0]
                 
-                # Check for matching tags
-                if tags and isinstance(tags, list):
-                    matching_tags = []
-                    for tag in tags:
-                        for term in query.lower().split():
-                            if term in tag.lower():
-                                matching_tags.append(tag)
-                                break
-                    
-                    if matching_tags:
-                        logger.info(f"   🏷️ Matching tags: {', '.join(matching_tags)}")
+                # Calculate the impact of query expansion
+                expansion_impact = ((similarity - original_similarity) / original_similarity) * 100
+                diagnostics_logger.info(f"   📈 Expansion impact: {expansion_impact:+.1f}% (from {original_similarity:.4f} to {similarity:.4f})")
+            
+            # Extract key information from the place
+            diagnostics_logger.info(f"   📝 Description snippet: {description[:150]}..." if description else "   No description available")
+            
+            # Check for matching tags
+            if tags and isinstance(tags, list):
+                matching_tags = []
+                for tag in tags:
+                    for term in query.lower().split():
+                        if term in tag.lower():
+                            matching_tags.append(tag)
+                            break
                 
-                # Check for matching amenities
-                if amenities and isinstance(amenities, dict):
-                    matching_amenities = []
-                    for amenity, value in amenities.items():
-                        if value and any(term in amenity.lower() for term in query.lower().split()):
-                            matching_amenities.append(amenity)
-                    
-                    if matching_amenities:
-                        logger.info(f"   ✅ Matching amenities: {', '.join(matching_amenities)}")
+                if matching_tags:
+                    diagnostics_logger.info(f"   🏷️ Matching tags: {', '.join(matching_tags)}")
+            
+            # Check for matching amenities
+            if amenities and isinstance(amenities, dict):
+                matching_amenities = []
+                for amenity, value in amenities.items():
+                    if value and any(term in amenity.lower() for term in query.lower().split()):
+                        matching_amenities.append(amenity)
                 
-                # Show price range if relevant to query
-                if price_range and any(term in query.lower() for term in ["cheap", "affordable", "expensive", "price", "cost"]):
-                    logger.info(f"   💰 Price: {price_range}")
+                if matching_amenities:
+                    diagnostics_logger.info(f"   ✅ Matching amenities: {', '.join(matching_amenities)}")
+            
+            # Show price range if relevant to query
+            if price_range and any(term in query.lower() for term in ["cheap", "affordable", "expensive", "price", "cost"]):
+                diagnostics_logger.info(f"   💰 Price: {price_range}")
+        
+        diagnostics_logger.info("=" * 50)
+    
+    def search_places_page(self, query, limit=10, amenity_filter=True, mode='vector', open_at=None,
+                           cursor=None):
+        """
+        One page of search_places_with_meaningful_breakdown results plus a cursor for the next.
+        
+        Args:
+            cursor: Token from a previous page; the query, mode and filters must match
+        
+        Returns:
+            Tuple of (formatted results, next cursor or None)
+        
+        Raises:
+            InvalidCursor: If the cursor is malformed or was issued for another search
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        
+        # Parse the query into categories
+        parsed_query = self.parse_query(query)
+        
+        # Add amenity, price and hours filtering if needed; later pages keep the first page's hours slot
+        state = decode_cursor(cursor) if cursor else None
+        where_clauses, filter_params, fingerprint, hours_slot = self._search_filters(
+            query, parsed_query, mode, amenity_filter, open_at, state
+        )
+        
+        if state is not None:
+            return self._search_next_page(query, parsed_query, state, limit, where_clauses, filter_params)
+        
+        # Popular searches are answered from the result cache until the data changes
+        result_key = (self.cache_version(), fingerprint, limit)
+        page = self.cached_search_page(result_key)
+        if page is not None:
+            return page
+        
+        change_seq = self._change_seq
+        results, next_cursor, embedding = self._search_first_page(
+            query, parsed_query, limit, where_clauses, filter_params, fingerprint, mode, change_seq, hours_slot
+        )
+        page = (results, next_cursor)
+        # A change applied mid-search may not be reflected in what was read; don't cache it
+        if results and change_seq == self._change_seq:
+            self.cache_search_page(result_key, page, embedding, self._filter_kinds(where_clauses))
+        return page
+    
+    def _search_first_page(self, query, parsed_query, limit, where_clauses, filter_params, fingerprint, mode,
+                           change_seq, hours_slot=None):
+        """
+        Rank the first page of a search; see search_places_page.
+        
+        Returns:
+            Tuple of (formatted results, next cursor or None, query embedding or None for full-text pages)
+        """
+        original_query = query
+        
+        # Full-text only paths never pay for an embedding call
+        lexical_results = self._lexical_fast_path(
+            query, parsed_query, limit, where_clauses, filter_params, mode
+        )
+        if lexical_results is not None:
+            next_cursor = self._page_cursor(
+                fingerprint, lexical_results, limit, 'lexical', all=(mode == 'hybrid'), h=hours_slot
+            )
+            return self._format_search_results(lexical_results), next_cursor, None
+        
+        if not self.has_pgvector:
+            logger.warning("pgvector extension not available, cannot perform search")
+            return [], None, None
+        
+        # The original query embedding is only used by the breakdown, so only sampled requests pay for it
+        log_breakdown = diagnostics_enabled()
+        if log_breakdown:
+            original_embedding, _ = self.embed_query(original_query, 'embed_original')
+        
+        # Expand the query with related terms
+        expanded_query = self.expand_query(parsed_query)
+        diagnostics_logger.info("Expanded query: '%s'", expanded_query)
+        
+        # Get the expanded query embedding; the cache key lets later pages reuse it
+        expanded_embedding, embedding_key = self.embed_query(expanded_query, 'embed_expanded')
+        
+        if not expanded_embedding:
+            logger.error("Failed to generate embedding for search query")
+            return [], None, None
+        
+        # Extract location if present
+        neighborhood = parsed_query['location']
+        
+        conn, cur = self._connect_db()
+        try:
+            top_results, vector_results, embedding_key = self._retrieve_ranked_places(
+                cur, parsed_query, expanded_embedding, embedding_key, limit, where_clauses, filter_params,
+                mode, change_seq
+            )
             
-            logger.info("=" * 50)
+            if log_breakdown:
+                with stage('breakdown'):
+                    self._log_breakdown(cur, query, expanded_query, original_embedding, neighborhood, top_results)
             
-            # Extract just what we need for the frontend
-            formatted_results = []
-            for result in top_results:
-                place_id, name, neighborhood, tags, price, description, _, _, similarity = result
-                
-                # Format tags
-                if tags and isinstance(tags, str):
-                    if tags.startswith('{') and tags.endswith('}'):
-                        tags = tags.strip('{}').split(',')
-                        tags = [tag.strip('"\'') for tag in tags]
-                
-                formatted_results.append((
-                    place_id, name, neighborhood, tags, price, 
-                    description[:200] + "..." if description and len(description) > 200 else description, 
-                    similarity
-                ))
+            next_cursor = self._page_cursor(
+                fingerprint, top_results, limit, 'vector', ranked=vector_results, key=embedding_key, h=hours_slot
+            )
             
-            return formatted_results
+            # Extract just what we need for the frontend
+            return self._format_search_results(top_results), next_cursor, expanded_embedding
             
         except Exception as e:
             logger.error(f"Error in search breakdown: {str(e)}")
             logger.error(traceback.format_exc())
             conn.rollback()
+            return [], None, None
+        finally:
+            cur.close()
+            conn.close()
+    
+    def _explain_result(self, result, query, original_similarity=None):
+        """
+        Explain why a ranked row matched, as a JSON-friendly dict.
+        
+        Mirrors the per-result breakdown that _log_breakdown writes to the log.
+        """
+        tags, amenities = result[3], result[7]
+        similarity, raw_similarity = result[8], result[9]
+        terms = query.lower().split()
+        explanation = {}
+        
+        if raw_similarity and similarity != raw_similarity:
+            explanation['location_boost'] = round((similarity - raw_similarity) / raw_similarity * 100, 1)
+        
+        if original_similarity and similarity is not None:
+            explanation['expansion_impact'] = round((similarity - original_similarity) / original_similarity * 100, 1)
+        
+        if tags and isinstance(tags, list):
+            matching_tags = [tag for tag in tags if any(term in tag.lower() for term in terms)]
+            if matching_tags:
+                explanation['matching_tags'] = matching_tags
+        
+        if amenities and isinstance(amenities, dict):
+            matching_amenities = [
+                amenity for amenity, value in amenities.items()
+                if value and any(term in amenity.lower() for term in terms)
+            ]
+            if matching_amenities:
+                explanation['matching_amenities'] = matching_amenities
+        
+        return explanation
+    
+    def _adjacent_backfill(self, cur, neighborhood, embedding, results, where_clauses, filter_params):
+        """
+        Fetch adjacent-neighborhood places when few results are in the requested one.
+        
+        Returns:
+            Ranked rows not already in results, at most MIN_NEIGHBORHOOD_RESULTS of them
+        """
+        target_key = normalize_neighborhood(neighborhood)
+        in_area = sum(
+            1 for row in results
+            if (normalize_neighborhood(row[2]) or '').startswith(target_key)
+        )
+        adjacent_patterns = [
+            normalize_neighborhood(adj) + '%'
+            for adj in get_adjacent_neighborhoods(neighborhood)
+            if normalize_neighborhood(adj)
+        ]
+        if in_area >= MIN_NEIGHBORHOOD_RESULTS or not adjacent_patterns:
             return []
+        
+        adjacent_sql = "(" + " OR ".join(["p.neighborhood_key LIKE %s"] * len(adjacent_patterns)) + ")"
+        query, params = self._ranked_places_query(
+            embedding, MIN_NEIGHBORHOOD_RESULTS - in_area,
+            where_clauses=list(where_clauses) + [adjacent_sql, "p.id <> ALL(%s)"],
+            filter_params=list(filter_params) + adjacent_patterns + [[row[0] for row in results]]
+        )
+        cur.execute(query, params)
+        return cur.fetchall()
+    
+    def stream_search_places(self, query, limit=10, amenity_filter=True, mode='vector', open_at=None):
+        """
+        Progressive version of search_places_with_meaningful_breakdown.
+        
+        Results are yielded as soon as retrieval finishes. Work that only adds
+        detail (google IDs, adjacent-neighborhood backfill, match explanations
+        that need the unexpanded query embedding) happens afterwards.
+        
+        Yields:
+            (event, payload) tuples, in order:
+            ('results', formatted result tuples)
+            ('enrichment', list of {'id', 'google_id'} dicts)
+            ('backfill', formatted result tuples), only when rows were added
+            ('enrichment', list of {'id', 'explanation'} dicts)
+            ('done', {'count': total results, 'next_cursor': cursor for the next page or None})
+            An ('error', {'error': message}) event ends the stream early on failure.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        
+        parsed_query = self.parse_query(query)
+        where_clauses, filter_params, fingerprint, hours_slot = self._search_filters(
+            query, parsed_query, mode, amenity_filter, open_at
+        )
+        neighborhood = parsed_query['location']
+        expanded_query = None
+        expanded_embedding = None
+        embedding_key = None
+        change_seq = self._change_seq
+        
+        top_results = self._lexical_fast_path(
+            query, parsed_query, limit, where_clauses, filter_params, mode
+        )
+        if top_results is None:
+            if not self.has_pgvector:
+                logger.warning("pgvector extension not available, cannot perform search")
+                yield 'error', {'error': "Vector search is not available"}
+                return
+            
+            # Only the expanded embedding is on the critical path; the original one is for explanations
+            expanded_query = self.expand_query(parsed_query)
+            expanded_embedding, embedding_key = self.embed_query(expanded_query, 'embed_expanded')
+            if not expanded_embedding:
+                yield 'error', {'error': "Failed to generate embedding for search query"}
+                return
+        
+        conn, cur = self._connect_db()
+        try:
+            vector_results = None
+            if expanded_embedding is not None:
+                top_results, vector_results, embedding_key = self._retrieve_ranked_places(
+                    cur, parsed_query, expanded_embedding, embedding_key, limit, where_clauses, filter_params,
+                    mode, change_seq
+                )
+            yield 'results', self._format_search_results(top_results)
+            
+            place_ids = [row[0] for row in top_results]
+            with stage('google_ids'):
+                cur.execute("SELECT id, google_id FROM search_places WHERE id = ANY(%s)", (place_ids,))
+                google_ids = dict(cur.fetchall())
+            yield 'enrichment', [
+                {'id': place_id, 'google_id': google_ids.get(place_id)} for place_id in place_ids
+            ]
+            
+            backfill = []
+            if neighborhood and expanded_embedding is not None:
+                with stage('backfill'):
+                    backfill = self._adjacent_backfill(
+                        cur, neighborhood, expanded_embedding, top_results, where_clauses, filter_params
+                    )
+                if backfill:
+                    yield 'backfill', self._format_search_results(backfill)
+            
+            # Backfilled places were shown too, so later pages must not repeat them, and
+            # they count towards the offset, which bounds how many ids a cursor may exclude
+            if vector_results is None:
+                next_cursor = self._page_cursor(
+                    fingerprint, top_results, limit, 'lexical', all=(mode == 'hybrid'), h=hours_slot
+                )
+            else:
+                next_cursor = self._page_cursor(
+                    fingerprint, top_results, limit, 'vector', ranked=vector_results,
+                    sticky=[row[0] for row in backfill], offset=len(backfill), key=embedding_key, h=hours_slot
+                )
+            
+            # Expansion impact compares against the embedding of the query as typed
+            ranked = top_results + backfill
+            original_similarities = {}
+            if expanded_query and expanded_query != query and ranked:
+                original_embedding, _ = self.embed_query(query, 'embed_original')
+                if original_embedding:
+                    with stage('explanations'):
+                        cur.execute("""
+                            SELECT place_id, 1 - (embedding <=> %s::vector)
+                            FROM embeddings
+                            WHERE place_id = ANY(%s) AND content_type = 'combined'
+                        """, (original_embedding, [row[0] for row in ranked]))
+                        original_similarities = dict(cur.fetchall())
+            
+            yield 'enrichment', [
+                {'id': row[0], 'explanation': self._explain_result(row, query, original_similarities.get(row[0]))}
+                for row in ranked
+            ]
+            yield 'done', {'count': len(ranked), 'next_cursor': next_cursor}
+        
+        except Exception as e:
+            logger.error(f"Error in streaming search: {str(e)}")
+            logger.error(traceback.format_exc())
+            conn.rollback()
+            yield 'error', {'error': "An error occurred during search"}
         finally:
             cur.close()
             conn.close()
@@ -1253,83 +2641,19 @@ class EmbeddingGenerator:
                 logger.error("Failed to generate embedding for search query")
                 return []
             
-            # Prepare parameters for search
-            search_params = []
-            
-            # Start with basic similarity search
-            base_query = """
-            SELECT 
-                p.id, p.name, p.neighborhood, p.tags, p.price_range,
-                p.combined_description,
-                1 - (e.embedding <=> %s::vector) as similarity
-            FROM places p
-            JOIN embeddings e ON p.id = e.place_id
-            """
-            search_params.append(query_embedding)
-            
             # Add filters based on parsed query
-            where_clauses = []
-            
-            # Handle amenity filtering
-            if amenity_filter and parsed_query['amenities']:
-                for amenity in parsed_query['amenities']:
-                    where_clauses.append("(p.amenities->%s)::boolean IS TRUE")
-                    search_params.append(amenity)
-            
-            # Add WHERE clause if needed
-            if where_clauses:
-                base_query += " WHERE " + " AND ".join(where_clauses)
-            
-            # Add ordering and limit
-            base_query += " ORDER BY similarity DESC LIMIT %s"
-            search_params.append(limit * 2)  # Get more results initially for neighborhood filtering
-            
-            # Execute the query
-            cur.execute(base_query, search_params)
-            results = cur.fetchall()
-            
-            # Apply neighborhood filtering/boosting if present
-            if neighborhood:
-                # Boost places in the target neighborhood
-                boosted_results = []
-                other_results = []
-                neighborhood_pattern = neighborhood.lower()
-                
-                for result in results:
-                    place_id, name, result_neighborhood, tags, price, desc, similarity = result
-                    
-                    if result_neighborhood and neighborhood_pattern in result_neighborhood.lower():
-                        # Apply boost (10% increase in similarity)
-                        boosted_similarity = similarity * 1.1
-                        if boosted_similarity > 1.0:
-                            boosted_similarity = 1.0
-                        boosted_results.append((place_id, name, result_neighborhood, tags, price, desc, boosted_similarity))
-                    else:
-                        other_results.append(result)
-                
-                # Combine boosted and regular results
-                results = boosted_results + other_results
-                
-                # If very few results in target neighborhood, try adjacent neighborhoods
-                if len(boosted_results) < 3:
-                    adjacent_neighborhoods = get_adjacent_neighborhoods(neighborhood)
-                    if adjacent_neighborhoods:
-                        for result in other_results:
-                            place_id, name, result_neighborhood, tags, price, desc, similarity = result
-                            if result_neighborhood and any(adj.lower() in result_neighborhood.lower() for adj in adjacent_neighborhoods):
-                                # Apply smaller boost (5%)
-                                boosted_similarity = similarity * 1.05
-                                if boosted_similarity > 1.0:
-                                    boosted_similarity = 1.0
-                                # Add to boosted results with adjusted similarity
-                                boosted_results.append((place_id, name, result_neighborhood, tags, price, desc, boosted_similarity))
-                        
-                        # Re-combine results
-                        results = boosted_results + [r for r in other_results if r[0] not in [br[0] for br in boosted_results]]
+            where_clauses, filter_params = self._query_filters(parsed_query, amenity_filter)
+            
+            # Rank in SQL, including neighborhood boosting
+            ranked = self._fetch_ranked_places(
+                cur, query_embedding, limit,
+                neighborhood=neighborhood,
+                where_clauses=where_clauses,
+                filter_params=filter_params
+            )
             
-            # Sort by similarity and limit results
-            results.sort(key=lambda x: x[6], reverse=True)
-            results = results[:limit]
+            # Keep the (id, name, neighborhood, tags, price, description, similarity) shape
+            results = [row[:6] + (row[8],) for row in ranked]
             
             return results
             
@@ -1343,7 +2667,7 @@ class EmbeddingGenerator:
             conn.close()
     
     def ensure_amenities_column(self):
-        """Ensure the amenities column exists in the places table"""
+        """Ensure the amenities column and its containment index exist in the places table"""
         conn, cur = self._connect_db()
         try:
             # Check if amenities column exists
@@ -1356,10 +2680,16 @@ class EmbeddingGenerator:
             if not cur.fetchone():
                 logger.info("Adding amenities column to places table")
                 cur.execute("ALTER TABLE places ADD COLUMN amenities JSONB DEFAULT '{}'::jsonb")
-                conn.commit()
                 logger.info("Added amenities column to places table")
             else:
                 logger.info("Amenities column already exists")
+            
+            # jsonb_path_ops supports the @> containment filters used in search
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_places_amenities
+                ON places USING GIN (amenities jsonb_path_ops)
+            """)
+            conn.commit()
                 
         except Exception as e:
             logger.error(f"Error adding amenities column: {str(e)}")
@@ -1368,32 +2698,466 @@ class EmbeddingGenerator:
             cur.close()
             conn.close()
     
+    def ensure_neighborhood_column(self):
+        """Ensure the normalized neighborhood_key column and its index exist"""
+        conn, cur = self._connect_db()
+        try:
+            # Check if neighborhood_key column exists
+            cur.execute("""
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name = 'places' AND column_name = 'neighborhood_key'
+            """)
+            
+            if not cur.fetchone():
+                logger.info("Adding neighborhood_key column to places table")
+                # Must stay in sync with location_extraction.normalize_neighborhood
+                cur.execute("""
+                    ALTER TABLE places ADD COLUMN neighborhood_key TEXT
+                    GENERATED ALWAYS AS (
+                        NULLIF(lower(btrim(regexp_replace(neighborhood, '\\s+', ' ', 'g'))), '')
+                    ) STORED
+                """)
+                logger.info("Added neighborhood_key column to places table")
+            else:
+                logger.info("neighborhood_key column already exists")
+            
+            # text_pattern_ops lets prefix LIKE patterns use the index
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_places_neighborhood_key
+                ON places (neighborhood_key text_pattern_ops)
+            """)
+            conn.commit()
+                
+        except Exception as e:
+            logger.error(f"Error adding neighborhood_key column: {str(e)}")
+            conn.rollback()
+        finally:
+            cur.close()
+            conn.close()
+    
+    def ensure_search_vector_column(self):
+        """Ensure the full-text search_vector column and its GIN index exist"""
+        conn, cur = self._connect_db()
+        try:
+            # array_to_string is only STABLE, so wrap it for use in a generated column
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION places_tags_text(tags TEXT[])
+                RETURNS TEXT LANGUAGE sql IMMUTABLE AS
+                $$ SELECT COALESCE(array_to_string(tags, ' '), '') $$
+            """)
+            
+            cur.execute("""
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name = 'places' AND column_name = 'search_vector'
+            """)
+            
+            if not cur.fetchone():
+                logger.info("Adding search_vector column to places table")
+                cur.execute("""
+                    ALTER TABLE places ADD COLUMN search_vector tsvector
+                    GENERATED ALWAYS AS (
+                        setweight(to_tsvector('english', COALESCE(name, '')), 'A') ||
+                        setweight(to_tsvector('english', places_tags_text(tags)), 'B') ||
+                        setweight(to_tsvector('english', COALESCE(combined_description, '')), 'C')
+                    ) STORED
+                """)
+                logger.info("Added search_vector column to places table")
+            else:
+                logger.info("search_vector column already exists")
+            
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_places_search_vector
+                ON places USING GIN (search_vector)
+            """)
+            conn.commit()
+                
+        except Exception as e:
+            logger.error(f"Error adding search_vector column: {str(e)}")
+            conn.rollback()
+        finally:
+            cur.close()
+            conn.close()
+    
+    def ensure_attribute_columns(self):
+        """Ensure the price_level, hour flag and hours_bitmap columns and their indexes exist"""
+        conn, cur = self._connect_db()
+        try:
+            cur.execute("""
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name = 'places' AND column_name = ANY(%s)
+            """, (['price_level', 'hours_bitmap'] + list(HOUR_FLAGS),))
+            existing = {row[0] for row in cur.fetchall()}
+            
+            if 'price_level' not in existing:
+                logger.info("Adding price_level column to places table")
+                cur.execute("ALTER TABLE places ADD COLUMN price_level SMALLINT")
+            
+            if 'hours_bitmap' not in existing:
+                logger.info("Adding hours_bitmap column to places table")
+                cur.execute(f"ALTER TABLE places ADD COLUMN hours_bitmap BIT({HOURS_BITMAP_BITS})")
+            
+            for flag in HOUR_FLAGS:
+                if flag not in existing:
+                    logger.info(f"Adding {flag} column to places table")
+                    cur.execute(f"ALTER TABLE places ADD COLUMN {flag} BOOLEAN")
+            
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_places_price_level ON places (price_level)")
+            # Partial indexes match the "flag IS NOT FALSE" filters used in search
+            for flag in HOUR_FLAGS:
+                cur.execute(f"""
+                    CREATE INDEX IF NOT EXISTS idx_places_{flag}
+                    ON places (id) WHERE {flag} IS NOT FALSE
+                """)
+            
+            conn.commit()
+            logger.info("Structured attribute columns are up to date")
+                
+        except Exception as e:
+            logger.error(f"Error adding structured attribute columns: {str(e)}")
+            conn.rollback()
+        finally:
+            cur.close()
+            conn.close()
+    
+    def ensure_search_table(self):
+        """
+        Ensure the search_places table and its indexes exist, and rebuild its rows.
+        
+        search_places holds one narrow row per place with everything search
+        reads, so ranking never joins places to embeddings or cleans rows in
+        Python. Write paths keep it current through refresh_search_rows; the
+        full rebuild here picks up places changed by anything else.
+        """
+        conn, cur = self._connect_db()
+        try:
+            # Copied into search rows; older databases only get it from the Google ID import
+            cur.execute("ALTER TABLE places ADD COLUMN IF NOT EXISTS google_id TEXT")
+            
+            flag_columns = "".join(f"{flag} BOOLEAN,\n                    " for flag in HOUR_FLAGS)
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS search_places (
+                    id INTEGER PRIMARY KEY REFERENCES places(id) ON DELETE CASCADE,
+                    name TEXT NOT NULL,
+                    neighborhood TEXT,
+                    neighborhood_key TEXT,
+                    tags TEXT[] NOT NULL DEFAULT '{{}}',
+                    price_range TEXT,
+                    snippet TEXT,
+                    hours JSONB,
+                    amenities JSONB,
+                    price_level SMALLINT,
+                    google_id TEXT,
+                    hours_bitmap BIT({HOURS_BITMAP_BITS}),
+                    {flag_columns}search_vector tsvector,
+                    embedding vector
+                )
+            """)
+            
+            # The same filter indexes as on places, since search now filters here
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_search_places_amenities
+                ON search_places USING GIN (amenities jsonb_path_ops)
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_search_places_neighborhood_key
+                ON search_places (neighborhood_key text_pattern_ops)
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_search_places_search_vector
+                ON search_places USING GIN (search_vector)
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_search_places_price_level ON search_places (price_level)")
+            for flag in HOUR_FLAGS:
+                cur.execute(f"""
+                    CREATE INDEX IF NOT EXISTS idx_search_places_{flag}
+                    ON search_places (id) WHERE {flag} IS NOT FALSE
+                """)
+            
+            count = refresh_search_rows(cur)
+            # The rebuild may pick up changes no write path announced; tell running workers
+            cur.execute("SELECT id FROM search_places")
+            notify_places_changed(cur, 'place', [row[0] for row in cur.fetchall()])
+            conn.commit()
+            logger.info(f"Rebuilt search_places with {count} places")
+        
+        except Exception as e:
+            logger.error(f"Error building search_places table: {str(e)}")
+            conn.rollback()
+        finally:
+            cur.close()
+            conn.close()
+    
+    def ensure_embedding_queue(self):
+        """
+        Ensure the embedding_queue table and the triggers that fill it exist.
+        
+        Statement-level triggers on places and reviews queue every place whose
+        embedded content an INSERT, UPDATE or DELETE changed, reading the
+        transition tables so a bulk update costs one trigger call. Updates that
+        touch only derived columns (search_vector, price_level, hour flags)
+        don't queue anything. The first run seeds the queue with the places the
+        old full scan would have found.
+        """
+        conn, cur = self._connect_db()
+        try:
+            cur.execute("SELECT to_regclass('embedding_queue') IS NULL")
+            created = cur.fetchone()[0]
+            
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_queue (
+                    place_id INTEGER PRIMARY KEY REFERENCES places(id) ON DELETE CASCADE,
+                    reason TEXT NOT NULL,
+                    queued_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+                    claimed_at TIMESTAMPTZ
+                )
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_embedding_queue_queued_at ON embedding_queue (queued_at)")
+            
+            # Re-queuing a queued place moves it to the back and drops any claim, so the
+            # run embedding the old content can't complete it (see complete_embedding_work)
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION queue_embedding_work(place_ids INTEGER[], work_reason TEXT)
+                RETURNS void LANGUAGE sql AS $$
+                    INSERT INTO embedding_queue (place_id, reason)
+                    SELECT id, work_reason FROM places WHERE id = ANY(place_ids)
+                    ON CONFLICT (place_id) DO UPDATE
+                    SET reason = EXCLUDED.reason, queued_at = clock_timestamp(), claimed_at = NULL
+                $$
+            """)
+            
+            changed = " OR ".join(f"n.{column} IS DISTINCT FROM o.{column}" for column in EMBEDDED_PLACE_COLUMNS)
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION queue_place_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+                BEGIN
+                    PERFORM queue_embedding_work(ARRAY(SELECT id FROM new_rows), 'place_insert');
+                    RETURN NULL;
+                END
+                $$
+            """)
+            cur.execute(f"""
+                CREATE OR REPLACE FUNCTION queue_place_update() RETURNS trigger LANGUAGE plpgsql AS $$
+                BEGIN
+                    PERFORM queue_embedding_work(ARRAY(
+                        SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id
+                        WHERE {changed}
+                    ), 'place_update');
+                    RETURN NULL;
+                END
+                $$
+            """)
+            # Reviews of a place being deleted cascade here; queue_embedding_work skips the missing place
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION queue_review_change() RETURNS trigger LANGUAGE plpgsql AS $$
+                BEGIN
+                    IF TG_OP = 'INSERT' THEN
+                        PERFORM queue_embedding_work(ARRAY(SELECT DISTINCT place_id FROM new_rows), 'review_insert');
+                    ELSIF TG_OP = 'UPDATE' THEN
+                        PERFORM queue_embedding_work(ARRAY(
+                            SELECT place_id FROM new_rows UNION SELECT place_id FROM old_rows
+                        ), 'review_update');
+                    ELSE
+                        PERFORM queue_embedding_work(ARRAY(SELECT DISTINCT place_id FROM old_rows), 'review_delete');
+                    END IF;
+                    RETURN NULL;
+                END
+                $$
+            """)
+            
+            triggers = [
+                ("places", "queue_place_insert", "INSERT", "NEW TABLE AS new_rows", "queue_place_insert"),
+                ("places", "queue_place_update", "UPDATE", "NEW TABLE AS new_rows OLD TABLE AS old_rows", "queue_place_update"),
+                ("reviews", "queue_review_insert", "INSERT", "NEW TABLE AS new_rows", "queue_review_change"),
+                ("reviews", "queue_review_update", "UPDATE", "NEW TABLE AS new_rows OLD TABLE AS old_rows", "queue_review_change"),
+                ("reviews", "queue_review_delete", "DELETE", "OLD TABLE AS old_rows", "queue_review_change"),
+            ]
+            # Transition tables can't be shared across events, so each event has its own trigger
+            for table, name, event, transitions, function in triggers:
+                cur.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+                cur.execute(f"""
+                    CREATE TRIGGER {name}
+                    AFTER {event} ON {table}
+                    REFERENCING {transitions}
+                    FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+                """)
+            
+            if created:
+                cur.execute("""
+                    INSERT INTO embedding_queue (place_id, reason)
+                    SELECT p.id, 'backfill'
+                    FROM places p
+                    LEFT JOIN embeddings e ON p.id = e.place_id
+                    WHERE e.id IS NULL OR p.updated_at > e.last_updated
+                    ON CONFLICT (place_id) DO NOTHING
+                """)
+                logger.info(f"Seeded embedding_queue with {cur.rowcount} places")
+            
+            conn.commit()
+        
+        except Exception as e:
+            logger.error(f"Error creating embedding queue: {str(e)}")
+            conn.rollback()
+        finally:
+            cur.close()
+            conn.close()
+    
+    def extract_structured_attributes(self):
+        """Persist price_level, hour flags and the weekly hours bitmap computed from price_range and hours"""
+        conn, cur = self._connect_db()
+        try:
+            cur.execute(f"""
+                SELECT id, price_range, hours, price_level, {", ".join(HOUR_FLAGS)}, hours_bitmap::text
+                FROM places
+            """)
+            places = cur.fetchall()
+            logger.info(f"Computing structured attributes for {len(places)} places")
+            
+            updates = []
+            for place_id, price_range, hours, *current in places:
+                processed_price = self.process_price_range(price_range)
+                processed_hours = self.process_business_hours(hours)
+                
+                price_level = processed_price['level'] if processed_price else None
+                # Unknown hours stay NULL so they are not filtered out
+                patterns = processed_hours['patterns'] if processed_hours else {}
+                flags = [patterns.get(flag) if patterns else None for flag in HOUR_FLAGS]
+                
+                hours_bitmap = self.compile_hours_bitmap(hours)
+                
+                # Only rows whose attributes changed are written, refreshed and announced
+                if [price_level] + flags + [hours_bitmap] != current:
+                    updates.append([price_level] + flags + [hours_bitmap, place_id])
+            
+            set_sql = ", ".join(
+                ["price_level = %s"]
+                + [f"{flag} = %s" for flag in HOUR_FLAGS]
+                + [f"hours_bitmap = %s::bit({HOURS_BITMAP_BITS})"]
+            )
+            execute_batch(cur, f"UPDATE places SET {set_sql} WHERE id = %s", updates)
+            updated_ids = [update[-1] for update in updates]
+            refresh_search_rows(cur, updated_ids)
+            # Price and hours filters changed; running app workers evict cached pages when this commits
+            notify_places_changed(cur, 'place', updated_ids)
+            conn.commit()
+            logger.info(f"Updated structured attributes for {len(updates)} places")
+            
+        except Exception as e:
+            logger.error(f"Error extracting structured attributes: {str(e)}")
+            conn.rollback()
+        finally:
+            cur.close()
+            conn.close()
+    
+    def ensure_neighbors_table(self):
+        """Ensure the place_neighbors table ("more like this" graph) exists"""
+        conn, cur = self._connect_db()
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS place_neighbors (
+                    place_id INTEGER NOT NULL REFERENCES places(id) ON DELETE CASCADE,
+                    rank SMALLINT NOT NULL,
+                    neighbor_id INTEGER NOT NULL REFERENCES places(id) ON DELETE CASCADE,
+                    similarity REAL NOT NULL,
+                    PRIMARY KEY (place_id, rank)
+                )
+            """)
+            conn.commit()
+            logger.info("place_neighbors table is ready")
+            
+        except Exception as e:
+            logger.error(f"Error creating place_neighbors table: {str(e)}")
+            conn.rollback()
+        finally:
+            cur.close()
+            conn.close()
+    
+    def update_place_neighbors(self, changed_ids=None, k=PLACE_NEIGHBORS_K):
+        """
+        Recompute the stored k nearest neighbours of places affected by changed embeddings.
+        
+        Neighbours come from the current embedding snapshot. A place's list is
+        rebuilt if the place changed, is new, lists a changed or removed place,
+        or a changed place now beats its current k-th neighbour; every other
+        list is still exact.
+        
+        Args:
+            changed_ids: Place ids whose embeddings changed, or None to rebuild every list
+        
+        Returns:
+            int: Number of places whose neighbour lists were rewritten
+        """
+        snapshot = EmbeddingSnapshot(self.snapshot_dir, use_compact=False)
+        matrix, ids = snapshot.arrays()
+        if matrix is None:
+            logger.warning("No embedding snapshot to compute neighbours from")
+            return 0
+        
+        row_of = {int(place_id): row for row, place_id in enumerate(ids)}
+        conn, cur = self._connect_db()
+        try:
+            cur.execute("""
+                SELECT place_id, array_agg(neighbor_id), MIN(similarity), COUNT(*)
+                FROM place_neighbors
+                GROUP BY place_id
+            """)
+            current = cur.fetchall()
+            
+            if changed_ids is None or not current:
+                affected = np.arange(len(ids))
+            else:
+                changed = {place_id for place_id in changed_ids if place_id in row_of}
+                changed_rows = [row_of[place_id] for place_id in changed]
+                
+                # Lists shorter than k accept any neighbour
+                thresholds = np.full(len(ids), -np.inf, dtype=np.float32)
+                stale = set(changed_rows)
+                listed = set()
+                for place_id, neighbor_ids, kth, count in current:
+                    row = row_of.get(place_id)
+                    if row is None:
+                        continue
+                    listed.add(row)
+                    if count >= min(k, len(ids) - 1):
+                        thresholds[row] = kth
+                    if any(neighbor_id in changed or neighbor_id not in row_of for neighbor_id in neighbor_ids):
+                        stale.add(row)
+                
+                stale.update(row for row in range(len(ids)) if row not in listed)
+                stale.update(rows_gaining_neighbors(matrix, changed_rows, thresholds).tolist())
+                affected = np.array(sorted(stale), dtype=np.int64)
+            
+            neighbors, similarities = nearest_neighbors(matrix, affected, k)
+            place_ids = [int(ids[row]) for row in affected]
+            
+            cur.execute("DELETE FROM place_neighbors WHERE place_id = ANY(%s)", (place_ids,))
+            # Places whose embeddings are gone keep no list
+            cur.execute("DELETE FROM place_neighbors WHERE NOT (place_id = ANY(%s))", ([int(place_id) for place_id in ids],))
+            execute_values(cur, """
+                INSERT INTO place_neighbors (place_id, rank, neighbor_id, similarity) VALUES %s
+            """, [
+                (place_id, rank, int(ids[neighbor]), float(similarity))
+                for place_id, row_neighbors, row_similarities in zip(place_ids, neighbors, similarities)
+                for rank, (neighbor, similarity) in enumerate(zip(row_neighbors, row_similarities), 1)
+            ], page_size=1000)
+            conn.commit()
+            
+            logger.info(f"Updated neighbours for {len(place_ids)} of {len(ids)} places")
+            return len(place_ids)
+            
+        except Exception as e:
+            logger.error(f"Error updating place neighbours: {str(e)}")
+            conn.rollback()
+            return 0
+        finally:
+            cur.close()
+            conn.close()
+    
     def extract_amenities_from_descriptions(self):
         """Extract amenities from place descriptions and populate the amenities column"""
         conn, cur = self._connect_db()
         try:
-            # Amenity keywords to look for
-            amenity_patterns = {
-                "wifi": [r'\b(?:wi-?fi|wireless|internet)\b', r'\bwifi\b'],
-                "outdoor_seating": [r'\b(?:outdoor|outside|patio|terrace|sidewalk)\s+(?:seating|dining|area)\b', r'\b(?:garden|courtyard)\b'],
-                "pet_friendly": [r'\b(?:pet|dog)(?:-|\s+)friendly\b', r'\b(?:pets|dogs)\s+(?:allowed|welcome)\b'],
-                "reservations": [r'\breservations?\b', r'\b(?:take|accept)s?\s+reservations?\b'],
-                "takeout": [r'\b(?:take-?out|to-?go|pickup|delivery)\b', r'\bcarry-?out\b'],
-                "live_music": [r'\blive\s+(?:music|band|dj|performance)\b', r'\b(?:music|band|dj)\s+performance\b'],
-                "free_wifi": [r'\bfree\s+(?:wi-?fi|wireless|internet)\b', r'\bfree\s+wifi\b'],
-                "full_bar": [r'\bfull\s+bar\b', r'\bcraft\s+(?:cocktails?|beers?)\b'],
-                "coffee": [r'\b(?:coffee|espresso|latte)\b'],
-                "wheelchair_accessible": [r'\b(?:wheelchair|handicap|ada|accessible)\b'],
-                "vegan_options": [r'\bvegan\b', r'\bvegan[\-\s]+friendly\b'],
-                "gluten_free": [r'\bgluten[\-\s]+free\b'],
-                "vegetarian": [r'\bvegetarian\b', r'\bvegetarian[\-\s]+friendly\b'],
-                "quiet": [r'\b(?:quiet|peaceful|tranquil)\b'],
-                "workspace": [r'\b(?:workspace|work\s+space|working\s+space)\b', r'\b(?:laptops?|work\s+from)\b'],
-                "plug_outlets": [r'\b(?:outlets?|plugs?|sockets?)\b'],
-                "private_room": [r'\bprivate\s+(?:room|dining|event)\b', r'\b(?:event|party)\s+space\b'],
-                "romantic": [r'\bromantic\b', r'\bdate\s+night\b', r'\bintimate\s+setting\b']
-            }
-            
             # Fetch places without amenities data
             cur.execute("""
                 SELECT id, name, combined_description, tags 
@@ -1404,7 +3168,7 @@ class EmbeddingGenerator:
             places = cur.fetchall()
             logger.info(f"Processing amenities for {len(places)} places")
             
-            updated_count = 0
+            updated_ids = []
             for place_id, name, description, tags in places:
                 # Skip if no description
                 if not description:
@@ -1413,7 +3177,7 @@ class EmbeddingGenerator:
                 amenities = {}
                 
                 # Check for amenity patterns in description
-                for amenity, patterns in amenity_patterns.items():
+                for amenity, patterns in AMENITY_PATTERNS.items():
                     for pattern in patterns:
                         if re.search(pattern, description.lower()):
                             amenities[amenity] = True
@@ -1423,7 +3187,7 @@ class EmbeddingGenerator:
                 if tags:
                     parsed_tags = self.parse_tags(tags)
                     tag_text = " ".join(parsed_tags).lower()
-                    for amenity, patterns in amenity_patterns.items():
+                    for amenity, patterns in AMENITY_PATTERNS.items():
                         if amenity not in amenities:  # Only check if not already found
                             for pattern in patterns:
                                 if re.search(pattern, tag_text):
@@ -1436,10 +3200,13 @@ class EmbeddingGenerator:
                         "UPDATE places SET amenities = %s::jsonb WHERE id = %s",
                         (json.dumps(amenities), place_id)
                     )
-                    updated_count += 1
+                    updated_ids.append(place_id)
             
+            if updated_ids:
+                refresh_search_rows(cur, updated_ids)
+                notify_places_changed(cur, 'amenities', updated_ids)
             conn.commit()
-            logger.info(f"Updated amenities for {updated_count} places")
+            logger.info(f"Updated amenities for {len(updated_ids)} places")
             
         except Exception as e:
             logger.error(f"Error extracting amenities: {str(e)}")
@@ -1641,9 +3408,30 @@ def main():
     # Ensure amenities column exists
     generator.ensure_amenities_column()
     
+    # Ensure normalized neighborhood column and index exist
+    generator.ensure_neighborhood_column()
+    
+    # Ensure full-text search column and index exist
+    generator.ensure_search_vector_column()
+    
+    # Ensure price level and hour flag columns exist
+    generator.ensure_attribute_columns()
+    
+    # Denormalized rows search reads; the steps below keep them current
+    generator.ensure_search_table()
+    
+    # Triggers that queue places for embedding when their content changes
+    generator.ensure_embedding_queue()
+    
     # Extract amenities from descriptions
     generator.extract_amenities_from_descriptions()
     
+    # Persist price level and hour flags for SQL pre-filtering
+    generator.extract_structured_attributes()
+    
+    # Table for the precomputed "more like this" neighbours
+    generator.ensure_neighbors_table()
+    
     # Process all places
     tokens_used = generator.process_all_places()
     
@@ -0,0 +1,104 @@
+import csv
+import logging
+
+from psycopg2 import sql
+
+from data_events import notify_places_changed
+from generate_embeddings import refresh_search_rows
+
+logger = logging.getLogger(__name__)
+
+# Columns the import needs from the CSV header; any other columns are loaded and ignored
+REQUIRED_COLUMNS = ('corner_place_id', 'google_id')
+
+def ensure_google_id_column(cur):
+    """Ensure places has the google_id column and an index to match CSV rows on"""
+    cur.execute("ALTER TABLE places ADD COLUMN IF NOT EXISTS google_id TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_places_corner_place_id ON places (corner_place_id)")
+
+def import_google_ids(cur, csv_file='places.csv'):
+    """
+    Apply the Google IDs in a CSV file to places in one set-based update.
+    
+    The file is streamed into a temp table with COPY and joined to places
+    with a single UPDATE ... FROM, so the cost is a couple of statements
+    however many rows the file has. Only places whose google_id actually
+    changes are written, refreshed in search_places and announced to
+    running app workers. Like the old row-by-row import, the last row for a
+    corner_place_id wins. Runs on the caller's transaction; nothing is
+    visible until the caller commits.
+    
+    Returns:
+        Dict with the number of distinct CSV rows, places whose google_id was
+        inserted (was empty) or changed, unmatched rows (no place with that
+        corner_place_id), and the ids of the updated places
+    """
+    with open(csv_file, 'r', newline='') as f:
+        header = next(csv.reader([f.readline()]), [])
+        missing = [column for column in REQUIRED_COLUMNS if column not in header]
+        if missing:
+            raise ValueError(f"{csv_file} is missing columns: {', '.join(missing)}")
+        
+        columns = sql.SQL(", ").join(sql.Identifier(column) for column in header)
+        cur.execute(sql.SQL("""
+            CREATE TEMP TABLE google_id_import (
+                row_number BIGSERIAL,
+                {}
+            ) ON COMMIT DROP
+        """).format(sql.SQL(", ").join(sql.SQL("{} TEXT").format(sql.Identifier(column)) for column in header)))
+        # The header line was consumed above; COPY reads the rest of the file
+        cur.copy_expert(
+            sql.SQL("COPY google_id_import ({}) FROM STDIN WITH (FORMAT csv)").format(columns).as_string(cur),
+            f
+        )
+    
+    cur.execute("""
+        CREATE TEMP TABLE google_id_rows ON COMMIT DROP AS
+        SELECT DISTINCT ON (corner_place_id) corner_place_id, google_id
+        FROM (
+            SELECT NULLIF(btrim(corner_place_id), '') AS corner_place_id,
+                   NULLIF(btrim(google_id), '') AS google_id,
+                   row_number
+            FROM google_id_import
+        ) csv_rows
+        WHERE corner_place_id IS NOT NULL AND google_id IS NOT NULL
+        ORDER BY corner_place_id, row_number DESC
+    """)
+    rows = cur.rowcount
+    cur.execute("ANALYZE google_id_rows")
+    
+    cur.execute("""
+        UPDATE places p
+        SET google_id = s.google_id
+        FROM (
+            SELECT matched.id, csv_rows.google_id, matched.google_id IS NULL AS inserted
+            FROM google_id_rows csv_rows
+            JOIN places matched ON matched.corner_place_id = csv_rows.corner_place_id
+            WHERE matched.google_id IS DISTINCT FROM csv_rows.google_id
+        ) s
+        WHERE p.id = s.id
+        RETURNING p.id, s.inserted
+    """)
+    updated = cur.fetchall()
+    updated_ids = [place_id for place_id, _ in updated]
+    inserted = sum(1 for _, was_empty in updated if was_empty)
+    
+    cur.execute("""
+        SELECT COUNT(*)
+        FROM google_id_rows csv_rows
+        WHERE NOT EXISTS (SELECT 1 FROM places p WHERE p.corner_place_id = csv_rows.corner_place_id)
+    """)
+    unmatched = cur.fetchone()[0]
+    
+    # Search rows carry google_id; running app workers evict cached data when this commits
+    refresh_search_rows(cur, updated_ids)
+    notify_places_changed(cur, 'google_id', updated_ids)
+    
+    counts = {
+        "rows": rows,
+        "inserted": inserted,
+        "changed": len(updated_ids) - inserted,
+        "unmatched": unmatched
+    }
+    logger.info(f"Imported Google IDs from {csv_file}: {counts}")
+    return dict(counts, updated_ids=updated_ids)
@@ -0,0 +1,126 @@
+import gzip
+import time
+import hashlib
+import logging
+import threading
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# Brotli is optional; without it responses fall back to gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Cache-Control policies per endpoint
+SEARCH_CACHE_CONTROL = "public, max-age=60"
+PLACE_CACHE_CONTROL = "public, max-age=300"
+RECENT_QUERIES_CACHE_CONTROL = "public, max-age=60"
+SUGGEST_CACHE_CONTROL = "public, max-age=300"
+
+# Responses smaller than this are not worth compressing
+COMPRESSION_MIN_BYTES = 1024
+# Seconds a computed data version is trusted before Postgres is asked again
+DATA_VERSION_TTL = 15
+
+class DataVersion:
+    """
+    Cheap version string for the places, reviews and embeddings data.
+    
+    Combines the newest embedding last_updated with Postgres' per-table write
+    counters, so any write (including google_id imports that do not touch
+    updated_at) changes the version. The result is cached for
+    DATA_VERSION_TTL seconds so validating a request rarely hits the database.
+    """
+    
+    def __init__(self, db_config, ttl=DATA_VERSION_TTL):
+        self.db_config = db_config
+        self.ttl = ttl
+        self._value = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+    
+    def get(self):
+        """Return the current data version, refreshing it if the TTL has passed"""
+        with self._lock:
+            if self._value and time.monotonic() - self._checked < self.ttl:
+                return self._value
+        
+        conn = None
+        try:
+            conn = psycopg2.connect(**self.db_config)
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT
+                        (SELECT MAX(last_updated) FROM embeddings),
+                        (SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0)
+                         FROM pg_stat_user_tables
+                         WHERE relname IN ('places', 'reviews', 'embeddings'))
+                """)
+                last_updated, writes = cur.fetchone()
+            value = hashlib.md5(f"{last_updated}|{writes}".encode()).hexdigest()[:16]
+        except Exception as e:
+            logger.warning(f"Failed to read data version: {str(e)}")
+            # Keep serving the last known version rather than disabling validation
+            value = self._value or "unknown"
+        finally:
+            if conn:
+                conn.close()
+        
+        with self._lock:
+            self._value = value
+            self._checked = time.monotonic()
+        return value
+    
+    def invalidate(self):
+        """Recompute the version on the next get(), e.g. after hearing about a write"""
+        with self._lock:
+            self._checked = 0.0
+
+def make_etag(*parts):
+    """Build an ETag value from the data version and request-specific parts"""
+    return hashlib.md5("|".join(str(part) for part in parts).encode()).hexdigest()
+
+def etag_matches(if_none_match, etag):
+    """Check an If-None-Match header against an ETag, using weak comparison"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/").strip('"') == etag for tag in candidates)
+
+def accepted_encodings(accept_encoding):
+    """Parse an Accept-Encoding header into the set of encodings with a non-zero quality"""
+    encodings = set()
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name.strip().lower())
+    return encodings
+
+def compress_body(data, accept_encoding):
+    """
+    Compress a response body for the client if it is large enough.
+    
+    Returns:
+        Tuple of (content encoding or None, body)
+    """
+    if len(data) < COMPRESSION_MIN_BYTES:
+        return None, data
+    
+    encodings = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in encodings:
+        return "br", brotli.compress(data, quality=5)
+    if "gzip" in encodings:
+        return "gzip", gzip.compress(data, compresslevel=6)
+    return None, data
@@ -0,0 +1,350 @@
+"""
+Incremental loader: combined_data.json -> places and reviews.
+
+Parses the file one place at a time, hashes each place's JSON and compares
+it with the source_hash stored on the row, so only places that changed
+since the last load are written. Changed places and their reviews are
+spooled to CSV and bulk-loaded with COPY into temp tables, then applied
+with a few set-based statements in one transaction. Memory stays bounded
+by the largest single place plus one hash per known place, however large
+the file grows.
+
+Places missing from the file are left alone. The embedding_queue triggers
+queue every place whose content changed; run generate_embeddings.py
+afterwards to embed them and recompute derived columns.
+
+Usage:
+    python load_places.py                           # load combined_data.json
+    python load_places.py --file other.json         # load another export
+    python load_places.py --dry-run                 # report what would change
+"""
+import os
+import csv
+import json
+import hashlib
+import logging
+import argparse
+import tempfile
+
+import psycopg2
+from dotenv import load_dotenv
+
+from data_events import notify_places_changed
+from generate_embeddings import refresh_search_rows
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Database configuration
+db_config = {
+    "dbname": os.environ.get("DB_NAME", "corner_db"),
+    "user": os.environ.get("DB_USER", "namayjindal"),
+    "password": os.environ.get("DB_PASSWORD", ""),
+    "host": os.environ.get("DB_HOST", "localhost")
+}
+
+# Characters read from the JSON file at a time
+READ_CHUNK_SIZE = 1 << 20
+# Bytes of staged CSV kept in memory before spilling to a temp file
+SPOOL_MAX_SIZE = 64 << 20
+# places columns loaded from each JSON item, in COPY order
+PLACE_COLUMNS = (
+    'corner_place_id', 'name', 'neighborhood', 'website', 'instagram_handle', 'tags',
+    'combined_description', 'price_range', 'hours', 'address', 'google_id', 'source_hash'
+)
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS places (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    neighborhood TEXT,
+    website TEXT,
+    instagram_handle TEXT,
+    price_range TEXT,
+    combined_description TEXT,
+    tags TEXT[],
+    address TEXT,
+    hours JSONB,
+    amenities JSONB DEFAULT '{}'::jsonb,
+    google_id TEXT,
+    corner_place_id TEXT,
+    metadata JSONB,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS reviews (
+    id SERIAL PRIMARY KEY,
+    place_id INTEGER REFERENCES places(id),
+    source TEXT,
+    review_text TEXT
+);
+
+ALTER TABLE places ADD COLUMN IF NOT EXISTS google_id TEXT;
+ALTER TABLE places ADD COLUMN IF NOT EXISTS source_hash TEXT;
+CREATE INDEX IF NOT EXISTS idx_places_corner_place_id ON places (corner_place_id);
+CREATE INDEX IF NOT EXISTS idx_reviews_place_id ON reviews (place_id);
+"""
+
+def iter_json_array(f, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yield the items of a top-level JSON array one at a time.
+    
+    Reads the file in chunks and decodes each item with raw_decode, keeping
+    only the unconsumed tail of the buffer, so memory is bounded by the
+    largest item rather than the file.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+    
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+    
+    def next_char():
+        # Next non-whitespace character, reading more of the file as needed; None at the end
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if eof:
+                return None
+            fill()
+    
+    if next_char() != "[":
+        raise ValueError("Expected a JSON array")
+    position += 1
+    if next_char() == "]":
+        return
+    
+    while True:
+        if next_char() is None:
+            raise ValueError("Unterminated JSON array")
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # Objects, arrays and strings end on a closing character. A number or literal
+                # is only complete once the character after it is read and can't extend it
+                # ("2" of "2.5"), so refill until then
+                if eof or isinstance(item, (dict, list, str)) or (end < len(buffer) and buffer[end] in " \t\r\n,]"):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+        position = end
+        yield item
+        
+        separator = next_char()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' between array items, found {separator!r}")
+        position += 1
+
+def content_hash(place):
+    """Stable hash of everything in a place's JSON, reviews and resy_data included"""
+    return hashlib.md5(json.dumps(place, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def place_row(place, place_hash):
+    """CSV row for the place_load temp table, in PLACE_COLUMNS order"""
+    tags = place.get('tags') or []
+    hours = place.get('hours')
+    return [
+        str(place['corner_place_id']).strip(), place.get('name'), place.get('neighborhood'),
+        place.get('website'), place.get('instagram_handle'),
+        json.dumps(tags if isinstance(tags, list) else [tags]),
+        place.get('combined_description'), place.get('price_range'),
+        json.dumps(hours) if hours else None,
+        place.get('address'), place.get('google_id'), place_hash
+    ]
+
+def stage_changed_places(path, known_hashes, places_out, reviews_out):
+    """
+    Write the places in path whose hash differs from known_hashes to CSV.
+    
+    Returns:
+        Dict of counts: read, changed, unchanged and skipped (no corner_place_id or a duplicate)
+    """
+    places_writer, reviews_writer = csv.writer(places_out), csv.writer(reviews_out)
+    counts = {"read": 0, "changed": 0, "unchanged": 0, "skipped": 0}
+    seen = set()
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        for place in iter_json_array(f):
+            counts["read"] += 1
+            corner_place_id = str(place.get('corner_place_id') or '').strip() if isinstance(place, dict) else ''
+            if not corner_place_id or not place.get('name') or corner_place_id in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(corner_place_id)
+            
+            place_hash = content_hash(place)
+            if known_hashes.get(corner_place_id) == place_hash:
+                counts["unchanged"] += 1
+                continue
+            
+            counts["changed"] += 1
+            places_writer.writerow(place_row(place, place_hash))
+            for review in place.get('reviews') or []:
+                if isinstance(review, str) and review.strip():
+                    reviews_writer.writerow([corner_place_id, review])
+    
+    return counts
+
+def apply_staged_places(cur, places_csv, reviews_csv):
+    """
+    COPY the staged CSV into temp tables and apply it to places and reviews.
+    
+    Returns:
+        Tuple of (inserted place ids, updated place ids)
+    """
+    cur.execute("""
+        CREATE TEMP TABLE place_load (
+            corner_place_id TEXT PRIMARY KEY,
+            name TEXT,
+            neighborhood TEXT,
+            website TEXT,
+            instagram_handle TEXT,
+            tags JSONB,
+            combined_description TEXT,
+            price_range TEXT,
+            hours JSONB,
+            address TEXT,
+            google_id TEXT,
+            source_hash TEXT
+        ) ON COMMIT DROP
+    """)
+    cur.execute("CREATE TEMP TABLE review_load (corner_place_id TEXT, review_text TEXT) ON COMMIT DROP")
+    cur.copy_expert(f"COPY place_load ({', '.join(PLACE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", places_csv)
+    cur.copy_expert("COPY review_load (corner_place_id, review_text) FROM STDIN WITH (FORMAT csv)", reviews_csv)
+    cur.execute("ANALYZE place_load")
+    cur.execute("ANALYZE review_load")
+    
+    # An ID imported from places.csv is kept when the JSON has none
+    cur.execute("""
+        UPDATE places p
+        SET name = s.name,
+            neighborhood = s.neighborhood,
+            website = s.website,
+            instagram_handle = s.instagram_handle,
+            tags = ARRAY(SELECT jsonb_array_elements_text(s.tags)),
+            combined_description = s.combined_description,
+            price_range = s.price_range,
+            hours = s.hours,
+            address = s.address,
+            google_id = COALESCE(s.google_id, p.google_id),
+            source_hash = s.source_hash,
+            updated_at = CURRENT_TIMESTAMP
+        FROM place_load s
+        WHERE p.corner_place_id = s.corner_place_id
+        RETURNING p.id
+    """)
+    updated_ids = [row[0] for row in cur.fetchall()]
+    
+    cur.execute("""
+        INSERT INTO places (
+            corner_place_id, name, neighborhood, website, instagram_handle, tags,
+            combined_description, price_range, hours, address, google_id, source_hash
+        )
+        SELECT s.corner_place_id, s.name, s.neighborhood, s.website, s.instagram_handle,
+               ARRAY(SELECT jsonb_array_elements_text(s.tags)),
+               s.combined_description, s.price_range, s.hours, s.address, s.google_id, s.source_hash
+        FROM place_load s
+        WHERE NOT EXISTS (SELECT 1 FROM places p WHERE p.corner_place_id = s.corner_place_id)
+        RETURNING id
+    """)
+    inserted_ids = [row[0] for row in cur.fetchall()]
+    
+    # Only the reviews that differ are touched, so a place whose reviews didn't change isn't re-queued by them
+    cur.execute("""
+        CREATE TEMP TABLE loaded_places ON COMMIT DROP AS
+        SELECT p.id, p.corner_place_id
+        FROM places p
+        JOIN place_load s ON s.corner_place_id = p.corner_place_id
+    """)
+    cur.execute("""
+        DELETE FROM reviews r
+        USING loaded_places l
+        WHERE r.place_id = l.id
+          AND NOT EXISTS (
+              SELECT 1 FROM review_load n
+              WHERE n.corner_place_id = l.corner_place_id AND n.review_text = r.review_text
+          )
+    """)
+    cur.execute("""
+        INSERT INTO reviews (place_id, source, review_text)
+        SELECT l.id, 'google', n.review_text
+        FROM review_load n
+        JOIN loaded_places l ON l.corner_place_id = n.corner_place_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM reviews r WHERE r.place_id = l.id AND r.review_text = n.review_text
+        )
+    """)
+    
+    return inserted_ids, updated_ids
+
+def load_places(path='combined_data.json', dry_run=False):
+    """Load the places in path that changed since the last load"""
+    conn = None
+    try:
+        conn = psycopg2.connect(**db_config)
+        with conn.cursor() as cur:
+            cur.execute(SCHEMA_SQL)
+            conn.commit()
+            
+            cur.execute("SELECT corner_place_id, source_hash FROM places WHERE corner_place_id IS NOT NULL")
+            known_hashes = dict(cur.fetchall())
+            logger.info(f"Comparing {path} against {len(known_hashes)} places in the database")
+            
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+', newline='') as places_csv, \
+                 tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+', newline='') as reviews_csv:
+                counts = stage_changed_places(path, known_hashes, places_csv, reviews_csv)
+                del known_hashes
+                logger.info(f"Read {counts['read']} places: {counts['changed']} changed, "
+                            f"{counts['unchanged']} unchanged, {counts['skipped']} skipped")
+                if dry_run or not counts["changed"]:
+                    return counts
+                
+                places_csv.seek(0)
+                reviews_csv.seek(0)
+                inserted_ids, updated_ids = apply_staged_places(cur, places_csv, reviews_csv)
+            
+            # Search rows and running app workers see the new content when this commits
+            cur.execute("SELECT to_regclass('search_places') IS NOT NULL")
+            if cur.fetchone()[0]:
+                refresh_search_rows(cur, inserted_ids + updated_ids)
+            notify_places_changed(cur, 'place', inserted_ids + updated_ids)
+            conn.commit()
+        
+        logger.info(f"Inserted {len(inserted_ids)} places and updated {len(updated_ids)} places")
+        return dict(counts, inserted=len(inserted_ids), updated=len(updated_ids))
+    
+    except Exception as e:
+        logger.error(f"Error loading places: {str(e)}")
+        if conn:
+            conn.rollback()
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load changed places from combined_data.json into Postgres")
+    parser.add_argument('--file', default='combined_data.json', help="JSON array of places to load")
+    parser.add_argument('--dry-run', action='store_true', help="Only report how many places changed")
+    args = parser.parse_args()
+    
+    logger.info(f"Starting place load from {args.file}")
+    counts = load_places(args.file, dry_run=args.dry_run)
+    logger.info(f"Load complete: {counts}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Open-loop load test for the web app.
+
+Sends a mix of /api/search (queries from corner_recent_queries.csv),
+/api/place/<id> and /api/recent_queries requests at a fixed arrival rate,
+independent of how fast the server answers, so queueing shows up as latency
+instead of silently lowering the load. Each rate step reports throughput,
+latency percentiles per endpoint, error rate and Postgres connection counts
+from pg_stat_activity; the last step the server kept up with is the
+saturation throughput.
+
+Usage:
+    python load_test.py --start-server --workers 4 --rates 5 10 20 40
+    python load_test.py --url http://localhost:8000 --rates 10 20 --duration 60
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import logging
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import httpx
+import psycopg2
+
+from benchmark_search import QUERY_LOG, ROOT, db_config, load_queries, percentile
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Share of requests per endpoint, roughly what the frontend generates per search session
+DEFAULT_MIX = {"search": 0.6, "place": 0.3, "recent_queries": 0.1}
+
+# A step is sustained if the server completed this share of the offered requests...
+SUSTAINED_THROUGHPUT_RATIO = 0.9
+# ...and no more than this share failed
+DEFAULT_MAX_ERROR_RATE = 0.01
+
+SERVER_START_TIMEOUT = 60
+
+class ConnectionSampler(threading.Thread):
+    """Samples pg_stat_activity for the app database at a fixed interval"""
+    
+    def __init__(self, dbname, interval=1.0):
+        super().__init__(daemon=True)
+        self.dbname = dbname
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+    
+    def run(self):
+        conn = None
+        try:
+            conn = psycopg2.connect(**db_config(self.dbname))
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                while not self._stop_event.is_set():
+                    cur.execute("""
+                        SELECT COALESCE(state, 'unknown'), COUNT(*)
+                        FROM pg_stat_activity
+                        WHERE datname = %s AND pid <> pg_backend_pid()
+                        GROUP BY 1
+                    """, (self.dbname,))
+                    counts = dict(cur.fetchall())
+                    counts["total"] = sum(counts.values())
+                    self.samples.append(counts)
+                    self._stop_event.wait(self.interval)
+        except Exception as e:
+            logger.warning(f"Connection sampling stopped: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+    
+    def take(self):
+        """Return and reset the samples collected so far"""
+        samples, self.samples = self.samples, []
+        return samples
+    
+    def stop(self):
+        self._stop_event.set()
+
+def summarize_connections(samples):
+    if not samples:
+        return None
+    totals = [sample["total"] for sample in samples]
+    active = [sample.get("active", 0) for sample in samples]
+    return {
+        "max": max(totals),
+        "mean": round(sum(totals) / len(totals), 1),
+        "max_active": max(active),
+        "max_idle_in_transaction": max(sample.get("idle in transaction", 0) for sample in samples)
+    }
+
+def load_place_ids(dbname):
+    """Ids of places the detail endpoint can serve"""
+    conn = psycopg2.connect(**db_config(dbname))
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM places ORDER BY id")
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+def start_server(args):
+    """
+    Start gunicorn against the load-test database with stand-in embeddings.
+    
+    The server runs in a scratch directory holding a copy of the query log, so
+    searches made during the test don't end up in the repo's log.
+    
+    Returns:
+        Tuple of (process, scratch directory)
+    """
+    scratch = tempfile.mkdtemp(prefix="corner-load-")
+    shutil.copy(QUERY_LOG, scratch)
+    
+    env = dict(os.environ)
+    env.update({
+        "DB_NAME": args.dbname,
+        "EMBEDDING_PROVIDER": "standin",
+        "STANDIN_EMBEDDING_LATENCY_MS": str(args.embedding_latency_ms),
+        "EMBEDDING_SNAPSHOT_DIR": os.path.join(ROOT, "snapshots-bench")
+    })
+    
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "--pythonpath", ROOT,
+        "--bind", f"127.0.0.1:{args.port}",
+        "--workers", str(args.workers),
+        "--timeout", "120"
+    ]
+    if args.asgi:
+        command += ["-k", "uvicorn.workers.UvicornWorker", "asgi:app"]
+    else:
+        command += ["--threads", str(args.threads), "app:app"]
+    
+    logger.info(f"Starting server: {' '.join(command)}")
+    process = subprocess.Popen(command, cwd=scratch, env=env)
+    
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            httpx.get(f"{args.url}/api/recent_queries", timeout=2)
+            return process, scratch
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    
+    process.terminate()
+    raise RuntimeError(f"Server did not start within {SERVER_START_TIMEOUT}s")
+
+def build_request(queries, place_ids, mix, rng):
+    """Pick the next request as (endpoint label, path, query params)"""
+    endpoint = rng.choices(list(mix), weights=list(mix.values()))[0]
+    if endpoint == "search":
+        return endpoint, "/api/search", {"q": rng.choice(queries)}
+    if endpoint == "place":
+        return endpoint, f"/api/place/{rng.choice(place_ids)}", None
+    return endpoint, "/api/recent_queries", None
+
+def send(client, endpoint, path, params, scheduled):
+    """
+    Issue one request.
+    
+    Latency is measured from the scheduled arrival time, so time spent waiting
+    for a free client slot (because the server is slow) is counted.
+    """
+    status = None
+    try:
+        response = client.get(path, params=params)
+        status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    finished = time.monotonic()
+    return {"endpoint": endpoint, "status": status, "latency": finished - scheduled, "finished": finished}
+
+def run_step(client, rate, args, queries, place_ids, rng, sampler):
+    """Offer `rate` requests/s for args.duration seconds and summarize what came back"""
+    sampler.take()
+    futures = []
+    
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    try:
+        start = time.monotonic()
+        scheduled = start
+        end = start + args.duration
+        while True:
+            # Poisson arrivals: exponential gaps between requests
+            scheduled += rng.expovariate(rate)
+            if scheduled >= end:
+                break
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint, path, params = build_request(queries, place_ids, args.mix, rng)
+            futures.append(executor.submit(send, client, endpoint, path, params, scheduled))
+        
+        done, not_done = wait(futures, timeout=args.drain_timeout)
+    finally:
+        # Requests still queued after the drain timeout are dropped and counted as errors
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    results = [future.result() for future in done]
+    ok = [result for result in results if result["status"] == 200]
+    last_finished = max((result["finished"] for result in results), default=start + args.duration)
+    elapsed = max(last_finished - start, args.duration)
+    errors = len(futures) - len(ok)
+    
+    endpoints = {}
+    for endpoint in args.mix:
+        latencies = [result["latency"] * 1000 for result in ok if result["endpoint"] == endpoint]
+        if latencies:
+            endpoints[endpoint] = {
+                "count": len(latencies),
+                "p50_ms": round(percentile(latencies, 50), 1),
+                "p95_ms": round(percentile(latencies, 95), 1),
+                "p99_ms": round(percentile(latencies, 99), 1)
+            }
+    
+    statuses = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+    if not_done:
+        statuses["unfinished"] = len(not_done)
+    
+    all_latencies = [result["latency"] * 1000 for result in ok]
+    return {
+        "offered_rps": rate,
+        "sent": len(futures),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "error_rate": round(errors / len(futures), 4) if futures else 0.0,
+        "statuses": statuses,
+        "p50_ms": round(percentile(all_latencies, 50), 1) if all_latencies else None,
+        "p95_ms": round(percentile(all_latencies, 95), 1) if all_latencies else None,
+        "p99_ms": round(percentile(all_latencies, 99), 1) if all_latencies else None,
+        "endpoints": endpoints,
+        "connections": summarize_connections(sampler.take())
+    }
+
+def is_sustained(step, args):
+    """Whether the server kept up with the offered rate within the error and latency limits"""
+    if step["throughput_rps"] < step["offered_rps"] * SUSTAINED_THROUGHPUT_RATIO:
+        return False
+    if step["error_rate"] > args.max_error_rate:
+        return False
+    if args.slo_ms and (step["p95_ms"] is None or step["p95_ms"] > args.slo_ms):
+        return False
+    return True
+
+def print_step(step, sustained):
+    connections = step["connections"] or {}
+    print(f"\noffered {step['offered_rps']} req/s -> {step['throughput_rps']} req/s, "
+          f"errors {step['error_rate']:.1%} {'' if sustained else '(NOT SUSTAINED)'}")
+    print(f"  latency ms  p50 {step['p50_ms']}  p95 {step['p95_ms']}  p99 {step['p99_ms']}")
+    for endpoint, summary in step["endpoints"].items():
+        print(f"  {endpoint:<15} n={summary['count']:<6} p50 {summary['p50_ms']:>8}  "
+              f"p95 {summary['p95_ms']:>8}  p99 {summary['p99_ms']:>8}")
+    print(f"  statuses {step['statuses']}")
+    if connections:
+        print(f"  db connections  max {connections['max']}  mean {connections['mean']}  "
+              f"max active {connections['max_active']}  "
+              f"max idle in transaction {connections['max_idle_in_transaction']}")
+
+def parse_mix(value):
+    """Parse 'search=0.6,place=0.3,recent_queries=0.1'"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint '{name}', expected one of {', '.join(DEFAULT_MIX)}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load test against the running app")
+    parser.add_argument('--url', help="Base URL of the server (default: the server started with --start-server)")
+    parser.add_argument('--dbname', default=os.environ.get("BENCHMARK_DB_NAME", "corner_bench"),
+                        help="Database the server uses; sampled for connection counts")
+    parser.add_argument('--rates', type=float, nargs='+', default=[5, 10, 20, 40],
+                        help="Arrival rates to step through, in requests/s")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds per rate step")
+    parser.add_argument('--concurrency', type=int, default=200, help="Maximum requests in flight")
+    parser.add_argument('--timeout', type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument('--drain-timeout', type=float, default=60,
+                        help="How long to wait for in-flight requests after each step")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help="e.g. search=0.6,place=0.3,recent_queries=0.1")
+    parser.add_argument('--slo-ms', type=float, help="p95 latency above which a step counts as saturated")
+    parser.add_argument('--max-error-rate', type=float, default=DEFAULT_MAX_ERROR_RATE)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start-server', action='store_true', help="Run gunicorn against --dbname for the test")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers (with --start-server)")
+    parser.add_argument('--threads', type=int, default=1, help="Threads per gunicorn worker (with --start-server)")
+    parser.add_argument('--asgi', action='store_true', help="Serve asgi:app with uvicorn workers (with --start-server)")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--embedding-latency-ms', type=float, default=100,
+                        help="Simulated OpenAI round trip for the stand-in embeddings (with --start-server)")
+    parser.add_argument('--output', help="Write the JSON report here")
+    args = parser.parse_args()
+    
+    if not args.url:
+        if not args.start_server:
+            parser.error("pass --url, or --start-server to run gunicorn locally")
+        args.url = f"http://127.0.0.1:{args.port}"
+    
+    queries = load_queries()
+    place_ids = load_place_ids(args.dbname)
+    if not place_ids:
+        logger.error(f"No places in {args.dbname}; run benchmark_search.py --setup first")
+        sys.exit(2)
+    
+    process = scratch = None
+    if args.start_server:
+        process, scratch = start_server(args)
+    
+    sampler = ConnectionSampler(args.dbname)
+    sampler.start()
+    rng = random.Random(args.seed)
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "url": args.url,
+        "mix": args.mix,
+        "duration": args.duration,
+        "server": {"workers": args.workers, "threads": args.threads, "asgi": args.asgi} if args.start_server else None,
+        "steps": []
+    }
+    
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        with httpx.Client(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+            for rate in args.rates:
+                logger.info(f"Offering {rate} requests/s for {args.duration}s")
+                step = run_step(client, rate, args, queries, place_ids, rng, sampler)
+                step["sustained"] = is_sustained(step, args)
+                report["steps"].append(step)
+                print_step(step, step["sustained"])
+    finally:
+        sampler.stop()
+        if process:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(scratch, ignore_errors=True)
+    
+    sustained = [step for step in report["steps"] if step["sustained"]]
+    report["saturation_rps"] = max((step["throughput_rps"] for step in sustained), default=None)
+    if report["saturation_rps"] is None:
+        print("\nThe server did not sustain any of the offered rates")
+    else:
+        print(f"\nSaturation throughput: {report['saturation_rps']} req/s "
+              f"(highest sustained step of {len(report['steps'])})")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
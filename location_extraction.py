@@ -173,6 +173,21 @@ def extract_location_from_query(query: str) -> Tuple[str, Optional[str]]:
     # No location found
     return query, None
 
+def normalize_neighborhood(neighborhood: Optional[str]) -> Optional[str]:
+    """
+    Normalize a neighborhood name into the key stored in places.neighborhood_key.
+    
+    Args:
+        neighborhood: Raw or standardized neighborhood name
+        
+    Returns:
+        Lowercased, trimmed neighborhood key, or None if empty
+    """
+    if not neighborhood:
+        return None
+    key = re.sub(r'\s+', ' ', neighborhood).strip().lower()
+    return key or None
+
 def get_adjacent_neighborhoods(neighborhood: str) -> list:
     """
     Return a list of adjacent neighborhoods for a given neighborhood.
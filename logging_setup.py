@@ -0,0 +1,133 @@
+import os
+import queue
+import atexit
+import random
+import logging
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_FILE = os.getenv("LOG_FILE", "embeddings.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+
+# Share of requests that log verbose diagnostics (result breakdowns, expanded queries)
+DIAGNOSTICS_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))
+
+# Verbose per-request output goes to this logger and is dropped for unsampled requests
+DIAGNOSTICS_LOGGER = "corner.diagnostics"
+# Search queries are appended to the recent queries CSV through this logger
+QUERY_LOGGER = "corner.queries"
+
+# None outside a request (scripts, ingestion), where diagnostics are always on
+_diagnostics_sampled = ContextVar("diagnostics_sampled", default=None)
+
+# (QueueHandler, QueueListener) pairs; the listeners own the real handlers
+_listeners = []
+_configured = False
+
+def sample_diagnostics(rate=None):
+    """
+    Decide whether the current request logs verbose diagnostics.
+    
+    Call once at the start of each request; the decision applies to everything
+    the request logs through the diagnostics logger.
+    
+    Returns:
+        bool: True if this request was sampled
+    """
+    rate = DIAGNOSTICS_SAMPLE_RATE if rate is None else rate
+    sampled = random.random() < rate
+    _diagnostics_sampled.set(sampled)
+    return sampled
+
+def diagnostics_enabled():
+    """Whether verbose diagnostics (and any extra work to produce them) should run now"""
+    sampled = _diagnostics_sampled.get()
+    return True if sampled is None else sampled
+
+class DiagnosticsFilter(logging.Filter):
+    """Drops diagnostics records from requests that weren't sampled"""
+    
+    def filter(self, record):
+        return diagnostics_enabled()
+
+diagnostics_logger = logging.getLogger(DIAGNOSTICS_LOGGER)
+diagnostics_logger.addFilter(DiagnosticsFilter())
+
+class _ExcludeLogger(logging.Filter):
+    """Keeps records from one logger (and its children) out of a handler"""
+    
+    def filter(self, record):
+        return not super().filter(record)
+
+def _queue_handler(handlers):
+    """Wrap handlers behind a queue so callers only enqueue; a listener thread does the I/O"""
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    queue_handler = QueueHandler(log_queue)
+    _listeners.append((queue_handler, listener))
+    return queue_handler
+
+def _restart_listeners():
+    """Listener threads don't survive fork (gunicorn --preload); start new ones in the child"""
+    for i, (queue_handler, listener) in enumerate(_listeners):
+        log_queue = queue.SimpleQueue()
+        queue_handler.queue = log_queue
+        listener = QueueListener(log_queue, *listener.handlers, respect_handler_level=True)
+        listener.start()
+        _listeners[i] = (queue_handler, listener)
+
+def stop_logging():
+    """Flush queued records and stop the listener threads"""
+    for _, listener in _listeners:
+        if listener._thread is not None:
+            listener.stop()
+
+def configure_logging(level=logging.INFO, log_file=LOG_FILE):
+    """
+    Route the root logger through a queue to the console and a rotating log file.
+    
+    Records are formatted on the calling thread (QueueHandler.prepare does
+    that before enqueueing) and written by a listener thread, so request
+    handlers never block on log I/O but still pay for formatting. Safe to
+    call more than once; only the first call configures anything.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(_ExcludeLogger(QUERY_LOGGER))
+    
+    # Modules imported earlier may have called basicConfig; replace their synchronous handlers
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler(handlers))
+    root.setLevel(level)
+    
+    atexit.register(stop_logging)
+    os.register_at_fork(after_in_child=_restart_listeners)
+
+def configure_query_log(path):
+    """Append records from the query logger to `path` as raw lines, off the request thread"""
+    query_logger = logging.getLogger(QUERY_LOGGER)
+    if query_logger.handlers:
+        return query_logger
+    
+    handler = logging.FileHandler(path, delay=True)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    query_logger.addHandler(_queue_handler([handler]))
+    query_logger.setLevel(logging.INFO)
+    query_logger.propagate = False
+    return query_logger
@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import (
+    REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+)
+from prometheus_client import multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Stage durations recorded for the current request or ingestion run, in order of first use
+_stage_timings = ContextVar("stage_timings", default=None)
+
+# Search stages are mostly sub-second; ingestion stages (embedding batches) can take longer
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram(
+    "corner_stage_seconds", "Time spent in each search or ingestion stage",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "corner_request_seconds", "HTTP request latency",
+    ["endpoint", "method"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_TOTAL = Counter(
+    "corner_requests_total", "HTTP requests served",
+    ["endpoint", "method", "status"]
+)
+OPENAI_TOKENS_TOTAL = Counter(
+    "corner_openai_tokens_total", "OpenAI embedding tokens used"
+)
+EMBEDDING_REQUESTS_TOTAL = Counter(
+    "corner_embedding_requests_total", "OpenAI embedding calls",
+    ["outcome"]
+)
+SEMANTIC_CACHE_LOOKUPS_TOTAL = Counter(
+    "corner_semantic_cache_lookups_total", "Semantic result cache lookups",
+    ["outcome"]
+)
+# Similarity of the closest cached query on each lookup; shows what a threshold change would do
+SEMANTIC_CACHE_SIMILARITY = Histogram(
+    "corner_semantic_cache_similarity", "Cosine similarity to the nearest cached query",
+    buckets=(0.8, 0.85, 0.9, 0.92, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99, 0.995, 1.0)
+)
+
+def start_timings():
+    """Begin collecting stage timings for the current request or run, and return them"""
+    timings = {}
+    _stage_timings.set(timings)
+    return timings
+
+def current_timings():
+    """Stage timings collected so far in this context, or None outside a request or run"""
+    return _stage_timings.get()
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage.
+    
+    The duration is added to the per-request timings (summed if the stage runs
+    more than once) and observed in the corner_stage_seconds histogram.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=name).observe(elapsed)
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+def record_embedding_call(tokens=0, success=True):
+    """Count an OpenAI embedding call and its token usage"""
+    EMBEDDING_REQUESTS_TOTAL.labels(outcome="success" if success else "error").inc()
+    if tokens:
+        OPENAI_TOKENS_TOTAL.inc(tokens)
+
+def record_semantic_lookup(hit, similarity=None):
+    """Count a semantic cache lookup and the similarity of its nearest entry"""
+    SEMANTIC_CACHE_LOOKUPS_TOTAL.labels(outcome="hit" if hit else "miss").inc()
+    if similarity is not None:
+        SEMANTIC_CACHE_SIMILARITY.observe(similarity)
+
+def server_timing_header(timings, total=None):
+    """Format stage timings as a Server-Timing header value (durations in ms)"""
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in (timings or {}).items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+def format_timings(timings):
+    """Human-readable stage summary for logs"""
+    return ", ".join(f"{name}={seconds:.2f}s" for name, seconds in (timings or {}).items())
+
+def observe_request(endpoint, method, status, seconds):
+    """Record one served HTTP request"""
+    REQUEST_SECONDS.labels(endpoint=endpoint, method=method).observe(seconds)
+    REQUESTS_TOTAL.labels(endpoint=endpoint, method=method, status=str(status)).inc()
+
+def render_metrics():
+    """
+    Render all metrics in the Prometheus text format.
+    
+    Under gunicorn each worker has its own counters. Set PROMETHEUS_MULTIPROC_DIR
+    to a shared, empty directory before starting the server so /metrics
+    aggregates every worker instead of whichever one answered the scrape.
+    
+    Returns:
+        Tuple of (body bytes, content type)
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
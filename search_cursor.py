@@ -0,0 +1,127 @@
+import json
+import base64
+import hashlib
+
+# Deepest result offset a cursor may continue from. Cursors are client-controlled, and
+# the candidate pool of a later page grows with the offset and the excluded ids
+MAX_CURSOR_OFFSET = 500
+CURSOR_LEGS = ('vector', 'lexical')
+
+class InvalidCursor(ValueError):
+    """Raised for cursors that are malformed or belong to a different search"""
+
+def cursor_fingerprint(*parts):
+    """Identify the search a cursor belongs to (query, mode and filters)"""
+    return hashlib.md5(json.dumps(parts, default=str).encode()).hexdigest()[:16]
+
+def encode_cursor(state):
+    """Serialize a pagination state dict into an opaque, URL-safe token"""
+    data = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+def _is_id_list(value, max_length):
+    return (isinstance(value, list) and len(value) <= max_length
+            and all(isinstance(item, int) and not isinstance(item, bool) for item in value))
+
+def validate_cursor_state(state):
+    """
+    Check that a decoded state has the shape _page_cursor produces and stays within bounds.
+    
+    The token isn't signed, so n (the offset) and x (the excluded ids) are
+    whatever the client sent; both size the next page's candidate pool.
+    
+    Raises:
+        InvalidCursor: If a field has the wrong type or is out of bounds
+    """
+    offset = state.get("n", 0)
+    if not isinstance(offset, int) or isinstance(offset, bool) or not 0 <= offset <= MAX_CURSOR_OFFSET:
+        raise InvalidCursor("Cursor offset is out of range")
+    # Excluded ids are the sticky ids plus the last page, all of which were shown
+    if not _is_id_list(state.get("x", []), offset) or not _is_id_list(state.get("s", []), offset):
+        raise InvalidCursor("Cursor exclusions are invalid")
+    if state.get("leg") not in CURSOR_LEGS:
+        raise InvalidCursor("Cursor ranking is invalid")
+    for field in ("score", "r"):
+        score = state.get(field)
+        if score is not None and (not isinstance(score, (int, float)) or isinstance(score, bool)):
+            raise InvalidCursor("Cursor score is invalid")
+    last_id = state.get("i")
+    if last_id is not None and (not isinstance(last_id, int) or isinstance(last_id, bool)):
+        raise InvalidCursor("Cursor position is invalid")
+    slot = state.get("h")
+    if slot is not None and (not isinstance(slot, int) or isinstance(slot, bool) or slot < 0):
+        raise InvalidCursor("Cursor hours slot is invalid")
+
+def ranks_after(score, place_id, after_score, after_id=None):
+    """
+    Whether a place comes after a cursor position in keyset order (score descending, then id).
+    
+    Places tied on the score are ordered by id, so a page boundary inside a
+    run of ties is exact. Cursors without an id (issued before ids were
+    recorded) keep every tie and rely on their excluded ids instead.
+    """
+    if score != after_score:
+        return score < after_score
+    return after_id is None or place_id > after_id
+
+def keyset_page(scored, limit, after_score=None, after_id=None, exclude=()):
+    """
+    The next page of (place_id, score) pairs after a cursor position, in keyset order.
+    
+    Args:
+        scored: (place_id, score) pairs in any order
+        after_score, after_id: Position of the last row of the previous page, or None for the first page
+        exclude: Place ids to leave out (shown out of order on an earlier page)
+    """
+    remaining = [
+        (place_id, score) for place_id, score in scored
+        if place_id not in exclude
+        and (after_score is None or ranks_after(score, place_id, after_score, after_id))
+    ]
+    return sorted(remaining, key=lambda pair: (-pair[1], pair[0]))[:limit]
+
+def keyset_condition(keys, id_sql, after_id=None):
+    """
+    SQL condition for the rows after a cursor position in ORDER BY key DESC, ..., id order.
+    
+    Args:
+        keys: (sql, params, value at the cursor) for each score, most significant first
+        id_sql: Id column, the final (ascending) tie-break
+        after_id: Id at the cursor; None keeps every row tied with it
+    
+    Returns:
+        Tuple of (condition, params) using %s placeholders
+    """
+    condition, params = ("TRUE", []) if after_id is None else (f"{id_sql} > %s", [after_id])
+    for key_sql, key_params, value in reversed(keys):
+        condition = f"({key_sql} < %s OR ({key_sql} = %s AND {condition}))"
+        params = list(key_params) + [value] + list(key_params) + [value] + params
+    return condition, params
+
+def decode_cursor(cursor, fingerprint=None):
+    """
+    Parse and validate a token produced by encode_cursor.
+    
+    Pass fingerprint=None to check it later, once the search it belongs to
+    is known (the open-now hours slot is read from the cursor first).
+    
+    Raises:
+        InvalidCursor: If the token can't be decoded, is out of bounds or was issued for another search
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Malformed cursor: {str(e)}")
+    
+    if not isinstance(state, dict):
+        raise InvalidCursor("Malformed cursor")
+    validate_cursor_state(state)
+    if fingerprint is not None:
+        check_cursor_fingerprint(state, fingerprint)
+    return state
+
+def check_cursor_fingerprint(state, fingerprint):
+    """Raise InvalidCursor if a decoded state was issued for another search"""
+    if state.get("f") != fingerprint:
+        raise InvalidCursor("Cursor does not belong to this search")
@@ -0,0 +1,126 @@
+import os
+import hashlib
+import threading
+
+import numpy as np
+
+from metrics import record_semantic_lookup
+
+# Cosine similarity at or above which two query embeddings share cached results.
+# ada-002 similarities bunch up near 1, so rephrasings of one intent score ~0.97+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.97))
+# Query vectors kept per process
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 1024))
+
+def partition_key(*parts):
+    """Hash of everything besides the query vector that a cached result depends on"""
+    digest = hashlib.md5("|".join(str(part) for part in parts).encode()).digest()
+    return int.from_bytes(digest[:8], "little", signed=True)
+
+class SemanticCache:
+    """
+    Result cache keyed by query embedding instead of query text.
+    
+    Entries live in a fixed-size matrix of normalized query vectors. A lookup
+    is one matrix-vector product restricted to the entries of the same
+    partition (same filters, mode and data version), and returns the most
+    similar entry if it clears the threshold. The least recently used entry
+    is replaced when the cache is full.
+    """
+    
+    def __init__(self, capacity=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD):
+        self.capacity = capacity
+        self.threshold = threshold
+        self._vectors = None
+        self._partitions = np.zeros(capacity, dtype=np.int64)
+        self._used = np.zeros(capacity, dtype=np.int64)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._values = [None] * capacity
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+    
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def lookup(self, partition, embedding):
+        """
+        Find a cached value whose query vector is within the threshold.
+        
+        Returns:
+            Tuple of (value, similarity), or (None, best similarity or None) on a miss
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            self.lookups += 1
+            candidates = np.nonzero(self._valid & (self._partitions == partition))[0]
+            if not len(candidates) or self._vectors is None or self._vectors.shape[1] != len(query):
+                record_semantic_lookup(False)
+                return None, None
+            
+            scores = self._vectors[candidates] @ query
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                record_semantic_lookup(False, similarity)
+                return None, similarity
+            
+            slot = candidates[best]
+            self._clock += 1
+            self._used[slot] = self._clock
+            self.hits += 1
+            record_semantic_lookup(True, similarity)
+            return self._values[slot], similarity
+    
+    def store(self, partition, embedding, value):
+        """Cache value for this query vector, replacing the least recently used entry if full"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                self._vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+                self._valid[:] = False
+            
+            free = np.nonzero(~self._valid)[0]
+            slot = free[0] if len(free) else int(np.argmin(self._used))
+            self._clock += 1
+            self._vectors[slot] = vector
+            self._partitions[slot] = partition
+            self._used[slot] = self._clock
+            self._valid[slot] = True
+            self._values[slot] = value
+    
+    def evict(self, predicate):
+        """
+        Drop entries for which predicate(query vector, value) is true.
+        
+        Returns:
+            int: Number of entries dropped
+        """
+        with self._lock:
+            evicted = 0
+            for slot in np.nonzero(self._valid)[0]:
+                if predicate(self._vectors[slot], self._values[slot]):
+                    self._valid[slot] = False
+                    self._values[slot] = None
+                    evicted += 1
+            return evicted
+    
+    def clear(self):
+        with self._lock:
+            self._valid[:] = False
+            self._values = [None] * self.capacity
+    
+    def stats(self):
+        """Lookup and hit counts since startup, for tuning the threshold"""
+        with self._lock:
+            return {
+                "entries": int(self._valid.sum()),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else None,
+                "threshold": self.threshold
+            }
@@ -0,0 +1,68 @@
+import os
+import re
+import math
+import time
+import asyncio
+import hashlib
+from types import SimpleNamespace
+
+# Same dimensionality as text-embedding-ada-002, so the vector(1536) columns fit
+STANDIN_DIMENSIONS = 1536
+
+def standin_embedding(text, dimensions=STANDIN_DIMENSIONS):
+    """
+    Deterministic feature-hashed embedding.
+    
+    Every word is hashed to a signed dimension, so texts that share words get
+    similar vectors. That is enough for realistic result sets and SQL plans
+    without calling OpenAI.
+    """
+    vector = [0.0] * dimensions
+    for token in re.findall(r"[a-z0-9']+", (text or "").lower()):
+        digest = hashlib.md5(token.encode()).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    
+    norm = math.sqrt(sum(value * value for value in vector))
+    if not norm:
+        # Cosine distance is undefined for a zero vector
+        vector[0], norm = 1.0, 1.0
+    return [value / norm for value in vector]
+
+def _response(inputs):
+    """Build an object shaped like the OpenAI embeddings response"""
+    texts = [inputs] if isinstance(inputs, str) else list(inputs)
+    return SimpleNamespace(
+        data=[SimpleNamespace(index=i, embedding=standin_embedding(text)) for i, text in enumerate(texts)],
+        usage=SimpleNamespace(total_tokens=sum(len(text.split()) for text in texts))
+    )
+
+class StandInEmbeddingClient:
+    """
+    Drop-in for the parts of the OpenAI client that EmbeddingGenerator uses.
+    
+    Enabled with EMBEDDING_PROVIDER=standin. STANDIN_EMBEDDING_LATENCY_MS adds
+    a fixed delay per call to approximate the OpenAI round trip.
+    """
+    
+    def __init__(self, latency_ms=None):
+        if latency_ms is None:
+            latency_ms = float(os.getenv("STANDIN_EMBEDDING_LATENCY_MS", 0))
+        self.latency = latency_ms / 1000
+        self.embeddings = self
+    
+    def create(self, input, model=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return _response(input)
+
+class AsyncStandInEmbeddingClient(StandInEmbeddingClient):
+    """Async counterpart of StandInEmbeddingClient for the ASGI search path"""
+    
+    async def create(self, input, model=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return _response(input)
+    
+    async def close(self):
+        pass
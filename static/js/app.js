@@ -18,6 +18,8 @@ document.addEventListener('DOMContentLoaded', function() {
     let markers = [];
     let currentLocation = null;
     let locationFilter = null;
+    // Place details prefetched for the current results, keyed by place id
+    let placeDetailsCache = {};
 
     // Enhanced map initialization
 function initMap() {
@@ -201,12 +203,86 @@ if (mapToggle) {
     searchInput.addEventListener('keyup', (e) => {
         if (e.key === 'Enter') {
             const query = searchInput.value.trim();
+            hideSuggestions();
             if (query) {
                 performSearch(query);
             }
+        } else if (e.key === 'Escape') {
+            hideSuggestions();
         }
     });
 
+    // Typeahead: suggest popular queries, places and neighborhoods as the user types
+    let suggestTimer = null;
+    let suggestRequest = 0;
+
+    searchInput.addEventListener('input', () => {
+        clearTimeout(suggestTimer);
+        const prefix = searchInput.value.trim();
+        if (prefix.length < 2) {
+            hideSuggestions();
+            return;
+        }
+        suggestTimer = setTimeout(() => fetchSuggestions(prefix), 120);
+    });
+
+    searchInput.addEventListener('blur', () => {
+        // Let a click on a suggestion land before the list disappears
+        setTimeout(hideSuggestions, 150);
+    });
+
+    function fetchSuggestions(prefix) {
+        const requestId = ++suggestRequest;
+        fetch(`/api/suggest?prefix=${encodeURIComponent(prefix)}&limit=8`)
+            .then(response => response.json())
+            .then(data => {
+                // Ignore answers that arrive after the user kept typing
+                if (requestId === suggestRequest) {
+                    renderSuggestions(data.suggestions || []);
+                }
+            })
+            .catch(error => console.error('Error loading suggestions:', error));
+    }
+
+    function renderSuggestions(suggestions) {
+        searchSuggestions.innerHTML = '';
+        if (suggestions.length === 0) {
+            hideSuggestions();
+            return;
+        }
+
+        suggestions.forEach(suggestion => {
+            const item = document.createElement('div');
+            item.className = 'px-4 py-2 hover:bg-gray-100 cursor-pointer flex justify-between lowercase';
+
+            const text = document.createElement('span');
+            text.textContent = suggestion.text;
+            const type = document.createElement('span');
+            type.className = 'text-xs text-gray-400';
+            type.textContent = suggestion.type === 'query' ? '' : suggestion.type;
+            item.append(text, type);
+
+            item.addEventListener('mousedown', (e) => {
+                e.preventDefault();
+                hideSuggestions();
+                if (suggestion.type === 'place') {
+                    showPlaceDetails(suggestion.id);
+                } else {
+                    searchInput.value = suggestion.text.toLowerCase();
+                    performSearch(searchInput.value);
+                }
+            });
+            searchSuggestions.appendChild(item);
+        });
+        searchSuggestions.classList.remove('hidden');
+    }
+
+    function hideSuggestions() {
+        clearTimeout(suggestTimer);
+        suggestRequest++;
+        searchSuggestions.classList.add('hidden');
+    }
+
     // Close modal when clicking the close button
     closeModal.addEventListener('click', () => {
         placeModal.classList.add('hidden');
@@ -271,43 +347,102 @@ if (mapToggle) {
             document.getElementById('location-filter-container').classList.add('hidden');
         }
 
-        // Perform search
-        fetch(`/api/search?q=${encodeURIComponent(query)}`)
-            .then(response => response.json())
-            .then(data => {
-                // Clear loading state
-                searchResults.innerHTML = '';
-                
-                // Clear existing markers
-                clearMarkers();
-                
-                if (data.results && data.results.length > 0) {
-                    const places = data.results;
-                    
-                    // Display the results
-                    places.forEach((place, index) => {
-                        const card = createPlaceCard(place);
-                        card.style.animation = `fadeIn 0.3s ease-in-out ${index * 0.05}s both`;
-                        searchResults.appendChild(card);
-                        
-                        // Add marker to map
-                        addMarker(place);
-                    });
-                    
-                    // Center map on results
-                    if (markers.length > 0 && map) {
-                        fitMapToMarkers();
-                    }
-                } else {
-                    noResults.classList.remove('hidden');
-                }
-            })
+        // Stream the search: cards render as soon as results are ranked, enrichment follows
+        const search = { places: {}, rendered: false, markersAdded: false };
+        fetch(`/api/search?q=${encodeURIComponent(query)}&stream=ndjson`)
+            .then(response => readSearchStream(response, event => handleSearchEvent(search, event)))
             .catch(error => {
                 console.error('Error performing search:', error);
-                searchResults.innerHTML = `<div class="col-span-2 text-center py-4 text-red-500">
-                    <p>An error occurred while searching. Please try again.</p>
-                </div>`;
+                if (!search.rendered) {
+                    showSearchError();
+                }
+            });
+    }
+
+    function readSearchStream(response, onEvent) {
+        // Parse a newline-delimited JSON body, handing each event over as soon as its line arrives
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        function pump() {
+            return reader.read().then(({ done, value }) => {
+                buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                const lines = buffer.split('\n');
+                buffer = done ? '' : lines.pop();
+                lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+                return done ? null : pump();
             });
+        }
+        return pump();
+    }
+
+    function handleSearchEvent(search, event) {
+        if (event.event === 'results') {
+            // Clear loading state and existing markers
+            searchResults.innerHTML = '';
+            clearMarkers();
+            search.rendered = true;
+            
+            if (event.data.length === 0) {
+                noResults.classList.remove('hidden');
+                return;
+            }
+            
+            // Load details for every result in one request, so opening a card is instant
+            placeDetailsCache = {};
+            prefetchPlaceDetails(event.data.map(place => place.id));
+            renderPlaceCards(search, event.data);
+        } else if (event.event === 'enrichment') {
+            event.data.forEach(update => {
+                if (search.places[update.id]) {
+                    Object.assign(search.places[update.id], update);
+                }
+            });
+            // Markers wait for the google IDs so they can use exact Places coordinates
+            if (event.data.some(update => 'google_id' in update)) {
+                addResultMarkers(search);
+            }
+        } else if (event.event === 'backfill') {
+            // Extra places from neighboring areas when few matched the requested neighborhood
+            prefetchPlaceDetails(event.data.map(place => place.id));
+            renderPlaceCards(search, event.data);
+            event.data.forEach(place => addMarker(place));
+        } else if (event.event === 'done' || event.event === 'error' || event.error) {
+            if (!search.rendered) {
+                showSearchError();
+            } else if (!search.markersAdded) {
+                addResultMarkers(search);
+            }
+        }
+    }
+
+    function renderPlaceCards(search, places) {
+        const offset = Object.keys(search.places).length;
+        places.forEach((place, index) => {
+            search.places[place.id] = place;
+            const card = createPlaceCard(place);
+            card.style.animation = `fadeIn 0.3s ease-in-out ${(offset + index) * 0.05}s both`;
+            searchResults.appendChild(card);
+        });
+    }
+
+    function addResultMarkers(search) {
+        if (search.markersAdded) return;
+        search.markersAdded = true;
+        
+        Object.values(search.places).forEach(place => addMarker(place));
+        
+        // Center map on results
+        if (markers.length > 0 && map) {
+            fitMapToMarkers();
+        }
+    }
+
+    function showSearchError() {
+        searchResults.innerHTML = `<div class="col-span-2 text-center py-4 text-red-500">
+            <p>An error occurred while searching. Please try again.</p>
+        </div>`;
     }
 
     // Replace the createPlaceCard function with this updated version
@@ -349,9 +484,9 @@ function createPlaceCard(place) {
         locationBadge = `<span class="ml-2 px-2 py-1 text-xs rounded-full ${badgeClass}">${status}</span>`;
     }
     
-    // Fix similarity percentage display
+    // Fix similarity percentage display; full-text matches have no similarity
     let similarityDisplay = '';
-    if (place.similarity !== undefined) {
+    if (place.similarity !== undefined && place.similarity !== null) {
         // Ensure value is between 0 and 1 for display
         let similarityValue = place.similarity;
         
@@ -563,6 +698,27 @@ function createMarker(place, position, address) {
         }
     }
 
+    function prefetchPlaceDetails(placeIds) {
+        if (placeIds.length === 0) return;
+        
+        fetch(`/api/places?ids=${placeIds.join(',')}`)
+            .then(response => response.json())
+            .then(data => {
+                (data.places || []).forEach(place => {
+                    placeDetailsCache[place.id] = place;
+                });
+            })
+            .catch(error => console.error('Error prefetching place details:', error));
+    }
+
+    function fetchPlaceDetails(placeId) {
+        // Use prefetched details when available, otherwise fall back to a single lookup
+        if (placeDetailsCache[placeId]) {
+            return Promise.resolve(placeDetailsCache[placeId]);
+        }
+        return fetch(`/api/place/${placeId}`).then(response => response.json());
+    }
+
     function showPlaceDetails(placeId) {
         // Show loading state
         modalTitle.textContent = 'Loading...';
@@ -574,8 +730,7 @@ function createMarker(place, position, address) {
         highlightMarker(placeId);
         
         // Fetch place details
-        fetch(`/api/place/${placeId}`)
-            .then(response => response.json())
+        fetchPlaceDetails(placeId)
             .then(place => {
                 modalTitle.textContent = place.name;
                 
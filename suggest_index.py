@@ -0,0 +1,258 @@
+import re
+import csv
+import time
+import heapq
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+import psycopg2
+
+from generate_embeddings import (
+    VIBE_TERMS, ESTABLISHMENT_TERMS, CUISINE_TERMS, PRICE_TERMS,
+    ACTIVITY_TERMS, TIME_TERMS, AMENITY_TERMS
+)
+from location_extraction import NEIGHBORHOOD_MAPPING
+
+logger = logging.getLogger(__name__)
+
+# Most suggestions returned for one prefix
+MAX_SUGGESTIONS = 10
+# Prefixes up to this length match many entries, so their answers are precomputed
+PRECOMPUTED_PREFIX_LENGTH = 2
+# Answers for longer prefixes are memoized per index, up to this many prefixes
+RANKED_PREFIX_CACHE_SIZE = 10000
+# Seconds before the index is rebuilt to pick up newly logged queries
+SUGGEST_INDEX_TTL = 600
+# Seconds between background checks of the data version; lookups never read it themselves
+SUGGEST_VERSION_CHECK_SECONDS = 15
+
+# Popularity weights per suggestion type; a logged query weighs its frequency
+PLACE_WEIGHT = 2.0
+NEIGHBORHOOD_WEIGHT = 3.0
+TERM_WEIGHT = 1.5
+# Matching a later word ("village" in "west village") ranks below matching the start
+INNER_WORD_FACTOR = 0.5
+
+# A logged query becomes a suggestion only once this many searches used it, so one
+# user's query is never shown to others and repeating a search can't inject one
+MIN_QUERY_COUNT = 5
+# Logged queries outside this length, or with other characters, are never suggested
+MAX_QUERY_SUGGESTION_LENGTH = 60
+QUERY_SUGGESTION_PATTERN = re.compile(r"^[^\W\d_][\w '&-]{1,%d}$" % (MAX_QUERY_SUGGESTION_LENGTH - 1))
+
+# Words that don't start an inner-word match
+SUGGEST_STOPWORDS = {'a', 'an', 'the', 'in', 'on', 'at', 'to', 'for', 'of', 'and', 'with', 'near', 'by'}
+
+def normalize_suggestion(text):
+    """Lowercase and collapse punctuation and whitespace, so 'Café  Mogador!' matches 'café mogador'"""
+    return " ".join(re.findall(r"[\w'&]+", (text or "").lower()))
+
+class SuggestIndex:
+    """
+    Sorted array of suggestion keys with popularity weights.
+    
+    A prefix lookup is a binary search for the range of keys starting with the
+    prefix, followed by picking the heaviest entries in that range. Every
+    multi-word entry is also indexed from each later word, so 'village'
+    suggests 'west village', and aliases index the entry they stand for.
+    """
+    
+    def __init__(self, entries, aliases=None):
+        """
+        Args:
+            entries: Iterable of (text, type, weight, place id or None)
+            aliases: Dict of alias -> entry text ('les' -> 'Lower East Side')
+        """
+        best = {}
+        for text, kind, weight, place_id in entries:
+            key = normalize_suggestion(text)
+            if not key:
+                continue
+            # The same text from several sources (a term that is also a popular query) is one suggestion
+            identity = (key, place_id)
+            if identity not in best or best[identity][2] < weight:
+                best[identity] = (text, kind, weight, place_id)
+        
+        self.suggestions = list(best.values())
+        rows = []
+        for index, (text, _, weight, _) in enumerate(self.suggestions):
+            words = normalize_suggestion(text).split()
+            rows.append((" ".join(words), -weight, index))
+            for position in range(1, len(words)):
+                if words[position] not in SUGGEST_STOPWORDS:
+                    rows.append((" ".join(words[position:]), -weight * INNER_WORD_FACTOR, index))
+        
+        indexes = {normalize_suggestion(text): index for index, (text, _, _, place_id) in enumerate(self.suggestions)
+                   if place_id is None}
+        for alias, text in (aliases or {}).items():
+            key, index = normalize_suggestion(alias), indexes.get(normalize_suggestion(text))
+            if key and index is not None and key != normalize_suggestion(text):
+                rows.append((key, -self.suggestions[index][2] * INNER_WORD_FACTOR, index))
+        rows.sort()
+        
+        self.keys = [row[0] for row in rows]
+        self.weights = [-row[1] for row in rows]
+        self.targets = [row[2] for row in rows]
+        
+        # Short prefixes cover large ranges; answer them from a table instead
+        self.precomputed = {}
+        for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1):
+            for prefix in {key[:length] for key in self.keys if len(key) >= length}:
+                self.precomputed[prefix] = self._rank(prefix, MAX_SUGGESTIONS)
+        # The index never changes once built, so longer prefixes are ranked once and remembered
+        self._ranked = {}
+    
+    def __len__(self):
+        return len(self.suggestions)
+    
+    def _rank(self, prefix, limit):
+        """Indexes of the heaviest distinct suggestions whose keys start with prefix"""
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + "\uffff", lo)
+        # Several keys can point at one suggestion (inner words, aliases), so take a few
+        # more than limit and widen only if duplicates left the page short
+        count = limit * 2
+        while True:
+            ranked, seen = [], set()
+            candidates = heapq.nsmallest(count, range(lo, hi), key=lambda i: (-self.weights[i], i))
+            for position in candidates:
+                target = self.targets[position]
+                if target not in seen:
+                    seen.add(target)
+                    ranked.append(target)
+                    if len(ranked) == limit:
+                        return ranked
+            if len(candidates) < count:
+                return ranked
+            count *= 4
+    
+    def lookup(self, prefix, limit=MAX_SUGGESTIONS):
+        """
+        Suggestions for a typed prefix, most popular first.
+        
+        Returns:
+            List of dicts with text, type and (for places) id
+        """
+        prefix = normalize_suggestion(prefix)
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        if not prefix:
+            return []
+        
+        ranked = self.precomputed.get(prefix)
+        if ranked is None:
+            ranked = self._ranked.get(prefix)
+        if ranked is None:
+            ranked = self._rank(prefix, MAX_SUGGESTIONS)
+            if len(self._ranked) >= RANKED_PREFIX_CACHE_SIZE:
+                self._ranked.clear()
+            self._ranked[prefix] = ranked
+        ranked = ranked[:limit]
+        
+        suggestions = []
+        for index in ranked:
+            text, kind, _, place_id = self.suggestions[index]
+            suggestion = {"text": text, "type": kind}
+            if place_id is not None:
+                suggestion["id"] = place_id
+            suggestions.append(suggestion)
+        return suggestions
+
+def vocabulary_entries():
+    """Neighborhoods and the query-expansion vocabularies as suggestion entries"""
+    for neighborhood in set(NEIGHBORHOOD_MAPPING.values()):
+        yield neighborhood, "neighborhood", NEIGHBORHOOD_WEIGHT, None
+    
+    for terms in (VIBE_TERMS, ESTABLISHMENT_TERMS, CUISINE_TERMS, PRICE_TERMS,
+                  ACTIVITY_TERMS, TIME_TERMS, AMENITY_TERMS):
+        for term, synonyms in terms.items():
+            yield term, "term", TERM_WEIGHT, None
+            for synonym in synonyms:
+                yield synonym, "term", TERM_WEIGHT * INNER_WORD_FACTOR, None
+
+def is_suggestible_query(query):
+    """
+    Whether a logged query looks like a plain search: starts with a letter, only
+    letters, digits, spaces and ' & -, and no digit runs (phone numbers, addresses)
+    """
+    return bool(QUERY_SUGGESTION_PATTERN.match(query)) and not re.search(r"\d{3}", query)
+
+def query_log_counts(path):
+    """Logged queries and how often each was searched"""
+    counts = Counter()
+    try:
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                if row and row[0] != 'query' and row[0].strip():
+                    counts[row[0].strip()] += 1
+    except OSError as e:
+        logger.warning(f"Could not read query log {path}: {str(e)}")
+    return counts
+
+def build_suggest_index(db_config, query_log):
+    """Build a SuggestIndex from place names, the vocabularies and the query log"""
+    entries = list(vocabulary_entries())
+    entries.extend(
+        (query, "query", float(count), None) for query, count in query_log_counts(query_log).items()
+        if count >= MIN_QUERY_COUNT and is_suggestible_query(query)
+    )
+    
+    conn = None
+    try:
+        conn = psycopg2.connect(**db_config)
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, name FROM places WHERE name IS NOT NULL")
+            entries.extend((name, "place", PLACE_WEIGHT, place_id) for place_id, name in cur.fetchall())
+    except Exception as e:
+        logger.error(f"Error loading place names for suggestions: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+    
+    # Typing an alias ('les', 'bk') suggests the neighborhood it stands for
+    return SuggestIndex(entries, aliases=NEIGHBORHOOD_MAPPING)
+
+class SuggestService:
+    """
+    Holds the current SuggestIndex and rebuilds it when the data version
+    changes or SUGGEST_INDEX_TTL has passed. Lookups never wait on a rebuild
+    or a data version query once an index exists: every
+    SUGGEST_VERSION_CHECK_SECONDS a lookup starts a background check, and
+    the stale index answers until the new one is swapped in.
+    """
+    
+    def __init__(self, db_config, data_version, query_log='corner_recent_queries.csv', ttl=SUGGEST_INDEX_TTL):
+        self.db_config = db_config
+        self.data_version = data_version
+        self.query_log = query_log
+        self.ttl = ttl
+        self.index = None
+        self._version = None
+        self._built = 0.0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+    
+    def _stale(self):
+        return (self.index is None or time.monotonic() - self._built > self.ttl
+                or self.data_version.get() != self._version)
+    
+    def _rebuild(self):
+        with self._lock:
+            self._checked = time.monotonic()
+            if not self._stale():
+                return
+            version = self.data_version.get()
+            start = time.perf_counter()
+            self.index = build_suggest_index(self.db_config, self.query_log)
+            self._version, self._built = version, time.monotonic()
+            logger.info(f"Built suggestion index with {len(self.index)} entries in {time.perf_counter() - start:.2f}s")
+    
+    def lookup(self, prefix, limit=MAX_SUGGESTIONS):
+        if self.index is None:
+            self._rebuild()
+        elif time.monotonic() - self._checked > SUGGEST_VERSION_CHECK_SECONDS and not self._lock.locked():
+            # Claim the check before starting the thread so concurrent lookups don't start another
+            self._checked = time.monotonic()
+            threading.Thread(target=self._rebuild, name="suggest-rebuild", daemon=True).start()
+        return self.index.lookup(prefix, limit)
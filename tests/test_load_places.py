@@ -0,0 +1,46 @@
+import io
+import json
+import random
+
+import pytest
+
+from load_places import iter_json_array
+
+CASES = [
+    "[]",
+    "[2.5]",
+    "[1, -2, 3.25e-4, 1E+10, 0]",
+    '[true, false, null, "a,b]", "\\u00e9\\"", {"a": [1, {"b": null}]}, []]',
+    ' [ {"id": 1, "reviews": [{"text": "great, really"}]} ,\n {"id": 2} ] ',
+]
+
+def random_value(rng, depth=0):
+    kinds = ["int", "float", "string", "literal"] + (["list", "dict"] if depth < 3 else [])
+    kind = rng.choice(kinds)
+    if kind == "int":
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == "float":
+        return rng.uniform(-1e6, 1e6) * 10 ** rng.randint(-8, 8)
+    if kind == "string":
+        return "".join(rng.choice('ab ,]}"\\é') for _ in range(rng.randint(0, 8)))
+    if kind == "literal":
+        return rng.choice([True, False, None])
+    if kind == "list":
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {f"k{i}": random_value(rng, depth + 1) for i in range(rng.randint(0, 4))}
+
+def test_items_match_json_loads_at_every_chunk_size():
+    rng = random.Random(50)
+    documents = CASES + [
+        json.dumps([random_value(rng) for _ in range(rng.randint(0, 12))], indent=rng.choice([None, 1]))
+        for _ in range(40)
+    ]
+    for document in documents:
+        for chunk_size in range(1, 12):
+            items = list(iter_json_array(io.StringIO(document), chunk_size=chunk_size))
+            assert items == json.loads(document), (document, chunk_size)
+
+@pytest.mark.parametrize("document", ["{}", "[1 2]", "[1,", "[2.5"])
+def test_invalid_arrays_are_rejected(document):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(document), chunk_size=1))
@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+from search_cursor import (
+    InvalidCursor, decode_cursor, encode_cursor, keyset_condition, keyset_page, validate_cursor_state
+)
+
+# Many places sharing a score, so page boundaries fall inside runs of ties
+TIED_SCORES = [(place_id, [0.9, 0.75, 0.75, 0.5][place_id % 4]) for place_id in range(1, 38)]
+
+def page_through(fetch_page, limit):
+    """Follow cursors from the first page to the last, collecting every id shown"""
+    shown = []
+    state = {}
+    while True:
+        page = fetch_page(state.get("score"), state.get("i"), limit)
+        shown.extend(place_id for place_id, _ in page)
+        if len(page) < limit:
+            return shown
+        last_id, last_score = page[-1]
+        # Round trip through the token, as clients do
+        state = decode_cursor(encode_cursor({"leg": "vector", "score": last_score, "i": last_id, "n": 0}))
+
+def test_keyset_page_returns_tied_results_exactly_once():
+    for limit in (1, 2, 3, 5, 10):
+        shown = page_through(lambda score, last_id, limit: keyset_page(TIED_SCORES, limit, score, last_id), limit)
+        assert sorted(shown) == [place_id for place_id, _ in TIED_SCORES]
+        assert len(shown) == len(set(shown))
+
+def test_keyset_condition_returns_tied_results_exactly_once():
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE places (id INTEGER PRIMARY KEY, score REAL)")
+    db.executemany("INSERT INTO places VALUES (?, ?)", TIED_SCORES)
+    
+    def fetch_page(score, last_id, limit):
+        where, params = "", []
+        if score is not None:
+            condition, params = keyset_condition([("score", [], score)], "id", last_id)
+            where = " WHERE " + condition
+        query = f"SELECT id, score FROM places{where} ORDER BY score DESC, id LIMIT ?"
+        return db.execute(query.replace("%s", "?"), params + [limit]).fetchall()
+    
+    for limit in (1, 3, 4, 7):
+        shown = page_through(fetch_page, limit)
+        assert sorted(shown) == [place_id for place_id, _ in TIED_SCORES]
+        assert len(shown) == len(set(shown))
+
+def test_keyset_condition_orders_on_every_key():
+    rows = [(1, 1.0, 0.9), (2, 1.0, 0.95), (3, 1.0, 0.9), (4, 0.8, 0.8)]
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE places (id INTEGER PRIMARY KEY, boosted REAL, similarity REAL)")
+    db.executemany("INSERT INTO places VALUES (?, ?, ?)", rows)
+    
+    # After place 1 (boosted 1.0, similarity 0.9): place 3 ties on both scores, place 4 scores lower
+    condition, params = keyset_condition([("boosted", [], 1.0), ("similarity", [], 0.9)], "id", 1)
+    found = db.execute(
+        f"SELECT id FROM places WHERE {condition} ORDER BY boosted DESC, similarity DESC, id".replace("%s", "?"),
+        params
+    ).fetchall()
+    assert [place_id for place_id, in found] == [3, 4]
+
+def test_cursor_without_id_keeps_ties():
+    assert keyset_page(TIED_SCORES, 100, 0.75, exclude={2}) == [
+        pair for pair in sorted(TIED_SCORES, key=lambda pair: (-pair[1], pair[0]))
+        if pair[1] <= 0.75 and pair[0] != 2
+    ]
+
+def test_cursor_position_is_validated():
+    validate_cursor_state({"leg": "vector", "score": 0.5, "r": 0.4, "i": 3, "n": 10})
+    for field, value in (("i", "3"), ("i", True), ("r", "0.4")):
+        with pytest.raises(InvalidCursor):
+            validate_cursor_state({"leg": "vector", "score": 0.5, "i": 3, "n": 10, field: value})
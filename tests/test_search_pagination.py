@@ -0,0 +1,127 @@
+import random
+
+from generate_embeddings import EmbeddingGenerator
+from search_cursor import decode_cursor
+from semantic_cache import SemanticCache
+
+def make_generator():
+    # Pagination only needs the ranking methods, not a database or OpenAI client
+    generator = EmbeddingGenerator.__new__(EmbeddingGenerator)
+    generator._change_seq = 0
+    return generator
+
+class TiedSnapshot:
+    """Snapshot whose scores are mostly ties, returned in no particular order within a tie"""
+    
+    def __init__(self, scores):
+        self.scores = scores
+    
+    def search(self, embedding, limit=10):
+        ranked = list(self.scores.items())
+        random.shuffle(ranked)
+        ranked.sort(key=lambda pair: -pair[1])
+        return ranked[:limit]
+
+class RowsCursor:
+    """DB cursor serving search_places rows by id, as the snapshot path reads them"""
+    
+    def execute(self, query, params):
+        self.ids = params[0] if "ANY" in query else []
+    
+    def fetchall(self):
+        return [(place_id, "Place", "SoHo", [], "$$", "", None, {}) for place_id in self.ids]
+
+def test_snapshot_pages_return_tied_results_exactly_once():
+    random.seed(7)
+    scores = {place_id: random.choice([0.9, 0.8, 0.8, 0.7]) for place_id in range(1, 60)}
+    generator = make_generator()
+    generator.snapshot = TiedSnapshot(scores)
+    
+    for limit in (1, 3, 7, 10):
+        shown = []
+        page = {}
+        while True:
+            rows = generator._fetch_ranked_places(RowsCursor(), [1.0], limit, **page)
+            shown.extend(row[0] for row in rows)
+            cursor = generator._page_cursor("f", rows, limit, "vector", offset=page.get("offset", 0))
+            if cursor is None:
+                break
+            state = decode_cursor(cursor)
+            page = dict(after_score=state["score"], after_id=state["i"], exclude_ids=state["x"], offset=state["n"])
+        
+        assert sorted(shown) == sorted(scores)
+        assert len(shown) == len(set(shown))
+
+class StubConnection:
+    def rollback(self):
+        pass
+    
+    def close(self):
+        pass
+
+class StubCursor:
+    def execute(self, query, params=None):
+        pass
+    
+    def fetchall(self):
+        return []
+    
+    def close(self):
+        pass
+
+def ranked_row(place_id, neighborhood, similarity):
+    return (place_id, "Place", neighborhood, [], "$$", "", None, {}, similarity, similarity)
+
+def test_streamed_cursor_with_backfill_is_accepted(monkeypatch):
+    limit = 5
+    results = [ranked_row(place_id, "Tribeca", 0.9 - place_id / 100) for place_id in range(1, limit + 1)]
+    backfill = [ranked_row(place_id, "SoHo", 0.7) for place_id in (11, 12)]
+    
+    generator = make_generator()
+    generator.has_pgvector = True
+    monkeypatch.setattr(generator, "parse_query", lambda query: {"location": "Tribeca"})
+    monkeypatch.setattr(generator, "_search_filters", lambda *args, **kwargs: ([], [], "f", None))
+    monkeypatch.setattr(generator, "expand_query", lambda parsed_query: "expanded")
+    monkeypatch.setattr(generator, "embed_query", lambda text, stage_name: ([1.0], "key") if text == "expanded" else (None, None))
+    monkeypatch.setattr(generator, "_connect_db", lambda: (StubConnection(), StubCursor()))
+    monkeypatch.setattr(generator, "_retrieve_ranked_places", lambda *args: (results, results, "key"))
+    monkeypatch.setattr(generator, "_adjacent_backfill", lambda *args: backfill)
+    
+    events = dict(generator.stream_search_places("bars in tribeca", limit=limit))
+    state = decode_cursor(events["done"]["next_cursor"])
+    
+    assert set(state["x"]) == {row[0] for row in results + backfill}
+    assert state["n"] == len(results) + len(backfill)
+
+def test_streamed_search_shares_the_semantic_cache(monkeypatch):
+    results = [ranked_row(place_id, "Tribeca", 0.9) for place_id in range(1, 4)]
+    ranked_calls = []
+    
+    generator = make_generator()
+    generator.has_pgvector = True
+    generator.semantic_cache = SemanticCache()
+    monkeypatch.setattr(generator, "cache_version", lambda: "v1")
+    monkeypatch.setattr(generator, "parse_query", lambda query: {"location": None})
+    monkeypatch.setattr(generator, "_search_filters", lambda *args, **kwargs: ([], [], "f", None))
+    monkeypatch.setattr(generator, "expand_query", lambda parsed_query: "expanded")
+    monkeypatch.setattr(generator, "embed_query", lambda text, stage_name: ([1.0, 0.0], "key") if text == "expanded" else (None, None))
+    monkeypatch.setattr(generator, "_connect_db", lambda: (StubConnection(), StubCursor()))
+    monkeypatch.setattr(generator, "_fetch_ranked_places", lambda *args, **kwargs: ranked_calls.append(args) or results)
+    
+    for _ in range(2):
+        events = dict(generator.stream_search_places("coffee", limit=10))
+        assert [row[0] for row in events["results"]] == [1, 2, 3]
+    assert len(ranked_calls) == 1
+
+def test_lexical_cursor_continues_from_text_rank():
+    # Full-text rows ranked without an embedding: no similarity, text rank last
+    rows = [
+        (place_id, "Place", "SoHo", [], "$$", "", None, {}, None, None, 0.5 - place_id / 100)
+        for place_id in range(1, 4)
+    ]
+    generator = make_generator()
+    
+    state = decode_cursor(generator._page_cursor("f", rows, 3, "lexical"))
+    
+    assert (state["score"], state["i"]) == (rows[-1][10], 3)
+    assert [result[6] for result in generator._format_search_results(rows)] == [None, None, None]
@@ -0,0 +1,50 @@
+import threading
+from collections import OrderedDict
+
+from generate_embeddings import EmbeddingGenerator
+from semantic_cache import SemanticCache
+from warmup import warm_search_caches
+
+class StubConnection:
+    def rollback(self):
+        pass
+    
+    def close(self):
+        pass
+
+class StubCursor:
+    def execute(self, query, params=None):
+        pass
+    
+    def fetchall(self):
+        return []
+    
+    def close(self):
+        pass
+
+def test_warmed_ranking_serves_streamed_searches(monkeypatch):
+    results = [
+        (place_id, "Place", "SoHo", [], "$$", "", None, {}, 0.9, 0.9) for place_id in range(1, 4)
+    ]
+    ranked_calls = []
+    
+    generator = EmbeddingGenerator.__new__(EmbeddingGenerator)
+    generator.has_pgvector = True
+    generator._change_seq = 0
+    generator.search_results = OrderedDict()
+    generator._search_results_lock = threading.Lock()
+    generator.semantic_cache = SemanticCache()
+    monkeypatch.setattr(generator, "cache_version", lambda: "v1")
+    monkeypatch.setattr(generator, "parse_query", lambda query: {"location": None})
+    monkeypatch.setattr(generator, "_search_filters", lambda *args, **kwargs: ([], [], "f", None))
+    monkeypatch.setattr(generator, "expand_query", lambda parsed_query: "expanded")
+    monkeypatch.setattr(generator, "embed_queries", lambda texts: len(texts))
+    monkeypatch.setattr(generator, "embed_query", lambda text, stage_name: ([1.0, 0.0], "key") if text == "expanded" else (None, None))
+    monkeypatch.setattr(generator, "_connect_db", lambda: (StubConnection(), StubCursor()))
+    monkeypatch.setattr(generator, "_fetch_ranked_places", lambda *args, **kwargs: ranked_calls.append(args) or results)
+    
+    assert warm_search_caches(generator, ["coffee"])["pages"] == 1
+    events = dict(generator.stream_search_places("coffee"))
+    
+    assert [row[0] for row in events["results"]] == [1, 2, 3]
+    assert len(ranked_calls) == 1
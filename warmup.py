@@ -0,0 +1,113 @@
+"""
+Warm the search caches with the most popular logged queries.
+
+Aggregates corner_recent_queries.csv by frequency, embeds the top queries in
+batches (one embeddings request per batch) and runs their first result page,
+so the query embedding and result caches are hot before users arrive. The
+app runs this in the background at startup when WARMUP_QUERIES is set.
+
+Usage:
+    WARMUP_QUERIES=300 gunicorn app:app    # warm each worker at startup
+    python warmup.py --top 300             # list the top queries and time a warmup locally
+"""
+import os
+import csv
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+
+from logging_setup import sample_diagnostics
+
+logger = logging.getLogger(__name__)
+
+QUERY_LOG = 'corner_recent_queries.csv'
+DEFAULT_WARMUP_QUERIES = 300
+
+def top_queries(path=QUERY_LOG, n=DEFAULT_WARMUP_QUERIES):
+    """The n most frequent queries in the query log, most frequent first"""
+    counts = Counter()
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0] == 'query':
+                continue
+            query = row[0].strip()
+            if query:
+                counts[query] += 1
+    return [query for query, _ in counts.most_common(n)]
+
+def warm_search_caches(generator, queries, limit=10, mode='vector'):
+    """
+    Pre-populate the generator's query embedding and result caches.
+    
+    Both texts a search embeds (the query as typed and its expansion) are
+    embedded in batches first, so running the searches afterwards only costs
+    the database queries.
+    
+    Returns:
+        dict: Counts of queries, embedded texts and warmed result pages, and elapsed seconds
+    """
+    start = time.perf_counter()
+    
+    texts = []
+    for query in queries:
+        texts.append(query)
+        texts.append(generator.expand_query(generator.parse_query(query)))
+    embedded = generator.embed_queries(texts)
+    
+    # Warmup searches shouldn't flood the log with sampled breakdowns
+    sample_diagnostics(0)
+    pages = 0
+    for query in queries:
+        try:
+            results, _ = generator.search_places_page(query, limit=limit, mode=mode)
+            pages += bool(results)
+        except Exception as e:
+            logger.warning(f"Warmup search for '{query}' failed: {str(e)}")
+    
+    summary = {
+        "queries": len(queries),
+        "embedded": embedded,
+        "pages": pages,
+        "seconds": round(time.perf_counter() - start, 2)
+    }
+    logger.info(f"Warmed search caches: {summary}")
+    return summary
+
+def start_warmup(generator, n=None, limit=10, mode=None):
+    """
+    Warm the caches in a background thread if WARMUP_QUERIES (or n) is positive.
+    
+    Returns:
+        The started thread, or None if warmup is disabled
+    """
+    n = int(os.environ.get("WARMUP_QUERIES", 0)) if n is None else n
+    if n <= 0:
+        return None
+    mode = mode or os.environ.get("SEARCH_MODE", "vector")
+    
+    def run():
+        try:
+            warm_search_caches(generator, top_queries(QUERY_LOG, n), limit=limit, mode=mode)
+        except Exception as e:
+            logger.error(f"Cache warmup failed: {str(e)}")
+    
+    thread = threading.Thread(target=run, name="cache-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm the search caches with the most popular logged queries")
+    parser.add_argument('--top', type=int, default=DEFAULT_WARMUP_QUERIES, help="Number of queries to warm")
+    parser.add_argument('--limit', type=int, default=10, help="Results per warmed page")
+    parser.add_argument('--mode', default=os.environ.get("SEARCH_MODE", "vector"))
+    args = parser.parse_args()
+    
+    from app import embedding_generator
+    queries = top_queries(QUERY_LOG, args.top)
+    print(f"Top {len(queries)} queries: {', '.join(queries[:10])}{', ...' if len(queries) > 10 else ''}")
+    print(warm_search_caches(embedding_generator, queries, limit=args.limit, mode=args.mode))
+
+if __name__ == "__main__":
+    main()